@@ -0,0 +1,80 @@
+"""Selling every combination of a draw: list.pop(i) vs TicketAllocator
+
+Also times starting a new pool, the cost every Raffle() and new draw pays:
+copying the list of all combinations vs a lazy TicketAllocator, and the
+memory held by 1000 fresh pools.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_allocation
+"""
+import argparse
+import itertools
+import random
+import timeit
+import tracemalloc
+
+from raffle import RaffleRNG, TicketAllocator, generate_available_tickets
+
+
+def sell_with_list_pop():
+    """The allocation loop of the original Raffle.get_ticket"""
+    available_tickets = list(itertools.combinations(range(1, 16), 5))
+    while available_tickets:
+        i = random.randrange(0, len(available_tickets))
+        set(available_tickets.pop(i))
+
+
+def sell_with_draw():
+    allocator = TicketAllocator()
+    while len(allocator):
+        allocator.draw()
+
+
+def sell_with_allocate():
+    allocator = TicketAllocator()
+    allocator.allocate(len(allocator))
+
+
+def new_pool_list():
+    """The pool the original Raffle built on construction and on every new draw"""
+    return list(itertools.combinations(range(1, 16), 5))
+
+
+def pool_memory(new_pool, num_pools: int = 1000) -> int:
+    """Bytes held by num_pools fresh pools"""
+    tracemalloc.start()
+    pools = [new_pool() for _ in range(num_pools)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del pools
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    for label, func in (
+        ('list.pop(i)', sell_with_list_pop),
+        ('draw()', sell_with_draw),
+        ('allocate(n)', sell_with_allocate),
+    ):
+        seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{label:>12}: {seconds * 1000:7.2f} ms per draw")
+
+    print()
+    rng = RaffleRNG(0)
+    for label, new_pool in (
+        ('list', new_pool_list),
+        ('array copy', generate_available_tickets),
+        ('lazy', lambda: TicketAllocator(rng=rng)),
+    ):
+        seconds = min(timeit.repeat(new_pool, number=100, repeat=args.repeat)) / 100
+        size = pool_memory(new_pool)
+        print(f"{label:>12}: {seconds * 1e6:9.2f} us per new pool, {size / 1000:10.0f} bytes per pool")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Memory and settlement throughput of many live draws in one process
+
+For a growing number of draws, each selling a few tickets to a few owners,
+compares a plain Raffle per draw with a DrawManager keeping every draw
+live and one keeping a tenth of them live and evicting the others. Each
+configuration runs in a fresh process, which reports its RSS once the
+draws are sold and the draws/sec of settling them all: one
+handle_run_raffle() per Raffle, one run_scheduled() for a manager.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_draws
+    $ python3 -m benchmarks.bench_draws --draws 1000 10000 --owners 20
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from draws import DrawManager
+from raffle import NullSink, Raffle, State
+
+
+MODES = ('raffles', 'manager', 'evicting')
+
+
+def get_rss_mib() -> float:
+    """Peak RSS of this process, which only grows while the draws are built"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def run_worker(mode: str, num_draws: int, num_owners: int, num_tickets: int) -> dict:
+    start_rss = get_rss_mib()
+    sink = NullSink()
+    with tempfile.TemporaryDirectory() as directory:
+        if mode == 'raffles':
+            raffles = [Raffle(state=State.ONGOING, sink=sink, rng=i) for i in range(num_draws)]
+            for raffle in raffles:
+                for j in range(num_owners):
+                    raffle.purchase(f'user{j}', num_tickets)
+        else:
+            max_live = num_draws if mode == 'manager' else max(num_draws // 10, 1)
+            manager = DrawManager(directory, max_live=max_live, rng=0, sink=sink)
+            for i in range(num_draws):
+                manager.handle_command({'draw': f'draw{i}', 'op': 'new_draw'})
+                for j in range(num_owners):
+                    manager.handle_command({'draw': f'draw{i}', 'op': 'buy', 'name': f'user{j}', 'num_tickets': num_tickets})
+        rss = get_rss_mib() - start_rss
+
+        start = time.perf_counter()
+        if mode == 'raffles':
+            for raffle in raffles:
+                raffle.handle_run_raffle()
+        else:
+            for i in range(num_draws):
+                manager.schedule_run(f'draw{i}')
+            manager.run_scheduled()
+        seconds = time.perf_counter() - start
+    return {'rss_mib': rss, 'draws_per_sec': num_draws / seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--draws', type=int, nargs='+', default=[100, 1_000, 10_000, 50_000])
+    parser.add_argument('--owners', type=int, default=10, help="owners per draw")
+    parser.add_argument('--tickets', type=int, default=5, help="tickets per owner")
+    parser.add_argument('--worker', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        mode, num_draws = args.worker
+        print(json.dumps(run_worker(mode, int(num_draws), args.owners, args.tickets)))
+        return
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for num_draws in args.draws:
+        line = f"{num_draws:>7} draws:"
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_draws', '--worker', mode, str(num_draws),
+                 '--owners', str(args.owners), '--tickets', str(args.tickets)],
+                cwd=root, capture_output=True, text=True, check=True,
+            ).stdout
+            report = json.loads(output)
+            line += f" {mode} {report['rss_mib']:7.1f} MiB {report['draws_per_sec']:7.0f} draws/sec,"
+        print(line.rstrip(','))
+
+
+if __name__ == '__main__':
+    main()
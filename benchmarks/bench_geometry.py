@@ -0,0 +1,67 @@
+"""Memory and speed of draws of different game geometries as tickets get sold
+
+Memory is measured for a whole Raffle (available tickets, sold tickets and
+owner names) and grows with the number of tickets sold, not with the number
+of combinations of the game.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_geometry
+"""
+import argparse
+import time
+import tracemalloc
+
+from raffle import Game, NullSink, Raffle, RaffleRNG, State
+
+
+GAMES = [
+    (Game(15, 5), {2: .1, 3: .15, 4: .25, 5: .5}),
+    (Game(49, 6), {3: .1, 4: .15, 5: .25, 6: .5}),
+    (Game(80, 10), {7: .1, 8: .15, 9: .25, 10: .5}),
+]
+
+
+def sell(raffle: Raffle, num_tickets: int, tickets_per_owner: int) -> None:
+    for i in range(0, num_tickets, tickets_per_owner):
+        name = f'owner{i}'
+        raffle.assign_tickets(name, raffle.allocate_tickets(name, min(tickets_per_owner, num_tickets - i)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[0, 1_000, 10_000, 100_000])
+    parser.add_argument('--tickets-per-owner', type=int, default=10)
+    args = parser.parse_args()
+
+    for game, reward_percentages in GAMES:
+        print(f"{game.num_numbers}-pick-{game.pick} ({game.num_tickets} combinations)")
+        for num_tickets in sorted({min(num_tickets, game.num_tickets) for num_tickets in args.sizes}):
+            def new_raffle():
+                raffle = Raffle(
+                    state=State.ONGOING, game=game, reward_percentages=reward_percentages,
+                    sink=NullSink(), rng=RaffleRNG(0),
+                )
+                sell(raffle, num_tickets, args.tickets_per_owner)
+                return raffle
+
+            tracemalloc.start()
+            raffle = new_raffle()
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del raffle
+            start = time.perf_counter()
+            raffle = new_raffle()
+            seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            raffle.settle(raffle.get_winning_ticket())
+            settle = time.perf_counter() - start
+            per_ticket = f"{size / num_tickets:6.0f}" if num_tickets else "     -"
+            print(
+                f"{num_tickets:>9} tickets: {size / 1024:9.1f} KiB ({per_ticket} bytes/ticket), "
+                f"sell {seconds * 1000:8.1f} ms, settle {settle * 1000:8.1f} ms"
+            )
+
+
+if __name__ == '__main__':
+    main()
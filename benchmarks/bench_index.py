@@ -0,0 +1,36 @@
+"""Settlement of duplicate-heavy draws: scanning every ticket vs the prize-tier index
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_index
+"""
+import argparse
+import random
+import time
+
+from raffle import count_matches, encode_ticket, group_matches
+from benchmarks.bench_settlement import best_of, build_store
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000, 3_000_000])
+    parser.add_argument('--owners', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    winning_mask = encode_ticket({3, 7, 8, 11, 12})
+    for num_tickets in args.sizes:
+        start = time.perf_counter()
+        store = build_store(num_tickets, args.owners, random.Random(0), indexed=True)
+        build = time.perf_counter() - start
+        scan = best_of(lambda: group_matches(count_matches(store.masks, store.owners, winning_mask), 2), args.repeat)
+        index = best_of(lambda: store.count_winners(winning_mask, 2), args.repeat)
+        print(
+            f"{num_tickets:>9} tickets: build {build * 1000:8.1f} ms, "
+            f"scan {scan * 1000:8.1f} ms, index {index * 1000:8.1f} ms ({scan / index:5.1f}x)"
+        )
+
+
+if __name__ == '__main__':
+    main()
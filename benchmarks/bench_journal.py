@@ -0,0 +1,47 @@
+"""Purchase throughput with journaling at different group-commit intervals
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_journal
+"""
+import argparse
+import tempfile
+import time
+
+from raffle import Raffle
+from journal import JournaledRaffle
+
+
+def purchase(raffle: Raffle, num_purchases: int, tickets_per_purchase: int) -> float:
+    """Make num_purchases purchases, starting a new draw whenever one sells out, and return purchases/sec"""
+    raffle.start_draw()
+    start = time.perf_counter()
+    for i in range(num_purchases):
+        if len(raffle.available_tickets) < tickets_per_purchase:
+            raffle.settle({1, 2, 3, 4, 5})
+            raffle.start_draw()
+        name = f'user{i}'
+        raffle.assign_tickets(name, raffle.allocate_tickets(name, tickets_per_purchase))
+    return num_purchases / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--purchases', type=int, default=20_000)
+    parser.add_argument('--tickets', type=int, default=3, help="tickets per purchase")
+    parser.add_argument('--group-commits', type=int, nargs='+', default=[1, 10, 100, 1000, 0])
+    args = parser.parse_args()
+
+    rate = purchase(Raffle(), args.purchases, args.tickets)
+    print(f"{'no journal':>16}: {rate:10.0f} purchases/sec")
+    for group_commit in args.group_commits:
+        with tempfile.TemporaryDirectory() as directory:
+            raffle = JournaledRaffle(directory, group_commit=group_commit)
+            rate = purchase(raffle, args.purchases, args.tickets)
+            raffle.close()
+        label = f"fsync every {group_commit}" if group_commit else "no fsync"
+        print(f"{label:>16}: {rate:10.0f} purchases/sec")
+
+
+if __name__ == '__main__':
+    main()
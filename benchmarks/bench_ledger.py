@@ -0,0 +1,73 @@
+"""Purchases and settlement with and without the SQLite ledger, at 1M tickets
+
+Sells the tickets of a 49-pick-6 draw to owners buying 10 tickets each,
+in memory (Raffle) and recorded in a ledger (LedgerRaffle) at different
+batch sizes, then settles the draw in Python and in SQL.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_ledger
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from ledger import LedgerRaffle
+from raffle import Game, NullSink, Raffle, RaffleRNG, State
+
+
+GAME = Game(49, 6)
+REWARD_PERCENTAGES = {3: .1, 4: .15, 5: .25, 6: .5}
+WINNING_TICKET = {1, 5, 9, 17, 23, 38}
+
+
+def sell(raffle: Raffle, num_tickets: int, tickets_per_purchase: int) -> float:
+    """Purchases per second of selling num_tickets tickets"""
+    num_purchases = num_tickets // tickets_per_purchase
+    start = time.perf_counter()
+    for i in range(num_purchases):
+        raffle.purchase(f'owner{i}', tickets_per_purchase)
+    if isinstance(raffle, LedgerRaffle):
+        raffle.ledger.flush()
+    return num_purchases / (time.perf_counter() - start)
+
+
+def settle(raffle: Raffle) -> float:
+    """Seconds it takes to settle the draw, without writing the results"""
+    start = time.perf_counter()
+    results, _ = raffle.get_group_results(raffle.get_groups(raffle.tickets, WINNING_TICKET))
+    seconds = time.perf_counter() - start
+    return seconds, dict(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=1_000_000)
+    parser.add_argument('--tickets-per-purchase', type=int, default=10)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1_000, 100_000])
+    args = parser.parse_args()
+
+    kwargs = dict(state=State.ONGOING, game=GAME, reward_percentages=REWARD_PERCENTAGES, sink=NullSink())
+    raffle = Raffle(rng=RaffleRNG(0), **kwargs)
+    rate = sell(raffle, args.tickets, args.tickets_per_purchase)
+    print(f"{'in memory':>22}: {rate:8.0f} purchases/sec")
+    python_seconds, python_results = settle(raffle)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for batch_size in args.batch_sizes:
+            ledger_raffle = LedgerRaffle(
+                os.path.join(directory, f'ledger{batch_size}.db'), batch_size=batch_size,
+                sql_settlement=True, rng=RaffleRNG(0), **kwargs,
+            )
+            rate = sell(ledger_raffle, args.tickets, args.tickets_per_purchase)
+            print(f"{f'ledger, batch {batch_size}':>22}: {rate:8.0f} purchases/sec")
+        sql_seconds, sql_results = settle(ledger_raffle)
+        ledger_raffle.close()
+
+    assert sql_results == python_results
+    print(f"settle {args.tickets} tickets: python {python_seconds * 1000:8.1f} ms, sql {sql_seconds * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Startup cost of the MatchTable with a cold and a warm on-disk cache
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_match_table
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from raffle import ALL_TICKETS, MatchTable, Raffle, State
+from benchmarks.bench_settlement import best_of, build_store
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=100_000)
+    parser.add_argument('--owners', type=int, default=10)
+    parser.add_argument('--draws', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'match_table.u8')
+        for label in ('cold', 'warm'):
+            start = time.perf_counter()
+            match_table = MatchTable(path)
+            match_table.row(ALL_TICKETS[0])
+            print(f"{label} startup: {(time.perf_counter() - start) * 1000:8.1f} ms")
+            match_table.close()
+
+        rng = random.Random(0)
+        store = build_store(args.tickets, args.owners, rng)
+        winning_tickets = [set(rng.sample(range(1, 16), 5)) for _ in range(args.draws)]
+        raffle = Raffle(state=State.ONGOING)
+        for label, match_table in (('bitmask', None), ('match table', MatchTable(path))):
+            raffle.match_table = match_table
+
+            def run_draws():
+                for winning_ticket in winning_tickets:
+                    raffle.get_groups(store, winning_ticket)
+
+            seconds = best_of(run_draws, 3)
+            print(f"{label:>11}: {seconds / args.draws * 1000:8.1f} ms per draw ({args.tickets} tickets, {args.owners} owners)")
+            if match_table is not None:
+                match_table.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Memory used by 1M sold tickets as a name2tickets dict of sets vs a TicketStore
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_memory
+"""
+import argparse
+import random
+import tracemalloc
+
+from raffle import TicketStore, decode_ticket, generate_available_tickets
+
+
+def measure(build) -> int:
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=1_000_000)
+    parser.add_argument('--owners', type=int, default=10_000)
+    args = parser.parse_args()
+
+    universe = generate_available_tickets()
+    rng = random.Random(0)
+    masks = [rng.choice(universe) for _ in range(args.tickets)]
+    per_owner = args.tickets // args.owners
+
+    def build_sets():
+        return {
+            f'owner{i}': [decode_ticket(mask) for mask in masks[i*per_owner:(i+1)*per_owner]]
+            for i in range(args.owners)
+        }
+
+    def build_store():
+        store = TicketStore()
+        for i in range(args.owners):
+            store.add(f'owner{i}', masks[i*per_owner:(i+1)*per_owner])
+        return store
+
+    for label, build in (('dict of sets', build_sets), ('TicketStore', build_store)):
+        size = measure(build)
+        print(f"{label:>12}: {size / 2**20:8.1f} MiB ({size / args.tickets:6.1f} bytes/ticket)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Cost of the instrumentation: metrics disabled vs enabled
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_metrics
+"""
+import argparse
+import random
+import timeit
+
+from metrics import Metrics
+from raffle import NullSink, Raffle, State
+from benchmarks.bench_settlement import build_store
+
+
+WINNING_TICKET = {3, 7, 8, 11, 12}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    store = build_store(args.tickets, 1_000, random.Random(0))
+    for label, func, number in (
+        ('get_ticket x3000', lambda raffle: (raffle.start_draw(), [raffle.get_ticket() for _ in range(3000)]), 10),
+        ('buy_tickets(10)', lambda raffle: (raffle.start_draw(), raffle.buy_tickets('foo', 10)), 1000),
+        (f'settle({args.tickets} tickets)', lambda raffle: raffle.settle(WINNING_TICKET), 10),
+    ):
+        timings = []
+        for metrics in (None, Metrics()):
+            raffle = Raffle(state=State.ONGOING, name2tickets=store, sink=NullSink(), metrics=metrics)
+            timings.append(min(timeit.repeat(lambda: func(raffle), number=number, repeat=args.repeat)) / number)
+        disabled, enabled = timings
+        print(
+            f"{label:>24}: disabled {disabled * 1e6:9.1f} us, "
+            f"enabled {enabled * 1e6:9.1f} us ({enabled / disabled - 1:+6.1%})"
+        )
+
+
+if __name__ == '__main__':
+    main()
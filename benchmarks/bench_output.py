@@ -0,0 +1,48 @@
+"""Output cost of buying every ticket of a draw: print per ticket vs sinks
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_output
+"""
+import argparse
+import contextlib
+import os
+import timeit
+
+from raffle import ALL_TICKETS, ConsoleSink, NullSink, Raffle, decode_ticket
+
+
+def print_per_ticket(name, tickets):
+    """The output loop of the original Raffle.buy_tickets"""
+    print(f"Hi {name}, you have purchased {len(tickets)} ticket(s)")
+    for i, ticket in enumerate(tickets):
+        print(f"Ticket {i+1}: {' '.join(str(x) for x in decode_ticket(ticket))}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(os.devnull, 'w') as devnull:
+        def buy(sink):
+            raffle = Raffle(sink=sink)
+            raffle.buy_tickets('foo', len(ALL_TICKETS))
+
+        def buy_and_print():
+            raffle = Raffle(sink=NullSink())
+            raffle.buy_tickets('foo', len(ALL_TICKETS))
+            with contextlib.redirect_stdout(devnull):
+                print_per_ticket('foo', raffle.tickets.get_masks('foo'))
+
+        for label, func in (
+            ('print per ticket', buy_and_print),
+            ('ConsoleSink', lambda: buy(ConsoleSink(devnull))),
+            ('NullSink', lambda: buy(NullSink())),
+        ):
+            seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+            print(f"{label:>16}: {seconds * 1000:7.2f} ms for {len(ALL_TICKETS)} tickets")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Splitting a prize tier: float payouts vs exact payouts in whole cents
+
+Times calc_payout_per_user for tiers of 10 to 100k winners, and shows how far
+the float pot drifts from whole cents over many draws.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_payouts
+"""
+import argparse
+import random
+
+from raffle import NullSink, Raffle, RaffleRNG, to_cents
+from benchmarks.bench_settlement import best_of
+
+
+def drift(exact_payouts: bool, num_draws: int) -> float:
+    """Distance of the pot from whole cents after num_draws draws, in cents"""
+    rng = random.Random(0)
+    raffle = Raffle(sink=NullSink(), ticket_price=1.1, exact_payouts=exact_payouts, rng=RaffleRNG(0))
+    for _ in range(num_draws):
+        raffle.start_draw()
+        for i in range(rng.randrange(1, 30)):
+            raffle.assign_tickets(f'user{i}', raffle.allocate_tickets(f'user{i}', rng.randrange(1, 5)))
+        raffle.settle(raffle.get_winning_ticket())
+    return abs(raffle.pot_size * 100 - to_cents(raffle.pot_size))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1_000, 100_000])
+    parser.add_argument('--draws', type=int, default=1_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    float_raffle = Raffle(sink=NullSink())
+    exact_raffle = Raffle(sink=NullSink(), exact_payouts=True)
+    for num_winners in args.sizes:
+        user2count = {f'user{i}': rng.randrange(1, 10) for i in range(num_winners)}
+        reward = 123456.78
+        float_seconds = best_of(lambda: float_raffle.calc_payout_per_user(user2count, reward), args.repeat)
+        exact_seconds = best_of(lambda: exact_raffle.calc_payout_per_user(user2count, reward), args.repeat)
+        print(
+            f"{num_winners:>7} winners: float {float_seconds * 1000:8.2f} ms, "
+            f"exact {exact_seconds * 1000:8.2f} ms ({exact_seconds / float_seconds:4.1f}x)"
+        )
+
+    for label, exact_payouts in (('float', False), ('exact', True)):
+        print(f"{label:>5} pot after {args.draws} draws is {drift(exact_payouts, args.draws):.2e} cents off whole cents")
+
+
+if __name__ == '__main__':
+    main()
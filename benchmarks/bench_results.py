@@ -0,0 +1,67 @@
+"""Paying out draws with many distinct buyers: per-name dicts vs columnar results
+
+Times get_groups + get_group_results for draws where every buyer has one
+or a few tickets. The per-name path turns every tier into a dict from name
+to count and builds the list of result dicts, as settlement used to; the
+columnar path pays out from the arrays of owner ids and counts and leaves
+the result dicts unbuilt. Also shows the memory of the results of a draw.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_results
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from raffle import NullSink, Raffle, State
+from benchmarks.bench_settlement import build_store
+
+
+WINNING_TICKET = {3, 7, 8, 11, 12}
+
+
+def get_results_by_name(raffle: Raffle, store) -> dict:
+    """Settle through per-name dicts and build every result row"""
+    groups = {
+        group_number: dict(zip(map(store.names.__getitem__, winners.ids), winners.counts))
+        for group_number, winners in raffle.get_groups(store, WINNING_TICKET).items()
+    }
+    results, _ = raffle.get_group_results(groups)
+    return dict(results)
+
+
+def get_results_columnar(raffle: Raffle, store):
+    results, _ = raffle.get_group_results(raffle.get_groups(store, WINNING_TICKET))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--tickets-per-owner', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for num_owners in args.sizes:
+        store = build_store(num_owners * args.tickets_per_owner, num_owners, random.Random(0))
+        raffle = Raffle(state=State.ONGOING, name2tickets=store, sink=NullSink())
+        line = f"{num_owners:>9} owners:"
+        for label, func in (('by name', get_results_by_name), ('columnar', get_results_columnar)):
+            seconds = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                func(raffle, store)
+                seconds = min(seconds, time.perf_counter() - start)
+            tracemalloc.start()
+            results = func(raffle, store)
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del results
+            line += f" {label} {seconds * 1000:8.1f} ms {size / 2**20:7.1f} MiB,"
+        print(line.rstrip(','))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Load generator for server.py reporting latency percentiles and purchases/sec
+
+Starts a server on a free localhost port, unless --port is given, and runs
+concurrent clients that each make a series of purchases. When a draw sells
+out the clients run the raffle and start a new draw.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_server
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Results of a run list every winner, so they can be far longer than the default line limit
+RESULT_SIZE_LIMIT = 2**26
+
+
+async def client(host: str, port: int, client_id: int, num_purchases: int, num_tickets: int, latencies: list):
+    reader, writer = await asyncio.open_connection(host, port, limit=RESULT_SIZE_LIMIT)
+
+    async def send(command):
+        writer.write(json.dumps(command).encode() + b'\n')
+        await writer.drain()
+        return json.loads(await reader.readline())
+
+    for i in range(num_purchases):
+        start = time.perf_counter()
+        result = await send({'op': 'buy', 'name': f'client{client_id}-{i}', 'num_tickets': num_tickets})
+        latencies.append(time.perf_counter() - start)
+        if 'error' in result or len(result['tickets']) < num_tickets:
+            await send({'op': 'run'})
+            await send({'op': 'new_draw'})
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_load(host: str, port: int, num_clients: int, num_purchases: int, num_tickets: int):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"op": "new_draw"}\n')
+    await reader.readline()
+    writer.close()
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(host, port, i, num_purchases, num_tickets, latencies)
+        for i in range(num_clients)
+    ))
+    seconds = time.perf_counter() - start
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{num_clients} clients x {num_purchases} purchases: "
+        f"{len(latencies) / seconds:8.0f} purchases/sec, "
+        f"p50 {percentiles[49] * 1000:6.2f} ms, p99 {percentiles[98] * 1000:6.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help="port of a running server (default: start one)")
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--purchases', type=int, default=200, help="purchases per client")
+    parser.add_argument('--tickets', type=int, default=1, help="tickets per purchase")
+    args = parser.parse_args()
+
+    proc = None
+    port = args.port
+    if port is None:
+        proc = subprocess.Popen(
+            [sys.executable, 'server.py', '--host', args.host, '--port', '0'],
+            stdout=subprocess.PIPE, text=True,
+        )
+        port = int(proc.stdout.readline().rsplit(':', 1)[1])
+    try:
+        for num_clients in args.clients:
+            asyncio.run(run_load(args.host, port, num_clients, args.purchases, args.tickets))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Classifying winners of a draw: set intersection loop vs batched get_groups
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_settlement
+"""
+import argparse
+import random
+import time
+
+from raffle import Raffle, State, TicketStore, generate_available_tickets
+
+
+def get_groups_with_sets(name2tickets, winning_ticket):
+    """The winner classification loop of the original Raffle.get_groups"""
+    groups = {2: [], 3: [], 4: [], 5: []}
+    for name, tickets in name2tickets.items():
+        for ticket in tickets:
+            num_winning_numbers = len(winning_ticket.intersection(ticket))
+            if num_winning_numbers in groups:
+                groups[num_winning_numbers].append((name, ticket))
+    return groups
+
+
+def build_store(num_tickets: int, num_owners: int, rng: random.Random, indexed: bool = False) -> TicketStore:
+    universe = generate_available_tickets()
+    per_owner = max(1, num_tickets // num_owners)
+    store = TicketStore(indexed=indexed)
+    for i in range(0, num_tickets, per_owner):
+        store.add(f'owner{i}', [rng.choice(universe) for _ in range(min(per_owner, num_tickets - i))])
+    return store
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--owners', type=int, default=1_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    winning_ticket = {3, 7, 8, 11, 12}
+    for num_tickets in args.sizes:
+        store = build_store(num_tickets, args.owners, rng)
+        name2tickets = store.to_name2tickets()
+        raffle = Raffle(state=State.ONGOING)
+        sets = best_of(lambda: get_groups_with_sets(name2tickets, winning_ticket), args.repeat)
+        batched = best_of(lambda: raffle.get_groups(store, winning_ticket), args.repeat)
+        print(
+            f"{num_tickets:>9} tickets: sets {sets * 1000:9.1f} ms, "
+            f"batched {batched * 1000:9.1f} ms ({sets / batched:4.1f}x)"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Scaling of sharded settlement across 1 to N worker processes
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_sharded
+"""
+import argparse
+import os
+import random
+
+from settlement import ShardedRaffle
+from benchmarks.bench_settlement import best_of, build_store
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=4_000_000)
+    parser.add_argument('--owners', type=int, default=100_000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    store = build_store(args.tickets, args.owners, rng)
+    winning_ticket = {3, 7, 8, 11, 12}
+    serial = None
+    for num_workers in range(1, args.max_workers + 1):
+        raffle = ShardedRaffle(num_workers=num_workers, min_shard_size=1)
+        raffle.get_groups(store, winning_ticket)  # start the worker processes
+        seconds = best_of(lambda: raffle.get_groups(store, winning_ticket), args.repeat)
+        raffle.close()
+        serial = seconds if serial is None else serial
+        print(f"{num_workers:>3} workers: {seconds * 1000:9.1f} ms ({serial / seconds:4.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
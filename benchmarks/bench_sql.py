@@ -0,0 +1,204 @@
+"""The queries of sql/queries.sql on a library of millions of borrows
+
+Streams synthetic users, books and borrows into an SQLite database with the
+tables of sql/books.sql. Book popularity is skewed, so a few books are
+borrowed very often and some never. Then, without and with the indexes of
+sql/indexes.sql, runs every query of sql/queries.sql and prints its query
+plan and best time. With the indexes, it also runs the rewrites of
+sql/queries_rewritten.sql, which must return the same rows as the query
+they replace, unless the borrows have the ids whose divergence that file
+documents.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_sql
+    $ python3 -m benchmarks.bench_sql --users 1000000 --books 1000000 --borrows 10000000 --database library.db
+"""
+from typing import Iterator, List, Tuple
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql')
+AUTHOR = 'J.K. Rowling'
+INDEXES = ['idx_borrowed_books_book_id', 'idx_borrowed_books_user_book', 'idx_books_author']
+# Queries returning a row when the borrows have the ids that make a rewrite
+# of queries_rewritten.sql return other rows, by the end of the rewrite's title
+NULL_BOOK_ID = 'select 1 from borrowed_books where book_id is null limit 1'
+DIVERGENCES = {
+    'counting before the join': (
+        'select 1 from (select book_id from borrowed_books group by book_id order by count(*) desc limit 10) '
+        'where book_id is null or book_id not in (select book_id from books)'
+    ),
+    'with not exists': NULL_BOOK_ID,
+    'with left join': NULL_BOOK_ID,
+}
+
+
+def read_statements(path: str) -> Iterator[Tuple[str, str]]:
+    """Yield the statements of an SQL file, each with the last comment before it"""
+    title, lines = '', []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not lines and line.startswith('--'):
+                title = line.lstrip('- ').strip()
+                continue
+            if not lines and not line.strip():
+                continue
+            lines.append(line)
+            statement = ''.join(lines)
+            if sqlite3.complete_statement(statement):
+                yield title, statement.strip()
+                lines = []
+
+
+def create_tables(conn: sqlite3.Connection) -> None:
+    """Create the tables of books.sql, without its rows"""
+    for _, statement in read_statements(os.path.join(SQL_DIR, 'books.sql')):
+        if statement.startswith('create table'):
+            conn.execute(statement)
+
+
+def generate_users(num_users: int) -> Iterator[Tuple]:
+    for user_id in range(1, num_users + 1):
+        yield user_id, f'first{user_id}', f'last{user_id}', f'user{user_id}@bar.com', '2020-01-01 00:00:00'
+
+
+def generate_books(num_books: int, rng: random.Random) -> Iterator[Tuple]:
+    """Books by one of num_books // 20 authors, the first of whom is AUTHOR"""
+    num_authors = max(num_books // 20, 1)
+    authors = [AUTHOR] + [f'author{i}' for i in range(1, num_authors)]
+    for book_id in range(1, num_books + 1):
+        yield book_id, f'title{book_id}', authors[rng.randrange(num_authors)], rng.randrange(1950, 2025), f'{book_id:013}'
+
+
+def generate_borrows(num_borrows: int, num_users: int, num_books: int, rng: random.Random) -> Iterator[Tuple]:
+    """Borrows of books skewed to the lowest ids, a twentieth of them not returned yet
+
+    A hundredth of them are of book num_books + 1, which is not in books but
+    among the most borrowed, and one in ten thousand has a NULL user_id or a
+    NULL book_id, so the rewrites are checked on rows that break joins and not in.
+    """
+    dates = [f'20{year:02}-{month:02}-{day:02} 12:00:00' for year in range(15, 25) for month in range(1, 13) for day in range(1, 29)]
+    rand = rng.random
+    for _ in range(num_borrows):
+        i = int(rand() * len(dates))
+        user_id = int(rand() * num_users) + 1
+        book_id = int(rand() ** 3 * num_books) + 1
+        odd = rand()
+        if odd < .0001:
+            user_id = None
+        elif odd < .0002:
+            book_id = None
+        elif odd < .01:
+            book_id = num_books + 1
+        yield user_id, book_id, dates[i], dates[min(i + 7, len(dates) - 1)] if rand() >= .05 else None
+
+
+def fill(conn: sqlite3.Connection, num_users: int, num_books: int, num_borrows: int, seed: int = 0) -> None:
+    """Stream the synthetic rows into the tables, in batches of one transaction each"""
+    rng = random.Random(seed)
+    for query, rows in (
+        ('insert into users values (?, ?, ?, ?, ?)', generate_users(num_users)),
+        ('insert into books values (?, ?, ?, ?, ?)', generate_books(num_books, rng)),
+        ('insert into borrowed_books (user_id, book_id, borrow_date, return_date) values (?, ?, ?, ?)',
+         generate_borrows(num_borrows, num_users, num_books, rng)),
+    ):
+        while True:
+            batch = list(itertools.islice(rows, 100_000))
+            if not batch:
+                break
+            with conn:
+                conn.executemany(query, batch)
+
+
+def get_plan(conn: sqlite3.Connection, query: str) -> List[str]:
+    """Lines of the EXPLAIN QUERY PLAN of a query, indented by depth"""
+    depths = {0: -1}
+    lines = []
+    for node_id, parent_id, _, detail in conn.execute(f'explain query plan {query}'):
+        depths[node_id] = depths.get(parent_id, -1) + 1
+        lines.append('  ' * depths[node_id] + detail)
+    return lines
+
+
+def time_query(conn: sqlite3.Connection, query: str, repeat: int) -> Tuple[float, List[Tuple]]:
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(query).fetchall()
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds, rows
+
+
+def is_same_result(query: str, rows: List[Tuple], expected: List[Tuple]) -> bool:
+    """Whether rows are the rows of expected, or for a query with a limit, the same counts in the same order"""
+    if 'limit' in query:
+        return [row[-1] for row in rows] == [row[-1] for row in expected]
+    return sorted(rows) == sorted(expected)
+
+
+def run_queries(conn: sqlite3.Connection, repeat: int, with_rewrites: bool) -> None:
+    queries = [q for q in read_statements(os.path.join(SQL_DIR, 'queries.sql')) if q[1].startswith('select')]
+    rewrites = list(read_statements(os.path.join(SQL_DIR, 'queries_rewritten.sql'))) if with_rewrites else []
+    for title, query in queries:
+        seconds, expected = time_query(conn, query, repeat)
+        print(f"\n{title}: {seconds * 1000:.1f} ms, {len(expected)} rows")
+        print('\n'.join(f"    {line}" for line in get_plan(conn, query)))
+        for rewrite_title, rewrite in rewrites:
+            if not rewrite_title.startswith(f'{title},'):
+                continue
+            seconds, rows = time_query(conn, rewrite, repeat)
+            variant = rewrite_title[len(title) + 1:].strip()
+            note = ''
+            if not is_same_result(query, rows, expected):
+                divergence = DIVERGENCES.get(variant)
+                if divergence is None or conn.execute(divergence).fetchone() is None:
+                    raise AssertionError(f"{rewrite_title} returns other rows than the query it replaces")
+                note = f", {len(rows)} rows as documented"
+            print(f"  {variant}: {seconds * 1000:.1f} ms{note}")
+            print('\n'.join(f"      {line}" for line in get_plan(conn, rewrite)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--books', type=int, default=100_000)
+    parser.add_argument('--borrows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database', help="database file to keep, filled on the first run; a temporary one by default")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.database or os.path.join(directory, 'library.db')
+        conn = sqlite3.connect(path)
+        if not conn.execute("select 1 from sqlite_master where name = 'borrowed_books'").fetchone():
+            create_tables(conn)
+            start = time.perf_counter()
+            fill(conn, args.users, args.books, args.borrows)
+            print(f"Filled {args.users} users, {args.books} books and {args.borrows} borrows "
+                  f"in {time.perf_counter() - start:.1f} s")
+        conn.execute('create index if not exists idx_books_publication_year on books(publication_year)')
+        for name in INDEXES:
+            conn.execute(f'drop index if exists {name}')
+
+        # The rewrites rely on the indexes and take hours without them at these sizes
+        print("\n== Without the indexes of indexes.sql")
+        run_queries(conn, args.repeat, with_rewrites=False)
+
+        start = time.perf_counter()
+        with open(os.path.join(SQL_DIR, 'indexes.sql'), encoding='utf-8') as f:
+            conn.executescript(f.read())
+        conn.execute('analyze')
+        print(f"\n== With the indexes of indexes.sql, built in {time.perf_counter() - start:.1f} s")
+        run_queries(conn, args.repeat, with_rewrites=True)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Startup cost of short-lived raffle.py runs
+
+Measures the cumulative import time of raffle (from python -X importtime)
+and the wall-clock time from starting `python3 -m raffle --status` to its
+first line of output, next to a bare interpreter start. Every run uses a
+warm bytecode cache in a temporary directory, like repeated cron runs do.
+Exits with status 1 if the import time is over --budget-ms.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_startup
+"""
+from typing import Dict, List
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+IMPORT_BUDGET_MS = 50
+
+
+def get_env(cache_dir: str) -> Dict[str, str]:
+    """Environment that caches bytecode in cache_dir"""
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=cache_dir)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def import_time(module: str, env: Dict[str, str]) -> float:
+    """Cumulative import time of module in seconds, as reported by -X importtime"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    for line in proc.stderr.splitlines():
+        _, _, cumulative, name = (field.strip() for field in line.replace(':', '|', 1).split('|'))
+        if name == module:
+            return int(cumulative) / 1e6
+    raise RuntimeError(f"No import time for {module}")
+
+
+def time_to_first_output(args: List[str], env: Dict[str, str]) -> float:
+    """Wall-clock seconds from starting a process to its first line of output"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(args, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    proc.stdout.readline()
+    seconds = time.perf_counter() - start
+    proc.communicate()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS, help="maximum median import time of raffle")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = get_env(cache_dir)
+        # Fill the bytecode cache
+        import_time('raffle', env)
+        import_ms = 1000 * statistics.median(import_time('raffle', env) for _ in range(args.repeat))
+        bare_ms = 1000 * statistics.median(
+            time_to_first_output([sys.executable, '-c', 'print()'], env) for _ in range(args.repeat)
+        )
+        status_ms = 1000 * statistics.median(
+            time_to_first_output([sys.executable, '-m', 'raffle', '--status'], env) for _ in range(args.repeat)
+        )
+    print(f"     import raffle: {import_ms:7.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"  python -c print(): {bare_ms:7.1f} ms to first output")
+    print(f"raffle.py --status: {status_ms:7.1f} ms to first output ({status_ms - bare_ms:+.1f} ms)")
+    if import_ms > args.budget_ms:
+        print(f"import raffle is over its budget of {args.budget_ms:.0f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
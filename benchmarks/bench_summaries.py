@@ -0,0 +1,131 @@
+"""Top books and users from trigger-maintained summaries vs GROUP BY scans
+
+Grows borrowed_books to 10M rows in two databases with the tables of
+sql/books.sql, the trigger and index of sql/queries.sql and the indexes
+of sql/indexes.sql. One of them also has the summary tables and triggers
+of sql/summaries.sql. At every size, prints the time it took each database
+to insert the new borrows, and the read latency of the top 10 books and
+top user queries of queries.sql against their versions in summaries.sql.
+After the first size, it deletes and moves some borrows and checks the
+summaries against a full GROUP BY.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_summaries
+    $ python3 -m benchmarks.bench_summaries --sizes 100000 1000000
+"""
+from typing import Dict, List
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.bench_sql import (
+    SQL_DIR, create_tables, fill, generate_borrows, is_same_result, read_statements, time_query,
+)
+
+
+TOP_BOOKS = 'Query to select top 10 most borrowed books'
+TOP_USER = 'Query to find user with most borrowed books'
+INSERT_BORROW = 'insert into borrowed_books (user_id, book_id, borrow_date, return_date) values (?, ?, ?, ?)'
+
+
+def get_queries(filename: str) -> Dict[str, str]:
+    return {title: statement for title, statement in read_statements(os.path.join(SQL_DIR, filename))}
+
+
+def create_database(path: str, num_users: int, num_books: int, summaries: bool) -> sqlite3.Connection:
+    """A database without borrows, with the trigger and indexes of the queries, and optionally the summaries"""
+    conn = sqlite3.connect(path)
+    create_tables(conn)
+    fill(conn, num_users, num_books, 0)
+    for filename in ('queries.sql', 'indexes.sql') + (('summaries.sql',) if summaries else ()):
+        for _, statement in read_statements(os.path.join(SQL_DIR, filename)):
+            if not statement.startswith('select'):
+                conn.execute(statement)
+    conn.commit()
+    return conn
+
+
+def insert(conn: sqlite3.Connection, borrows: List[tuple]) -> float:
+    """Seconds it takes to insert the borrows, in transactions of 10k rows"""
+    start = time.perf_counter()
+    for i in range(0, len(borrows), 10_000):
+        with conn:
+            conn.executemany(INSERT_BORROW, borrows[i:i + 10_000])
+    return time.perf_counter() - start
+
+
+def get_changes(rng: random.Random, num_borrows: int, num_users: int, num_books: int) -> List[tuple]:
+    """Queries and rows that delete random borrows and move others to random users and books"""
+    borrow_ids = lambda: rng.randrange(1, num_borrows + 1)
+    return [
+        ('delete from borrowed_books where borrow_id = ?', [(borrow_ids(),) for _ in range(1000)]),
+        ('update borrowed_books set user_id = ? where borrow_id = ?',
+         [(rng.randrange(1, num_users + 1), borrow_ids()) for _ in range(1000)]),
+        ('update borrowed_books set book_id = ? where borrow_id = ?',
+         [(rng.randrange(1, num_books + 1), borrow_ids()) for _ in range(1000)]),
+    ]
+
+
+def check_summaries(conn: sqlite3.Connection) -> None:
+    """Check the summaries match counting borrowed_books from scratch, without NULL ids"""
+    for summary, query in (
+        ('select book_id, nr_times_borrowed from book_borrow_counts',
+         'select book_id, count(*) from borrowed_books where book_id is not null group by book_id'),
+        ('select user_id, book_id, nr_times_borrowed from user_book_counts',
+         'select user_id, book_id, count(*) from borrowed_books '
+         'where user_id is not null and book_id is not null group by user_id, book_id'),
+        ('select user_id, book_count from user_distinct_books',
+         'select user_id, count(distinct book_id) from borrowed_books '
+         'where user_id is not null and book_id is not null group by user_id'),
+    ):
+        if sorted(conn.execute(summary)) != sorted(conn.execute(query)):
+            raise AssertionError(f"{summary} does not match {query}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--books', type=int, default=100_000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 3_000_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    queries = get_queries('queries.sql')
+    summary_queries = get_queries('summaries.sql')
+    rng = random.Random(0)
+    borrows = generate_borrows(max(args.sizes), args.users, args.books, rng)
+    with tempfile.TemporaryDirectory() as directory:
+        plain = create_database(os.path.join(directory, 'plain.db'), args.users, args.books, summaries=False)
+        summarized = create_database(os.path.join(directory, 'summarized.db'), args.users, args.books, summaries=True)
+        size = 0
+        for next_size in sorted(args.sizes):
+            batch = list(itertools.islice(borrows, next_size - size))
+            plain_seconds, summarized_seconds = insert(plain, batch), insert(summarized, batch)
+            if not size:
+                for conn in (plain, summarized):
+                    with conn:
+                        for query, rows in get_changes(random.Random(1), len(batch), args.users, args.books):
+                            conn.executemany(query, rows)
+                check_summaries(summarized)
+            size = next_size
+            print(f"{size:>10} borrows: inserting {len(batch)} took {plain_seconds:6.1f} s plain, "
+                  f"{summarized_seconds:6.1f} s with summaries ({summarized_seconds / plain_seconds:.2f}x)")
+            for title in (TOP_BOOKS, TOP_USER):
+                query = queries[title]
+                seconds, expected = time_query(plain, query, args.repeat)
+                summary_seconds, rows = time_query(summarized, summary_queries[f'{title}, from the summary'], 100)
+                if not is_same_result(query, rows, expected):
+                    raise AssertionError(f"{title} from the summary returns other counts")
+                print(f"    {title[len('Query to '):]}: {seconds * 1000:8.1f} ms group by, "
+                      f"{summary_seconds * 1000:6.3f} ms summary")
+        plain.close()
+        summarized.close()
+
+
+if __name__ == '__main__':
+    main()
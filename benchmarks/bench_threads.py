@@ -0,0 +1,83 @@
+"""Purchase throughput of a Raffle shared by 1 to N threads
+
+Compares a plain Raffle behind a single global lock with a
+ThreadSafeRaffle, whose purchases only lock the stripe of their owner. The
+draws are 49-pick-6, so the threads never run out of tickets. On a GIL
+build the threads take turns running Python code and the striped locks
+mostly save lock waits; on a free-threaded build (python3.13t and later)
+purchases in different stripes run in parallel.
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.bench_threads
+"""
+import argparse
+import sys
+import threading
+import time
+
+from raffle import Game, NullSink, Raffle, RaffleRNG, State
+from threaded import ThreadSafeRaffle
+
+
+GAME = Game(49, 6)
+REWARD_PERCENTAGES = {3: .1, 4: .15, 5: .25, 6: .5}
+
+
+class GlobalLockRaffle(Raffle):
+    """Raffle made thread-safe the simple way, with one lock around every purchase"""
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.lock = threading.Lock()
+
+    def purchase(self, name, num_tickets):
+        with self.lock:
+            return super().purchase(name, num_tickets)
+
+
+def run(raffle: Raffle, num_threads: int, purchases_per_thread: int, tickets_per_purchase: int) -> float:
+    """Seconds it takes num_threads threads to make purchases_per_thread purchases each"""
+    barrier = threading.Barrier(num_threads + 1)
+
+    def buy(i):
+        barrier.wait()
+        for j in range(purchases_per_thread):
+            raffle.purchase(f'user{i}-{j}', tickets_per_purchase)
+
+    threads = [threading.Thread(target=buy, args=(i,)) for i in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--purchases', type=int, default=20_000, help="purchases per thread count")
+    parser.add_argument('--tickets-per-purchase', type=int, default=5)
+    args = parser.parse_args()
+
+    gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil_enabled else 'disabled'}")
+    for num_threads in args.threads:
+        rates = []
+        for cls, kwargs in ((GlobalLockRaffle, {}), (ThreadSafeRaffle, {'num_stripes': 4 * num_threads})):
+            raffle = cls(
+                state=State.ONGOING, game=GAME, reward_percentages=REWARD_PERCENTAGES,
+                sink=NullSink(), rng=RaffleRNG(0), **kwargs,
+            )
+            seconds = run(raffle, num_threads, args.purchases // num_threads, args.tickets_per_purchase)
+            rates.append(args.purchases // num_threads * num_threads / seconds)
+        global_lock, striped = rates
+        print(
+            f"{num_threads:>3} threads: global lock {global_lock:9.0f} purchases/sec, "
+            f"striped {striped:9.0f} purchases/sec ({striped / global_lock:4.2f}x)"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Benchmark suite for the raffle hot paths
+
+Times Raffle() construction, buy_tickets, get_groups, get_group_results and
+a full handle_run_raffle for 1k to 1M tickets and 10 to 100k owners, plus
+the start-up of a `python3 -m raffle --status` run, and writes the timings
+as JSON. Given a saved baseline, it flags the benchmarks
+that got slower than the threshold and exits with status 1, as it does when
+the start-up is over --startup-budget-ms (STARTUP_BUDGET_MS by default).
+
+Run from the repository root:
+
+    $ python3 -m benchmarks.suite --output baseline.json
+    $ python3 -m benchmarks.suite --baseline baseline.json
+"""
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from raffle import ALL_TICKETS, NullSink, Raffle, State
+from benchmarks.bench_settlement import build_store
+from benchmarks.bench_startup import IMPORT_BUDGET_MS, get_env
+
+
+TICKET_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+OWNER_SIZES = [10, 1_000, 100_000]
+BUY_SIZES = [1, 10, 100, 1_000, len(ALL_TICKETS)]
+QUICK_TICKET_SIZES = [1_000, 10_000]
+QUICK_OWNER_SIZES = [10, 1_000]
+WINNING_TICKET = {3, 7, 8, 11, 12}
+# The import budget of bench_startup plus as much again for the interpreter and the command
+STARTUP_BUDGET_MS = 2 * IMPORT_BUDGET_MS
+
+
+Benchmark = Tuple[str, Callable[[], None], Optional[Callable[[], None]]]
+
+
+def time_benchmark(func: Callable[[], None], setup: Optional[Callable[[], None]], repeat: int) -> List[float]:
+    """Time repeat calls of func, running setup untimed before each call"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def get_benchmarks(ticket_sizes: List[int], owner_sizes: List[int], cache_dir: str) -> Iterator[Benchmark]:
+    """Yield (name, func, setup) for every benchmark, building the inputs lazily"""
+    env = get_env(cache_dir)
+    status = [sys.executable, '-m', 'raffle', '--status']
+
+    def run_status():
+        subprocess.run(status, env=env, stdout=subprocess.DEVNULL, check=True)
+
+    def fill_cache():
+        """Fill the bytecode cache with an untimed run, before the first timed one"""
+        if not os.listdir(cache_dir):
+            run_status()
+
+    yield 'startup/status', run_status, fill_cache
+
+    yield 'construct', lambda: Raffle(sink=NullSink()), None
+
+    for num_tickets in BUY_SIZES:
+        raffle = Raffle(state=State.ONGOING, sink=NullSink())
+        yield (
+            f'buy_tickets/tickets={num_tickets}',
+            lambda raffle=raffle, num_tickets=num_tickets: raffle.buy_tickets('foo', num_tickets),
+            raffle.start_draw,
+        )
+
+    for num_tickets in ticket_sizes:
+        for num_owners in owner_sizes:
+            if num_owners > num_tickets:
+                continue
+            size = f'tickets={num_tickets},owners={num_owners}'
+            store = build_store(num_tickets, num_owners, random.Random(0))
+            raffle = Raffle(state=State.ONGOING, name2tickets=store, sink=NullSink())
+            raffle.get_winning_ticket = lambda: set(WINNING_TICKET)
+            groups = raffle.get_groups(store, WINNING_TICKET)
+            pot_size = raffle.pot_size
+
+            def reset_pot(raffle=raffle, pot_size=pot_size):
+                raffle.pot_size = pot_size
+
+            yield f'get_groups/{size}', lambda raffle=raffle, store=store: raffle.get_groups(store, WINNING_TICKET), None
+            yield f'get_group_results/{size}', lambda raffle=raffle, groups=groups: raffle.get_group_results(groups), None
+            yield f'handle_run_raffle/{size}', raffle.handle_run_raffle, reset_pot
+
+
+def run_suite(ticket_sizes: List[int], owner_sizes: List[int], repeat: int, name_filter: Optional[str]) -> Dict:
+    results = dict()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, func, setup in get_benchmarks(ticket_sizes, owner_sizes, cache_dir):
+            if name_filter is not None and name_filter not in name:
+                continue
+            timings = time_benchmark(func, setup, repeat)
+            results[name] = {
+                'min': min(timings),
+                'median': statistics.median(timings),
+                'repeat': repeat,
+            }
+            print(f"{name:<55} {results[name]['median'] * 1000:10.3f} ms", file=sys.stderr)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'results': results,
+    }
+
+
+def compare(report: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Get the names of benchmarks whose median is more than threshold slower than in baseline"""
+    regressions = []
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = result['median'] / base['median']
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:<55} {ratio:6.2f}x {flag}", file=sys.stderr)
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', metavar='FILE', help="write the JSON report to FILE (default: stdout)")
+    parser.add_argument('--baseline', metavar='FILE', help="compare against the JSON report in FILE")
+    parser.add_argument('--threshold', type=float, default=0.1, help="slowdown that counts as a regression")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', metavar='SUBSTRING', help="only run benchmarks with SUBSTRING in their name")
+    parser.add_argument('--quick', action='store_true', help="only run the small sizes")
+    parser.add_argument(
+        '--startup-budget-ms', type=float, default=STARTUP_BUDGET_MS, metavar='MS',
+        help="fail if a python3 -m raffle --status run takes longer than MS (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    report = run_suite(
+        QUICK_TICKET_SIZES if args.quick else TICKET_SIZES,
+        QUICK_OWNER_SIZES if args.quick else OWNER_SIZES,
+        args.repeat,
+        args.filter,
+    )
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}", file=sys.stderr)
+            failed = True
+    startup = report['results'].get('startup/status')
+    if startup is not None and startup['median'] * 1000 > args.startup_budget_ms:
+        print(f"startup/status is over its budget of {args.startup_budget_ms:.0f} ms", file=sys.stderr)
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Many independent draws, e.g. one per region or campaign, in one process
+
+A DrawManager hosts draws by id, creating one on its first new_draw. The draws
+share everything that does not change between them: the Game and its
+ticket tables, the prize tiers, one RaffleRNG and one Sink. Like those of
+a Raffle, their ticket stores keep no prize-tier index unless
+indexed=True, and a new draw allocates no pool of tickets (see
+TicketAllocator).
+
+At most max_live draws are kept in memory. Beyond that, the draw used the
+longest ago is evicted to a file in the format of a journal snapshot and
+loaded back the next time it is used. Settlements scheduled with
+schedule_run() are run together by run_scheduled(), which draws all
+winning tickets in one call and loads each evicted draw only once.
+"""
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+from urllib.parse import quote
+import json
+import os
+
+from journal import get_snapshot, load_snapshot, write_atomic
+from raffle import (
+    DEFAULT_GAME, ConsoleSink, DrawResults, Raffle, RaffleRNG, Sink, State, as_rng, encode_ticket,
+)
+
+
+class ManagedRaffle(Raffle):
+    """Raffle of a DrawManager, whose ticket stores only keep their index if indexed"""
+    def __init__(self, draw_id: str, indexed: bool = False, **kwargs) -> None:
+        self.draw_id = draw_id
+        self.indexed = indexed
+        super().__init__(**kwargs)
+        if kwargs.get('name2tickets') is None:
+            self.reset_user_tickets()
+
+    def reset_user_tickets(self):
+        self.tickets = self.game.new_ticket_store(self.indexed)
+
+
+class DrawManager:
+    """Draws by id, with the least recently used ones evicted to files in directory
+
+    The keyword arguments are the Raffle arguments shared by every draw,
+    e.g. game, reward_percentages or pot_size. All draws take their tickets
+    and winning tickets from the same RaffleRNG, so a seeded manager gives
+    the same results for the same commands. Evictions do not change the
+    winning tickets, but a loaded draw's pool of available tickets is in
+    another order, so the tickets it sells next differ.
+    """
+    def __init__(
+        self,
+        directory: str,
+        max_live: int = 1000,
+        indexed: bool = False,
+        rng: Union[RaffleRNG, int, str, None] = None,
+        sink: Optional[Sink] = None,
+        **kwargs,
+    ) -> None:
+        if max_live < 1:
+            raise ValueError(f"Invalid max_live: {max_live}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_live = max_live
+        self.indexed = indexed
+        self.rng = as_rng(rng)
+        self.sink = ConsoleSink() if sink is None else sink
+        self.game = DEFAULT_GAME if kwargs.get('game') is None else kwargs['game']
+        self.kwargs = dict(kwargs, game=self.game)
+        # Least recently used first
+        self.draws: OrderedDict[str, ManagedRaffle] = OrderedDict()
+        # Draw ids in the order their settlements were scheduled
+        self.scheduled: Dict[str, None] = dict()
+        self.num_evictions = 0
+        self.num_loads = 0
+
+    def __len__(self) -> int:
+        """Number of live draws"""
+        return len(self.draws)
+
+    def get_path(self, draw_id: str) -> str:
+        return os.path.join(self.directory, quote(draw_id, safe='') + '.json')
+
+    def get(self, draw_id: str, create: bool = False) -> ManagedRaffle:
+        """Get a draw, loading it if it was evicted and, if create, creating it if it is new"""
+        raffle = self.draws.get(draw_id)
+        if raffle is not None:
+            self.draws.move_to_end(draw_id)
+            return raffle
+        path = self.get_path(draw_id)
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            if not create:
+                raise ValueError(f"Invalid draw: {draw_id}")
+            data = None
+        raffle = ManagedRaffle(draw_id, self.indexed, rng=self.rng, sink=self.sink, **self.kwargs)
+        if data is not None:
+            load_snapshot(raffle, data)
+            os.remove(path)
+            self.num_loads += 1
+        self.draws[draw_id] = raffle
+        while len(self.draws) > self.max_live:
+            self.evict(next(iter(self.draws)))
+        return raffle
+
+    def evict(self, draw_id: str) -> None:
+        """Write a live draw to its file and drop it from memory
+
+        The file is not fsynced: like the live draws, evicted draws are
+        lost if the machine goes down.
+        """
+        raffle = self.draws.pop(draw_id)
+        write_atomic(self.get_path(draw_id), json.dumps(get_snapshot(raffle), separators=(',', ':')), sync=False)
+        self.num_evictions += 1
+
+    def handle_command(self, command: Dict) -> Dict:
+        """Handle a batch command of Raffle.handle_command for the draw of its 'draw' id
+
+        Only 'new_draw' creates a draw: other ops on an id that is neither
+        live nor evicted raise ValueError.
+        """
+        if not isinstance(command, dict) or not isinstance(command.get('draw'), str):
+            raise ValueError(f"Invalid command: {command}")
+        command = dict(command)
+        draw_id = command.pop('draw')
+        return dict(self.get(draw_id, create=command.get('op') == 'new_draw').handle_command(command), draw=draw_id)
+
+    def schedule_run(self, draw_id: str) -> None:
+        """Schedule the settlement of a draw for the next run_scheduled(), without loading it if it was evicted"""
+        if draw_id not in self.draws and not os.path.exists(self.get_path(draw_id)):
+            raise ValueError(f"Invalid draw: {draw_id}")
+        self.scheduled[draw_id] = None
+
+    def run_scheduled(self) -> Dict[str, DrawResults]:
+        """Settle the scheduled draws like handle_run_raffle() and return their results
+
+        The 'raffle_run' and 'draw_results' events go to the shared sink
+        with the draw_id of their draw. Draws that are not ongoing by then
+        are skipped. Live draws are settled first, so loading the evicted
+        ones only evicts draws that are not part of the batch.
+        """
+        game = self.game
+        # In the order of scheduling, which does not depend on evictions
+        winning_tickets = dict(zip(
+            self.scheduled, self.rng.winning_tickets(len(self.scheduled), game.num_numbers, game.pick),
+        ))
+        self.scheduled = dict()
+        all_results = dict()
+        for draw_id in sorted(winning_tickets, key=lambda draw_id: draw_id not in self.draws):
+            winning_ticket = winning_tickets[draw_id]
+            raffle = self.get(draw_id)
+            if raffle.state != State.ONGOING:
+                continue
+            self.sink.emit('raffle_run', {'draw_id': draw_id, 'winning_ticket': encode_ticket(winning_ticket)})
+            results = raffle.settle(winning_ticket)
+            self.sink.emit('draw_results', {'draw_id': draw_id, 'results': results})
+            raffle.state = State.NOT_STARTED
+            all_results[draw_id] = results
+        return all_results
+
+    def close(self) -> None:
+        """Evict every live draw, so a new DrawManager on directory picks them up"""
+        for draw_id in list(self.draws):
+            self.evict(draw_id)
@@ -0,0 +1,218 @@
+"""Crash-safe persistence of the Raffle state
+
+Every draw start, purchase and settlement is appended to a journal of JSON
+lines before it is applied to the in-memory Raffle. On startup the latest
+snapshot is loaded and the journal events after it are replayed, which
+rebuilds the pot, the sold tickets and the available tickets.
+"""
+from typing import Dict, Iterable, Set, List, Tuple
+import json
+import os
+
+from raffle import Raffle, State, encode_ticket, decode_ticket
+
+
+JOURNAL_FILENAME = 'journal.jsonl'
+SNAPSHOT_FILENAME = 'snapshot.json'
+
+
+def read_events(path: str) -> Tuple[List[Dict], int]:
+    """Read all complete events of a journal
+
+    Returns a tuple of (events, size) where size is the offset after the last
+    complete line. A partially written last line, left behind by a crash in
+    the middle of a write, is not part of the returned events.
+    """
+    events = []
+    size = 0
+    if not os.path.exists(path):
+        return events, size
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                break
+            size += len(line)
+    return events, size
+
+
+def write_atomic(path: str, data: str, sync: bool = True) -> None:
+    """Replace the file at path with data, such that a crash leaves either the old or the new file
+
+    Unless sync is False, the file and its directory are fsynced, so the
+    new file also survives the machine going down.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if not sync:
+        return
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def get_snapshot(raffle: Raffle, seq: int = 0) -> Dict:
+    """Get the state of a raffle as of journal event seq, in the format of a snapshot file"""
+    store = raffle.tickets
+    return {
+        'seq': seq,
+        'state': raffle.state.name,
+        'pot_size': raffle.pot_size,
+        'tickets': [[name, store.get_masks(name)] for name in store.names],
+    }
+
+
+def load_snapshot(raffle: Raffle, data: Dict) -> int:
+    """Restore the state of a raffle from a snapshot and return its seq
+
+    The sold tickets are taken out of a new pool of available tickets.
+    """
+    raffle.state = State[data['state']]
+    raffle.pot_size = data['pot_size']
+    raffle.reset_user_tickets()
+    raffle.reset_available_tickets()
+    for name, masks in data['tickets']:
+        raffle.tickets.add(name, masks)
+        raffle.available_tickets.remove(masks)
+    return data['seq']
+
+
+class Journal:
+    """Append-only file of JSON events with group commit
+
+    Every event is flushed to the operating system as soon as it is
+    appended, so it survives a crash of the process. The file is fsynced once
+    per group_commit events, which bounds the number of events that can be
+    lost when the machine goes down. A group_commit of 0 never fsyncs.
+    """
+    def __init__(self, path: str, group_commit: int = 1) -> None:
+        self.path = path
+        self.group_commit = group_commit
+        self.num_pending = 0
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def append(self, event: Dict) -> None:
+        self.file.write(json.dumps(event, separators=(',', ':')) + '\n')
+        self.file.flush()
+        self.num_pending += 1
+        if self.group_commit and self.num_pending >= self.group_commit:
+            self.sync()
+
+    def sync(self) -> None:
+        """Force all appended events to disk"""
+        if self.num_pending:
+            os.fsync(self.file.fileno())
+            self.num_pending = 0
+
+    def truncate(self) -> None:
+        """Drop all events, used once they are covered by a snapshot"""
+        self.file.truncate(0)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.num_pending = 0
+
+    def close(self) -> None:
+        self.sync()
+        self.file.close()
+
+
+class JournaledRaffle(Raffle):
+    """Raffle that journals its events to a directory and recovers from it
+
+    Creating a JournaledRaffle loads the snapshot and replays the journal
+    found in directory. Once snapshot_every events have been journaled since
+    the last snapshot, a new compact snapshot is written and the journal is
+    emptied, which keeps the replay time bounded.
+    """
+    def __init__(
+        self,
+        directory: str,
+        group_commit: int = 1,
+        snapshot_every: int = 10_000,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        os.makedirs(directory, exist_ok=True)
+        self.journal_path = os.path.join(directory, JOURNAL_FILENAME)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILENAME)
+        self.snapshot_every = snapshot_every
+        self.seq = 0
+        self.num_events_since_snapshot = 0
+        self.recover()
+        self.journal = Journal(self.journal_path, group_commit=group_commit)
+
+    def recover(self):
+        """Load the snapshot and replay the journal events after it"""
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                self.load_snapshot(json.load(f))
+        events, size = read_events(self.journal_path)
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) != size:
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(size)
+        for event in events:
+            if event['seq'] <= self.seq:
+                continue
+            self.apply(event)
+            self.seq = event['seq']
+            self.num_events_since_snapshot += 1
+
+    def apply(self, event: Dict):
+        """Apply a journaled event to the in-memory state"""
+        op = event['op']
+        if op == 'new_draw':
+            Raffle.start_draw(self)
+            self.state = State.ONGOING
+        elif op == 'buy':
+            self.available_tickets.remove(event['tickets'])
+            Raffle.assign_tickets(self, event['name'], event['tickets'])
+        elif op == 'run':
+            Raffle.settle(self, decode_ticket(event['winning_ticket']))
+            self.state = State.NOT_STARTED
+        else:
+            raise ValueError(f"Invalid journal event: {event}")
+
+    def log(self, event: Dict):
+        """Journal an event before it gets applied"""
+        if self.num_events_since_snapshot >= self.snapshot_every:
+            self.snapshot()
+        self.seq += 1
+        event['seq'] = self.seq
+        self.journal.append(event)
+        self.num_events_since_snapshot += 1
+
+    def snapshot(self):
+        """Write a compact snapshot of the current state and empty the journal"""
+        self.journal.sync()
+        write_atomic(self.snapshot_path, json.dumps(get_snapshot(self, self.seq), separators=(',', ':')))
+        self.journal.truncate()
+        self.num_events_since_snapshot = 0
+
+    def load_snapshot(self, data: Dict):
+        self.seq = load_snapshot(self, data)
+
+    def start_draw(self):
+        self.log({'op': 'new_draw'})
+        super().start_draw()
+
+    def assign_tickets(self, name: str, tickets: Iterable[int]):
+        tickets = list(tickets)
+        self.log({'op': 'buy', 'name': name, 'tickets': tickets})
+        super().assign_tickets(name, tickets)
+
+    def settle(self, winning_ticket: Set) -> Dict[int, List[Dict]]:
+        self.log({'op': 'run', 'winning_ticket': encode_ticket(winning_ticket)})
+        return super().settle(winning_ticket)
+
+    def close(self):
+        self.journal.close()
@@ -0,0 +1,149 @@
+"""SQLite ledger of the tickets sold and the results of every draw
+
+A LedgerRaffle records its draws, owners, tickets and results in an SQLite
+database with the schema of sql/raffle.sql, next to the in-memory
+TicketStore. The database is in WAL mode. Purchases are buffered and
+written with executemany() in one transaction per batch of batch_size
+tickets, and the buffer is always written before a draw is settled or a
+new one starts. With sql_settlement=True the winners are counted by a
+query grouping the draw's tickets by match count and owner instead of in
+Python.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import itertools
+import os
+import sqlite3
+
+from raffle import DrawResults, Raffle, TicketStore, decode_ticket, encode_ticket
+
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sql', 'raffle.sql')
+
+# SQLite integers are signed 64-bit, which holds the masks of up to 63 numbers
+MAX_NUM_NUMBERS = 63
+
+
+def get_matches_expression(winning_ticket: Iterable[int]) -> str:
+    """SQL expression for the number of winning numbers of a ticket's mask, one term per winning number"""
+    return ' + '.join(f'((mask >> {number - 1}) & 1)' for number in sorted(winning_ticket)) or '0'
+
+
+class Ledger:
+    """Connection to a ledger database, with buffered writes of sold tickets"""
+    def __init__(self, path: str, batch_size: int = 10_000) -> None:
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('pragma journal_mode=wal')
+        self.conn.execute('pragma synchronous=normal')
+        with open(SCHEMA_PATH, encoding='utf-8') as f:
+            self.conn.executescript(f.read())
+        self.batch_size = batch_size
+        self.pending_owners: List[Tuple[int, int, str]] = []
+        self.pending_tickets: List[Tuple[int, int, int]] = []
+
+    def start_draw(self, pot_size: float) -> int:
+        """Record a new draw and return its id"""
+        self.flush()
+        with self.conn:
+            cursor = self.conn.execute(
+                "insert into draws (started_at, pot_size) values (datetime('now'), ?)", (pot_size,),
+            )
+        return cursor.lastrowid
+
+    def add(self, draw_id: int, owner_id: int, name: Optional[str], masks: Iterable[int]) -> None:
+        """Buffer tickets sold to an owner, with the owner's name if the owner is new to the draw"""
+        if name is not None:
+            self.pending_owners.append((draw_id, owner_id, name))
+        self.pending_tickets.extend(zip(itertools.repeat(draw_id), masks, itertools.repeat(owner_id)))
+        if len(self.pending_tickets) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered owners and tickets in a single transaction"""
+        if not self.pending_owners and not self.pending_tickets:
+            return
+        # In key order, the inserts walk the tickets table instead of jumping around it
+        self.pending_tickets.sort()
+        with self.conn:
+            self.conn.executemany('insert into owners (draw_id, owner_id, name) values (?, ?, ?)', self.pending_owners)
+            self.conn.executemany('insert into tickets (draw_id, mask, owner_id) values (?, ?, ?)', self.pending_tickets)
+        self.pending_owners = []
+        self.pending_tickets = []
+
+    def count_winners(self, draw_id: int, winning_ticket: Set, min_matches: int) -> Dict[int, Dict[int, int]]:
+        """Count tickets per owner id for each number of winning numbers of at least min_matches"""
+        self.flush()
+        query = (
+            'select matches, owner_id, count(*) from '
+            f'(select owner_id, {get_matches_expression(winning_ticket)} as matches from tickets where draw_id = ?) '
+            'where matches >= ? group by matches, owner_id order by matches, owner_id'
+        )
+        counts = dict()
+        for num_winning_numbers, owner_id, count in self.conn.execute(query, (draw_id, min_matches)):
+            counts.setdefault(num_winning_numbers, dict())[owner_id] = count
+        return counts
+
+    def record_results(self, draw_id: int, winning_mask: int, results: DrawResults) -> None:
+        """Record the winning ticket and the winners of a draw"""
+        self.flush()
+        with self.conn:
+            self.conn.execute('update draws set winning_mask = ? where draw_id = ?', (winning_mask, draw_id))
+            for tier, (_, ids, counts, payouts) in results.columns.items():
+                self.conn.executemany(
+                    'insert into draw_results (draw_id, tier, owner_id, count, payout) values (?, ?, ?, ?, ?)',
+                    zip(itertools.repeat(draw_id), itertools.repeat(tier), ids, counts, payouts),
+                )
+
+    def get_masks(self, draw_id: int, name: str) -> List[int]:
+        """Get the ticket masks sold to an owner in a draw"""
+        self.flush()
+        return [mask for mask, in self.conn.execute(
+            'select t.mask from owners as o join tickets as t on t.draw_id = o.draw_id and t.owner_id = o.owner_id '
+            'where o.draw_id = ? and o.name = ? order by t.mask',
+            (draw_id, name),
+        )]
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+
+class LedgerRaffle(Raffle):
+    """Raffle that records its draws in a Ledger at path
+
+    Every Raffle starts a new draw in the ledger, which also records the
+    tickets it was created with. Tickets are unique within a draw, as a
+    Raffle sells them, and games of more than 63 numbers are not supported.
+    """
+    def __init__(self, path: str, batch_size: int = 10_000, sql_settlement: bool = False, **kwargs) -> None:
+        super().__init__(**kwargs)
+        if self.game.num_numbers > MAX_NUM_NUMBERS:
+            raise ValueError(f"A ledger only holds games of up to {MAX_NUM_NUMBERS} numbers, not {self.game}")
+        self.sql_settlement = sql_settlement
+        self.ledger = Ledger(path, batch_size)
+        self.draw_id = self.ledger.start_draw(self.pot_size)
+        store = self.tickets
+        for owner_id, name in enumerate(store.names):
+            self.ledger.add(self.draw_id, owner_id, name, store.get_masks(name))
+
+    def assign_tickets(self, name: str, tickets: Iterable[int]):
+        tickets = list(tickets)
+        is_new = name not in self.tickets
+        super().assign_tickets(name, tickets)
+        self.ledger.add(self.draw_id, self.tickets.name2id[name], name if is_new else None, tickets)
+
+    def count_winners(self, store: TicketStore, winning_mask: int, min_matches: int) -> Dict[int, Dict[int, int]]:
+        if not self.sql_settlement or store is not self.tickets:
+            return super().count_winners(store, winning_mask, min_matches)
+        return self.ledger.count_winners(self.draw_id, decode_ticket(winning_mask), min_matches)
+
+    def settle(self, winning_ticket: Set) -> DrawResults:
+        results = super().settle(winning_ticket)
+        self.ledger.record_results(self.draw_id, encode_ticket(winning_ticket), results)
+        return results
+
+    def start_draw(self):
+        super().start_draw()
+        self.draw_id = self.ledger.start_draw(self.pot_size)
+
+    def close(self):
+        self.ledger.close()
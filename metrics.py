@@ -0,0 +1,139 @@
+"""Opt-in counters and latency histograms for the Raffle hot paths
+
+A Raffle only records metrics when it is given a Metrics object:
+
+    >>> metrics = Metrics()
+    >>> raffle = Raffle(metrics=metrics)
+    >>> print(metrics.to_prometheus())
+
+The latency of a method is recorded by a timed() wrapper that the Raffle
+puts on its own instance, so without metrics the methods run unwrapped and
+the only cost left is a None check before updating a counter.
+"""
+from typing import Callable, Dict, List, Sequence, Tuple
+from bisect import bisect_left
+import functools
+import json
+import time
+
+
+# Upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, .01, .05, .1, .5, 1, 5, 10)
+
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def get_key(name: str, labels: Dict) -> Key:
+    return (name, tuple(sorted((label, str(value)) for label, value in labels.items())) if labels else ())
+
+
+def format_key(key: Key) -> str:
+    """Format a metric key as name{label="value",...}"""
+    name, labels = key
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{value}"' for label, value in labels) + '}'
+
+
+class Histogram:
+    """Number of observations per bucket, plus their count and sum"""
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # The last count is for observations above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Get (upper bound, number of observations up to it) for every bucket, ending with +Inf"""
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        total = 0
+        result = []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    """Counters and latency histograms, keyed by name and labels"""
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counters: Dict[Key, float] = dict()
+        self.histograms: Dict[Key, Histogram] = dict()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = get_key(name, labels) if labels else (name, ())
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """Get a histogram, creating it if it does not exist yet"""
+        key = get_key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        return histogram
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        self.histogram(name, **labels).observe(seconds)
+
+    def get(self, name: str, **labels) -> float:
+        """Get the value of a counter"""
+        return self.counters.get(get_key(name, labels), 0)
+
+    def snapshot(self) -> Dict:
+        return {
+            'counters': {format_key(key): value for key, value in sorted(self.counters.items())},
+            'histograms': {
+                format_key(key): {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'buckets': dict(histogram.cumulative()),
+                }
+                for key, histogram in sorted(self.histograms.items())
+            },
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self, prefix: str = 'raffle_') -> str:
+        """Export in the Prometheus text format, counters as <name>_total and histograms as <name>_seconds"""
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            metric = f'{prefix}{name}_total'
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{format_key((metric, labels))} {value}')
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            metric = f'{prefix}{name}_seconds'
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f'# TYPE {metric} histogram')
+            for bound, count in histogram.cumulative():
+                lines.append(f"{format_key((metric + '_bucket', labels + (('le', bound),)))} {count}")
+            lines.append(f"{format_key((metric + '_sum', labels))} {histogram.sum}")
+            lines.append(f"{format_key((metric + '_count', labels))} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+
+def timed(method: Callable, histogram: Histogram) -> Callable:
+    """Wrap a method to record the latency of every call in histogram, failed calls included"""
+    perf_counter = time.perf_counter
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            histogram.observe(perf_counter() - start)
+    return wrapper
@@ -1,11 +1,33 @@
-from typing import Optional, Set, Dict, List, Tuple
+from typing import Optional, Set, Dict, List, Tuple, Iterable, Iterator, Mapping, NamedTuple, Sequence, Union, TextIO
+from abc import ABC, abstractmethod
+from collections import Counter
+from collections.abc import Mapping as MappingABC
+from array import array
+from decimal import Decimal, ROUND_HALF_EVEN
 from enum import Enum, auto
+import functools
 import itertools
+import json
+import math
+import mmap
+import operator
+import os
 import random
+import sys
+import time
+
+from metrics import Metrics, timed
 
 
 INITIAL_POT_SIZE = 100
 TICKET_PRICE = 5
+# Share of the pot paid out to each group of winners, by number of winning numbers
+REWARD_PERCENTAGES = {
+    2: .1,
+    3: .15,
+    4: .25,
+    5: .5,
+}
 
 
 class State(Enum):
@@ -13,6 +35,14 @@ class State(Enum):
     ONGOING = auto()
 
 
+# Batch command ops and the menu options they correspond to
+COMMAND_OPTIONS = {
+    'new_draw': 1,
+    'buy': 2,
+    'run': 3,
+}
+
+
 def get_welcome(state: State, pot_size: Optional[int] = None) -> str:
     if state == State.NOT_STARTED:
         return (
@@ -43,39 +73,880 @@ def press_any_key():
     input("Press any key to return to main menu")
 
 
-def generate_numbers() -> Set:
+class RaffleRNG:
+    """Seedable source of randomness for ticket allocation and draws
+
+    Two RaffleRNGs with the same seed produce the same tickets and winning
+    tickets. spawn() derives independent child streams from the seed, e.g.
+    one per worker process, so parallel runs are reproducible as well.
+    Without a seed, one is taken from the operating system.
+    """
+    def __init__(self, seed: Union[int, str, None] = None) -> None:
+        self.seed = str(random.SystemRandom().getrandbits(64) if seed is None else seed)
+        self.random = random.Random(self.seed)
+        self.num_spawned = 0
+
+    def spawn(self, num_streams: int) -> List['RaffleRNG']:
+        """Get num_streams new independent streams derived from this one's seed"""
+        start = self.num_spawned
+        self.num_spawned += num_streams
+        return [RaffleRNG(f'{self.seed}/{i}') for i in range(start, start + num_streams)]
+
+    def randrange(self, stop: int) -> int:
+        return self.random.randrange(stop)
+
+    def shuffle_indices(self, num_available: int, num_tickets: int) -> List[int]:
+        """Get the swap positions of a partial Fisher-Yates shuffle picking num_tickets out of num_available
+
+        Position i is uniform over [0, num_available - 1 - i]. Scaling
+        random() is uniform up to a bias below 2**-20 for pools of up to 2**32
+        tickets and much cheaper than a randrange() call per position. Larger
+        pools use randrange().
+        """
+        positions = range(num_available - 1, num_available - 1 - num_tickets, -1)
+        if num_available > 1 << 32:
+            randrange = self.random.randrange
+            return [randrange(last + 1) for last in positions]
+        rand = self.random.random
+        return [int(rand() * (last + 1)) for last in positions]
+
+    def winning_ticket(self, num_numbers: int = 15, pick: int = 5) -> Set:
+        """Generate pick random numbers between 1-num_numbers"""
+        return set(self.random.sample(range(1, num_numbers + 1), pick))
+
+    def winning_tickets(self, num_tickets: int, num_numbers: int = 15, pick: int = 5) -> List[Set]:
+        """Generate num_tickets winning tickets in one call"""
+        sample = self.random.sample
+        numbers = range(1, num_numbers + 1)
+        return [set(sample(numbers, pick)) for _ in range(num_tickets)]
+
+
+def as_rng(rng: Union[RaffleRNG, int, str, None]) -> RaffleRNG:
+    """Get a RaffleRNG for an RNG or a seed"""
+    return rng if isinstance(rng, RaffleRNG) else RaffleRNG(rng)
+
+
+def generate_numbers(rng: Optional[RaffleRNG] = None) -> Set:
     """Generate 5 random numbers between 1-15"""
-    return set(random.sample(range(1, 16), 5))
+    if rng is None:
+        return set(random.sample(range(1, 16), 5))
+    return rng.winning_ticket()
+
+
+def encode_ticket(ticket: Iterable[int]) -> int:
+    """Encode ticket numbers as a mask, bit n-1 is set for number n"""
+    mask = 0
+    for number in ticket:
+        mask |= 1 << (number - 1)
+    return mask
+
+
+def decode_ticket(mask: int) -> Set:
+    """Decode a ticket mask back to its set of numbers"""
+    return {number for number in range(1, mask.bit_length() + 1) if mask >> (number - 1) & 1}
+
+
+@functools.lru_cache(maxsize=None)
+def get_all_tickets() -> array:
+    """Masks of all tickets of the default game, in the order of itertools.combinations"""
+    return array('H', (encode_ticket(c) for c in itertools.combinations(range(1, 16), 5)))
+
+
+@functools.lru_cache(maxsize=None)
+def get_ticket_ranks() -> Dict[int, int]:
+    """Rank of every ticket mask of the default game, its index in ALL_TICKETS"""
+    return {mask: rank for rank, mask in enumerate(get_all_tickets())}
+
+
+@functools.lru_cache(maxsize=None)
+def get_ticket_strings() -> Dict[int, str]:
+    return {mask: " ".join(str(x) for x in decode_ticket(mask)) for mask in get_all_tickets()}
+
+
+# The tables are only built when first used, so that importing the module and
+# commands that do not touch tickets stay fast. The module attributes
+# ALL_TICKETS, TICKET_RANKS and TICKET_STRINGS resolve through __getattr__.
+LAZY_TABLES = {
+    'ALL_TICKETS': get_all_tickets,
+    'TICKET_RANKS': get_ticket_ranks,
+    'TICKET_STRINGS': get_ticket_strings,
+}
+
+
+def __getattr__(name: str):
+    if name in LAZY_TABLES:
+        return LAZY_TABLES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-def generate_available_tickets():
-    """Generate all number combinations for the tickets"""
-    return list(itertools.combinations(range(1, 16), 5))
+class Game:
+    """Geometry of a raffle: a ticket is pick distinct numbers out of 1 to num_numbers
 
+    Tickets are masks ranked in the order of itertools.combinations. The
+    default 15-pick-5 game ranks and unranks through the ALL_TICKETS and
+    TICKET_RANKS tables. Other games use the combinatorial number system, so
+    games like 49-pick-6 never list their combinations. Masks are stored in
+    the smallest array type with num_numbers bits, or in a list of Python
+    ints for games of more than 64 numbers.
 
-def fmt_ticket(ticket: Set) -> str:
+    Only the stores of games of at most INDEXED_MAX_TICKETS combinations
+    can keep the prize-tier index of their sold tickets: draws of larger
+    games never sell more tickets than there are combinations, which is when
+    the index pays off.
+    """
+    def __init__(self, num_numbers: int = 15, pick: int = 5) -> None:
+        if not 0 < pick <= num_numbers:
+            raise ValueError(f"Invalid game: pick {pick} out of {num_numbers} numbers")
+        self.num_numbers = num_numbers
+        self.pick = pick
+        self.num_tickets = math.comb(num_numbers, pick)
+        self.mask_typecode = next(
+            (typecode for typecode in 'HIQ' if array(typecode).itemsize * 8 >= num_numbers), None,
+        )
+        # binomials[n][k] is n choose k
+        self.binomials = [[math.comb(n, k) for k in range(pick + 1)] for n in range(num_numbers + 1)]
+        self.is_default = (num_numbers, pick) == (15, 5)
+        self.indexed = self.num_tickets <= INDEXED_MAX_TICKETS
+
+    @functools.cached_property
+    def table(self) -> Optional[array]:
+        """All tickets by rank, for the default game"""
+        return get_all_tickets() if self.is_default else None
+
+    @functools.cached_property
+    def ranks(self) -> Optional[Dict[int, int]]:
+        """Rank of every ticket, for the default game"""
+        return get_ticket_ranks() if self.is_default else None
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Game) and (self.num_numbers, self.pick) == (other.num_numbers, other.pick)
+
+    def __hash__(self) -> int:
+        return hash((self.num_numbers, self.pick))
+
+    def __repr__(self) -> str:
+        return f'Game({self.num_numbers}, {self.pick})'
+
+    def new_masks(self, masks: Iterable[int] = ()) -> Union[array, List[int]]:
+        """Get a new compact sequence of ticket masks"""
+        return list(masks) if self.mask_typecode is None else array(self.mask_typecode, masks)
+
+    def new_ticket_store(self, indexed: bool = False) -> 'TicketStore':
+        return TicketStore(self.mask_typecode, indexed and self.indexed)
+
+    def rank(self, mask: int) -> Optional[int]:
+        """Get the rank of a ticket, or None if it is not a ticket of this game
+
+        The lexicographic rank is num_tickets - 1 minus the combinatorial
+        number of the complemented numbers.
+        """
+        if self.ranks is not None:
+            return self.ranks.get(mask)
+        if mask < 0 or mask >> self.num_numbers or mask.bit_count() != self.pick:
+            return None
+        binomials = self.binomials
+        last = self.num_numbers - 1
+        k = self.pick
+        dual = 0
+        while mask:
+            low = mask & -mask
+            dual += binomials[last - low.bit_length() + 1][k]
+            k -= 1
+            mask ^= low
+        return self.num_tickets - 1 - dual
+
+    def unrank(self, rank: int) -> int:
+        """Get the ticket of a rank in [0, num_tickets)"""
+        if self.table is not None:
+            return self.table[rank]
+        binomials = self.binomials
+        last = self.num_numbers - 1
+        dual = self.num_tickets - 1 - rank
+        mask = 0
+        d = last
+        for k in range(self.pick, 0, -1):
+            while binomials[d][k] > dual:
+                d -= 1
+            dual -= binomials[d][k]
+            mask |= 1 << (last - d)
+            d -= 1
+        return mask
+
+    def winning_ticket(self, rng: RaffleRNG) -> Set:
+        return rng.winning_ticket(self.num_numbers, self.pick)
+
+
+INDEXED_MAX_TICKETS = 1 << 16
+
+
+# With fewer tickets per owner, merging the per-ticket owner counts of the
+# index costs more than counting every ticket, see Raffle.count_winners
+INDEX_MIN_TICKETS_PER_OWNER = 16
+
+
+DEFAULT_GAME = Game()
+
+
+def generate_available_tickets() -> array:
+    """Generate all number combinations for the tickets, encoded as masks"""
+    return array('H', get_all_tickets())
+
+
+class TicketAllocator:
+    """Pool of available tickets with O(1) construction and O(1) random allocation
+
+    The pool is a virtual array of ticket ranks, rank i standing for the
+    ticket game.unrank(i) (or masks[i] for a custom pool). It starts out as
+    0, 1, 2, ... and only the positions changed by taking tickets out are
+    stored, together with the position of every moved or sold rank. A new
+    pool therefore allocates nothing, and its memory grows with the number
+    of tickets sold rather than with the number of combinations.
+
+    A ticket is taken out by swapping a random position with the last one
+    and shrinking the array by one, so sold ranks end up past its end.
+    """
+    def __init__(
+        self,
+        masks: Optional[Iterable[int]] = None,
+        rng: Optional[RaffleRNG] = None,
+        game: Optional[Game] = None,
+    ) -> None:
+        self.game = DEFAULT_GAME if game is None else game
+        if masks is None:
+            self.rank = self.game.rank
+            self.unrank = self.game.unrank
+            self.size = self.game.num_tickets
+        else:
+            universe = self.game.new_masks(masks)
+            self.rank = {mask: rank for rank, mask in enumerate(universe)}.get
+            self.unrank = universe.__getitem__
+            self.size = len(universe)
+        self.rng = RaffleRNG() if rng is None else rng
+        self.pos2rank: Dict[int, int] = dict()
+        self.rank2pos: Dict[int, int] = dict()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[int]:
+        unrank = self.unrank
+        pos2rank = self.pos2rank
+        return (unrank(pos2rank.get(pos, pos)) for pos in range(self.size))
+
+    def __contains__(self, mask: object) -> bool:
+        rank = self.rank(mask) if isinstance(mask, int) else None
+        return rank is not None and self.rank2pos.get(rank, rank) < self.size
+
+    def take(self, pos: int) -> int:
+        """Swap the rank at pos with the last one, shrink the pool and return the rank"""
+        pos2rank = self.pos2rank
+        rank2pos = self.rank2pos
+        last = self.size - 1
+        rank = pos2rank.get(pos, pos)
+        last_rank = pos2rank.pop(last, last)
+        if pos != last:
+            pos2rank[pos] = last_rank
+            rank2pos[last_rank] = pos
+        rank2pos[rank] = last
+        self.size = last
+        return rank
+
+    def remove(self, tickets: Iterable[int]) -> None:
+        """Take specific tickets out of the pool"""
+        for mask in tickets:
+            rank = self.rank(mask)
+            if rank is None:
+                continue
+            pos = self.rank2pos.get(rank, rank)
+            if pos < self.size:
+                self.take(pos)
+
+    def draw(self) -> int:
+        """Take a single random ticket out of the pool"""
+        if self.size == 0:
+            raise RuntimeError("No more available tickets!")
+        return self.unrank(self.take(self.rng.randrange(self.size)))
+
+    def allocate(self, num_tickets: int) -> array:
+        """Take up to num_tickets unique random tickets out of the pool in one call
+
+        Runs a partial Fisher-Yates shuffle that moves the picked tickets to
+        the end of the pool. They are returned in the order they end up in
+        there, the last one picked first.
+        """
+        num_tickets = min(num_tickets, self.size)
+        pos2rank = self.pos2rank
+        rank2pos = self.rank2pos
+        last = self.size - 1
+        ranks = []
+        # take() inlined, this loop runs once per ticket sold
+        for pos in self.rng.shuffle_indices(self.size, num_tickets):
+            rank = pos2rank.get(pos, pos)
+            last_rank = pos2rank.pop(last, last)
+            if pos != last:
+                pos2rank[pos] = last_rank
+                rank2pos[last_rank] = pos
+            rank2pos[rank] = last
+            ranks.append(rank)
+            last -= 1
+        self.size = last + 1
+        ranks.reverse()
+        return self.game.new_masks(map(self.unrank, ranks))
+
+
+def fmt_ticket(ticket: Union[int, Set]) -> str:
+    if isinstance(ticket, int):
+        ticket_str = get_ticket_strings().get(ticket)
+        return " ".join(str(x) for x in decode_ticket(ticket)) if ticket_str is None else ticket_str
     return " ".join(str(x) for x in ticket)
 
 
+class Sink(ABC):
+    """Receiver of the events a Raffle emits instead of printing
+
+    Events are 'new_draw' (pot_size), 'tickets_bought' (name, tickets as
+    masks, no_more_tickets), 'raffle_run' (winning_ticket as a mask) and
+    'draw_results' (results as returned by get_group_results).
+    """
+    @abstractmethod
+    def emit(self, event: str, data: Dict) -> None:
+        pass
+
+
+class NullSink(Sink):
+    """Sink that drops all events, e.g. for benchmarks"""
+    def emit(self, event: str, data: Dict) -> None:
+        pass
+
+
+class ConsoleSink(Sink):
+    """Sink that renders events as text and writes every event in a single chunk
+
+    Writes go to sys.stdout, looked up on every event so redirection keeps
+    working, unless another file is given.
+    """
+    def __init__(self, file: Optional[TextIO] = None) -> None:
+        self.file = file
+
+    def emit(self, event: str, data: Dict) -> None:
+        file = sys.stdout if self.file is None else self.file
+        file.write("\n".join(self.render(event, data)) + "\n")
+
+    def render(self, event: str, data: Dict) -> List[str]:
+        if event == 'new_draw':
+            return [f"New Raffle draw has been started. Initial pot size: ${data['pot_size']}"]
+        if event == 'tickets_bought':
+            tickets = data['tickets']
+            lines = [f"Hi {data['name']}, you have purchased {len(tickets)} ticket(s)"]
+            lines.extend(f"Ticket {i}: {fmt_ticket(ticket)}" for i, ticket in enumerate(tickets, 1))
+            if data['no_more_tickets']:
+                lines.append("No more available tickets!")
+            return lines
+        if event == 'raffle_run':
+            return ["Running Raffle...", f"Winning ticket is {fmt_ticket(data['winning_ticket'])}", ""]
+        if event == 'draw_results':
+            results = data['results']
+            lines = []
+            for group_number in sorted(results.keys()):
+                group_results = results[group_number]
+                lines.append(f"Group {group_number} Winners:")
+                if len(group_results) == 0:
+                    lines.extend(["Nil", ""])
+                    continue
+                lines.extend(
+                    f"{res['name']} with {res['count']} winning ticket(s)- ${res['payout']}"
+                    for res in group_results
+                )
+                lines.append("")
+            return lines
+        raise ValueError(f"Invalid event: {event}")
+
+
+class JSONLinesSink(Sink):
+    """Sink that writes every event as a line of JSON, with tickets as sorted lists of numbers"""
+    def __init__(self, file: TextIO) -> None:
+        self.file = file
+
+    def emit(self, event: str, data: Dict) -> None:
+        data = dict(data, event=event)
+        if 'tickets' in data:
+            data['tickets'] = [sorted(decode_ticket(ticket)) for ticket in data['tickets']]
+        if 'winning_ticket' in data:
+            data['winning_ticket'] = sorted(decode_ticket(data['winning_ticket']))
+        if 'results' in data:
+            data['results'] = dict(data['results'])
+        self.file.write(json.dumps(data) + "\n")
+
+
+def get_matching_tickets(winning_mask: int, min_matches: int, num_numbers: int = 15) -> List[Tuple[int, int]]:
+    """Get (mask, number of matching numbers) for every ticket that shares at least min_matches numbers with the winning ticket"""
+    numbers = range(1, num_numbers + 1)
+    hits = [1 << (number - 1) for number in numbers if winning_mask >> (number - 1) & 1]
+    misses = [1 << (number - 1) for number in numbers if not winning_mask >> (number - 1) & 1]
+    tickets = []
+    for num_matches in range(min_matches, len(hits) + 1):
+        for hit in itertools.combinations(hits, num_matches):
+            hit_mask = sum(hit)
+            for miss in itertools.combinations(misses, len(hits) - num_matches):
+                tickets.append((hit_mask + sum(miss), num_matches))
+    return tickets
+
+
+class TicketStore:
+    """Compact store of the tickets sold in a draw
+
+    Every ticket is kept as a mask in an array of typecode (a list for
+    games of more than 64 numbers) with the id of its owner in a parallel
+    array. Owner names are interned to ids in the order
+    they first buy, and the index ranges of each owner's tickets are kept so
+    a single owner's tickets can be looked up without a scan.
+
+    If indexed, the store also keeps an index that is updated as tickets
+    are added: the number of sold tickets per mask and, per mask, the number
+    of those tickets per owner id. Settlement can then visit the distinct
+    winning tickets instead of every sold ticket. The index only pays off
+    when tickets repeat, so only stores of imported tickets keep it: a draw
+    sells each ticket at most once.
+    """
+    def __init__(self, typecode: Optional[str] = 'H', indexed: bool = False) -> None:
+        self.masks: Union[array, List[int]] = [] if typecode is None else array(typecode)
+        self.indexed = indexed
+        self.owners = array('I')
+        self.names: List[str] = []
+        self.name2id: Dict[str, int] = dict()
+        self.spans: List[List[Tuple[int, int]]] = []
+        self.ticket_counts: Counter = Counter()
+        self.ticket_owners: Dict[int, Dict[int, int]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.name2id
+
+    def get_owner_id(self, name: str) -> int:
+        """Get the id of an owner, interning the name if it is new"""
+        owner_id = self.name2id.get(name)
+        if owner_id is None:
+            owner_id = len(self.names)
+            self.name2id[name] = owner_id
+            self.names.append(name)
+            self.spans.append([])
+        return owner_id
+
+    def add(self, name: str, masks: Iterable[int]) -> int:
+        """Add ticket masks for an owner, returns the owner id"""
+        owner_id = self.get_owner_id(name)
+        start = len(self.masks)
+        self.masks.extend(masks)
+        end = len(self.masks)
+        if end > start:
+            self.owners.extend(itertools.repeat(owner_id, end - start))
+            self.spans[owner_id].append((start, end))
+        if end > start and self.indexed:
+            owner_ticket_counts = Counter(self.masks[start:end])
+            self.ticket_counts.update(owner_ticket_counts)
+            for mask, count in owner_ticket_counts.items():
+                owner2count = self.ticket_owners.setdefault(mask, dict())
+                owner2count[owner_id] = owner2count.get(owner_id, 0) + count
+        return owner_id
+
+    def count_winners(self, winning_mask: int, min_matches: int, num_numbers: int = 15) -> Dict[int, Dict[int, int]]:
+        """Count winning tickets per owner id for each number of winning numbers using the index
+
+        Only the tickets sharing at least min_matches numbers with the winning
+        ticket are visited. Owners are listed in the order of their ids.
+        """
+        counts = dict()
+        ticket_counts = self.ticket_counts
+        ticket_owners = self.ticket_owners
+        for mask, num_winning_numbers in get_matching_tickets(winning_mask, min_matches, num_numbers):
+            if not ticket_counts.get(mask):
+                continue
+            owner2count = counts.setdefault(num_winning_numbers, dict())
+            for owner_id, count in ticket_owners[mask].items():
+                owner2count[owner_id] = owner2count.get(owner_id, 0) + count
+        return {
+            num_winning_numbers: dict(sorted(owner2count.items()))
+            for num_winning_numbers, owner2count in counts.items()
+        }
+
+    def get_masks(self, name: str) -> List[int]:
+        """Get the ticket masks of an owner"""
+        return [
+            mask
+            for start, end in self.spans[self.name2id[name]]
+            for mask in self.masks[start:end]
+        ]
+
+    def to_name2tickets(self) -> Dict[str, List[Set]]:
+        """Convert to the mapping from name to a list of ticket sets"""
+        return {
+            name: [decode_ticket(mask) for mask in self.get_masks(name)]
+            for name in self.names
+        }
+
+    @classmethod
+    def from_name2tickets(cls, name2tickets: Mapping[str, Iterable[Iterable[int]]]) -> 'TicketStore':
+        """Create a store from a mapping from name to a list of tickets"""
+        store = cls(indexed=True)
+        for name, tickets in name2tickets.items():
+            store.add(name, (encode_ticket(ticket) for ticket in tickets))
+        return store
+
+
+def count_matches(masks: Iterable[int], owners: Iterable[int], winning_mask: int) -> Counter:
+    """Count tickets per (number of winning numbers, owner id) in one batched pass
+
+    The AND with the winning mask, the popcount and the counting all run
+    in C via map() and Counter, without any per-ticket Python code.
+    """
+    return Counter(zip(map(int.bit_count, map(winning_mask.__and__, masks)), owners))
+
+
+@functools.lru_cache(maxsize=None)
+def get_tier_selector(num_winning_numbers: int) -> bytes:
+    """Translation table that maps num_winning_numbers to 1 and every other byte to 0"""
+    return bytes(int(i == num_winning_numbers) for i in range(256))
+
+
+def count_tiers(
+    masks: Iterable[int], owners: Iterable[int], winning_mask: int, min_matches: int, max_matches: int = 5,
+) -> Dict[int, Counter]:
+    """Count tickets per owner id for each number of winning numbers of at least min_matches
+
+    The number of winning numbers of every ticket is computed once into a
+    bytes object. For each prize tier, a counting pass then picks the owner
+    ids of its tickets and counts them, all in C. Owners are listed in the
+    order of their first ticket in the tier, as with count_matches().
+    """
+    matches = bytes(map(int.bit_count, map(winning_mask.__and__, masks)))
+    counts = dict()
+    for num_winning_numbers in range(min_matches, max_matches + 1):
+        owner2count = Counter(itertools.compress(owners, matches.translate(get_tier_selector(num_winning_numbers))))
+        if owner2count:
+            counts[num_winning_numbers] = owner2count
+    return counts
+
+
+def count_matches_distinct(masks: Iterable[int], owners: Iterable[int], match_row: bytes) -> Dict[int, Dict[int, int]]:
+    """Count tickets per owner id for each number of winning numbers
+
+    Every distinct (ticket, owner) pair is looked up once in match_row, the
+    row of a MatchTable for the winning ticket, together with its multiplicity.
+    """
+    ranks = get_ticket_ranks()
+    counts = dict()
+    for (mask, owner_id), count in Counter(zip(masks, owners)).items():
+        owner2count = counts.setdefault(match_row[ranks[mask]], dict())
+        owner2count[owner_id] = owner2count.get(owner_id, 0) + count
+    return counts
+
+
+def to_cents(amount: Union[int, float, Decimal]) -> int:
+    """Convert an amount of dollars to whole cents, rounding half to even"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), ROUND_HALF_EVEN))
+
+
+def from_cents(cents: int) -> Union[int, float]:
+    """Convert whole cents to dollars, as an int for whole dollars"""
+    return cents // 100 if cents % 100 == 0 else cents / 100
+
+
+def get_tier_cents(pot_cents: int, percentage: float) -> int:
+    """Share of the pot for a prize tier in whole cents, rounded down so the pot never goes negative"""
+    return int(pot_cents * Decimal(str(percentage)))
+
+
+def split_cents(total_cents: int, counts: List[int]) -> List[int]:
+    """Split total_cents in proportion to counts with the largest remainder method
+
+    Every share is rounded down to whole cents in one batched pass, then the
+    cents left over go one each to the shares with the largest remainders,
+    the earliest first on ties. The shares always add up to total_cents and
+    the same counts are always split the same way.
+    """
+    total_count = sum(counts)
+    if total_count == 0:
+        return [0] * len(counts)
+    quotas = list(map(total_cents.__mul__, counts))
+    shares = list(map(operator.floordiv, quotas, itertools.repeat(total_count)))
+    remainders = list(map(operator.mod, quotas, itertools.repeat(total_count)))
+    leftover = total_cents - sum(shares)
+    if leftover:
+        # sorted() is stable, so equal remainders stay in order
+        for i in sorted(range(len(shares)), key=remainders.__getitem__, reverse=True)[:leftover]:
+            shares[i] += 1
+    return shares
+
+
+MATCH_TABLE_FORMAT = b'raffle-match-table/1\n'
+
+
+def get_match_table_header() -> bytes:
+    """Header of a MatchTable file: the format version and a hash of the rank order of ALL_TICKETS"""
+    import hashlib
+    return MATCH_TABLE_FORMAT + hashlib.sha256(array('Q', get_all_tickets()).tobytes()).digest()
+
+
+def get_cache_dir() -> str:
+    """Per-user cache directory, $XDG_CACHE_HOME/raffle or ~/.cache/raffle"""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'raffle')
+
+
+class MatchTable:
+    """Number of matching numbers for every pair of tickets
+
+    The table is a 3003x3003 uint8 matrix indexed by ticket rank (the index
+    of the ticket in ALL_TICKETS). It is built on first use, cached in a file
+    and memory-mapped, so later processes only pay for opening the file.
+    The default file is in the per-user get_cache_dir(). The table follows a
+    header with the format version and a hash of the rank order, and a file
+    with another header or size is rebuilt rather than trusted.
+    """
+    size = math.comb(15, 5)
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = os.path.join(get_cache_dir(), 'match_table.u8') if path is None else path
+        self._table: Optional[mmap.mmap] = None
+        self.offset = 0
+
+    def is_valid(self, header: bytes) -> bool:
+        """Whether the cache file holds a complete table for header"""
+        try:
+            with open(self.path, 'rb') as f:
+                return (f.read(len(header)) == header
+                        and os.fstat(f.fileno()).st_size == len(header) + self.size * self.size)
+        except FileNotFoundError:
+            return False
+
+    @property
+    def table(self) -> mmap.mmap:
+        if self._table is None:
+            header = get_match_table_header()
+            if not self.is_valid(header):
+                self.build()
+            with open(self.path, 'rb') as f:
+                table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if table[:len(header)] != header:
+                table.close()
+                raise RuntimeError(f"MatchTable file {self.path} changed while it was opened")
+            self._table = table
+            self.offset = len(header)
+        return self._table
+
+    def build(self) -> None:
+        """Compute the table and write it with its header to the cache file atomically"""
+        import tempfile
+        all_tickets = get_all_tickets()
+        popcounts = bytes(i.bit_count() for i in range(1 << 15))
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dirname, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(get_match_table_header())
+                for mask in all_tickets:
+                    f.write(bytes(popcounts[mask & other] for other in all_tickets))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def row(self, mask: int) -> bytes:
+        """Number of matching numbers of every ticket with the given ticket, indexed by rank"""
+        table = self.table
+        start = self.offset + get_ticket_ranks()[mask] * self.size
+        return table[start:start + self.size]
+
+    def get(self, mask: int, other: int) -> int:
+        table = self.table
+        ranks = get_ticket_ranks()
+        return table[self.offset + ranks[mask] * self.size + ranks[other]]
+
+    def close(self) -> None:
+        if self._table is not None:
+            self._table.close()
+            self._table = None
+
+
+def group_matches(counts: Mapping[Tuple[int, int], int], min_matches: int) -> Dict[int, Dict[int, int]]:
+    """Turn counts per (number of winning numbers, owner id) into owner id counts per number of winning numbers"""
+    groups = dict()
+    for (num_winning_numbers, owner_id), count in counts.items():
+        if num_winning_numbers >= min_matches:
+            groups.setdefault(num_winning_numbers, dict())[owner_id] = count
+    return groups
+
+
+class TicketsView(MappingABC):
+    """Read-only mapping from name to a list of ticket sets backed by a TicketStore"""
+    def __init__(self, store: TicketStore) -> None:
+        self.store = store
+
+    def __getitem__(self, name: str) -> List[Set]:
+        if name not in self.store:
+            raise KeyError(name)
+        return [decode_ticket(mask) for mask in self.store.get_masks(name)]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.store.names)
+
+    def __len__(self) -> int:
+        return len(self.store.names)
+
+
+class TierWinners(MappingABC):
+    """Read-only mapping from name to number of winning tickets in a prize tier
+
+    Backed by parallel arrays of owner ids (indexing names) and counts, as
+    they come out of settlement, so no dict keyed by name is built unless
+    a name is looked up.
+    """
+    def __init__(self, names: Sequence[str], ids: array, counts: array) -> None:
+        self.names = names
+        self.ids = ids
+        self.counts = counts
+        self._positions: Optional[Dict[str, int]] = None
+
+    def __getitem__(self, name: str) -> int:
+        if self._positions is None:
+            names = self.names
+            self._positions = {names[owner_id]: i for i, owner_id in enumerate(self.ids)}
+        return self.counts[self._positions[name]]
+
+    def __iter__(self) -> Iterator[str]:
+        return map(self.names.__getitem__, self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class TierColumns(NamedTuple):
+    """Results of a prize tier as parallel arrays, ids indexing names"""
+    names: Sequence[str]
+    ids: array
+    counts: array
+    payouts: array
+
+
+class DrawResults(MappingABC):
+    """Results of a draw: a mapping from prize tier to its list of winners
+
+    The results are kept per tier as TierColumns. The list of
+    {'name', 'count', 'payout'} dicts of a tier is only built when the tier
+    is looked up, then cached.
+    """
+    def __init__(self, columns: Dict[int, TierColumns]) -> None:
+        self.columns = columns
+        self.rows: Dict[int, List[Dict]] = dict()
+
+    def __getitem__(self, group_number: int) -> List[Dict]:
+        rows = self.rows.get(group_number)
+        if rows is None:
+            names, ids, counts, payouts = self.columns[group_number]
+            rows = self.rows[group_number] = [
+                {'name': names[owner_id], 'count': count, 'payout': payout}
+                for owner_id, count, payout in zip(ids, counts, payouts)
+            ]
+        return rows
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.columns)
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+
+def as_ticket_store(tickets: Union[TicketStore, TicketsView, Mapping], game: Optional[Game] = None) -> TicketStore:
+    """Get a TicketStore for sold tickets given in any of the supported forms"""
+    if isinstance(tickets, TicketStore):
+        return tickets
+    if isinstance(tickets, TicketsView):
+        return tickets.store
+    if game is None:
+        return TicketStore.from_name2tickets(tickets)
+    store = game.new_ticket_store(indexed=True)
+    for name, name_tickets in tickets.items():
+        store.add(name, (encode_ticket(ticket) for ticket in name_tickets))
+    return store
+
+
 class Raffle:
+    # Methods whose latency is recorded when metrics are enabled
+    timed_methods = ('buy_tickets', 'get_ticket', 'get_groups', 'get_group_results', 'settle', 'handle_run_raffle')
+
     def __init__(
         self,
         state: Optional[State] = None,
         pot_size: Optional[int] = None,
         name2tickets: Optional[Dict] = None,
-        available_tickets: Optional[List] = None,
+        available_tickets: Optional[Iterable[int]] = None,
+        match_table: Optional[MatchTable] = None,
+        sink: Optional[Sink] = None,
+        ticket_price: Optional[float] = None,
+        reward_percentages: Optional[Dict[int, float]] = None,
+        rng: Union[RaffleRNG, int, str, None] = None,
+        game: Optional[Game] = None,
+        exact_payouts: bool = False,
+        metrics: Optional[Metrics] = None,
     ) -> None:
+        self.rng = as_rng(rng)
+        self.game = DEFAULT_GAME if game is None else game
         self.state = State.NOT_STARTED if state is None else state
         self.pot_size = INITIAL_POT_SIZE if pot_size is None else pot_size
-        self.name2tickets = dict() if name2tickets is None else name2tickets
+        self.tickets = self.game.new_ticket_store() if name2tickets is None else as_ticket_store(name2tickets, self.game)
         self.available_tickets = (
-            generate_available_tickets() if available_tickets is None else available_tickets
+            available_tickets if isinstance(available_tickets, TicketAllocator)
+            else TicketAllocator(available_tickets, self.rng, self.game)
         )
+        if match_table is not None and self.game != DEFAULT_GAME:
+            raise ValueError(f"A MatchTable only covers {DEFAULT_GAME}, not {self.game}")
+        self.match_table = match_table
+        self.sink = ConsoleSink() if sink is None else sink
+        self.ticket_price = TICKET_PRICE if ticket_price is None else ticket_price
+        self.reward_percentages = REWARD_PERCENTAGES if reward_percentages is None else reward_percentages
+        if not self.reward_percentages or not all(1 <= n <= self.game.pick for n in self.reward_percentages):
+            raise ValueError(f"Invalid prize tiers for {self.game}: {sorted(self.reward_percentages)}")
+        # Keep the pot in whole cents and split every tier exactly, see calc_payout_per_user
+        self.exact_payouts = exact_payouts
+        self._metrics = None
+        self.metrics = metrics
         self.reward = 0
         self.draw_results = dict()
 
+    @property
+    def metrics(self) -> Optional[Metrics]:
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: Optional[Metrics]) -> None:
+        """Enable or disable metrics
+
+        Enabling them puts a timed wrapper around each of timed_methods on
+        this instance, so a Raffle without metrics calls its methods as is.
+        """
+        self._metrics = metrics
+        for name in self.timed_methods:
+            self.__dict__.pop(name, None)
+            if metrics is not None:
+                setattr(self, name, timed(getattr(self, name), metrics.histogram(name)))
+
+    @property
+    def name2tickets(self) -> TicketsView:
+        """Sold tickets as a mapping from name to a list of ticket sets"""
+        return TicketsView(self.tickets)
+
+    @name2tickets.setter
+    def name2tickets(self, name2tickets: Mapping) -> None:
+        self.tickets = as_ticket_store(name2tickets, self.game)
+
     def update_pot_size(self, val: int = 0) -> int:
-        self.pot_size += val
+        if self.exact_payouts:
+            self.pot_size = from_cents(to_cents(self.pot_size) + to_cents(val))
+        else:
+            self.pot_size += val
         return self.pot_size
 
     def get_new_state(self, option: int) -> State:
@@ -92,14 +963,14 @@ class Raffle:
             raise ValueError(f"Invalid state transition (option={option}, old_state={self.state})")
 
     def reset_available_tickets(self):
-        self.available_tickets = generate_available_tickets()
+        self.available_tickets = TicketAllocator(rng=self.rng, game=self.game)
 
-    def get_ticket(self) -> Set:
-        """Get a random new ticket from available tickets"""
-        if len(self.available_tickets) == 0:
-            raise RuntimeError("No more available tickets!")
-        i = random.randrange(0, len(self.available_tickets))
-        return set(self.available_tickets.pop(i))
+    def get_ticket(self) -> int:
+        """Get a random new ticket mask from available tickets"""
+        ticket = self.available_tickets.draw()
+        if self._metrics is not None:
+            self._metrics.inc('tickets_allocated')
+        return ticket
 
     def get_name_and_num_tickets(self) -> Tuple[str, int]:
         rawstr = input("Enter your name, number of tickets to purchase (for e.g. a valid input will be James,1)\n")
@@ -113,61 +984,97 @@ class Raffle:
         return name, num_tickets
 
 
-    def buy_tickets(self, name: str, num_tickets: int):
-        if name in self.name2tickets:
+    def allocate_tickets(self, name: str, num_tickets: int) -> array:
+        """Take up to num_tickets random tickets out of the available tickets for name"""
+        if name in self.tickets:
             raise ValueError(f"Invalid input: {name} has purchased tickets already")
-        tickets = []
-        no_more_tickets = False
-        try:
-            for _ in range(num_tickets):
-                tickets.append(self.get_ticket())
-        except RuntimeError:
-            no_more_tickets = True
-        self.name2tickets[name] = tickets
-        print(f"Hi {name}, you have purchased {len(tickets)} ticket(s)")
-        for i, ticket in enumerate(tickets):
-            print(f"Ticket {i+1}: {fmt_ticket(ticket)}")
-        if no_more_tickets:
-            print("No more available tickets!")
-        self.update_pot_size(len(tickets) * TICKET_PRICE)
+        tickets = self.available_tickets.allocate(num_tickets)
+        if self._metrics is not None:
+            self._metrics.inc('tickets_allocated', len(tickets))
+        return tickets
+
+    def assign_tickets(self, name: str, tickets: Iterable[int]):
+        """Record tickets as sold to name and add their price to the pot"""
+        owner_id = self.tickets.add(name, tickets)
+        num_tickets = sum(end - start for start, end in self.tickets.spans[owner_id])
+        self.update_pot_size(num_tickets * self.ticket_price)
+
+    def purchase(self, name: str, num_tickets: int) -> array:
+        """Allocate up to num_tickets tickets for name and record them as sold"""
+        tickets = self.allocate_tickets(name, num_tickets)
+        self.assign_tickets(name, tickets)
+        return tickets
+
+    def buy_tickets(self, name: str, num_tickets: int):
+        tickets = self.purchase(name, num_tickets)
+        no_more_tickets = len(tickets) < num_tickets
+        self.sink.emit('tickets_bought', {
+            'name': name,
+            'tickets': tickets,
+            'no_more_tickets': no_more_tickets,
+        })
 
     def handle_buy_tickets(self):
         name, num_tickets = self.get_name_and_num_tickets()
         self.buy_tickets(name, num_tickets)
 
-    def get_groups(self, name2tickets: Dict, winning_ticket: Set) -> Dict[int, List[Tuple[str, Set]]]:
-        """Mapping from number of winning numbers to a list of tuples of (name, ticket)"""
+    def get_groups(self, name2tickets: Union[TicketStore, Mapping], winning_ticket: Set) -> Dict[int, TierWinners]:
+        """Mapping from number of winning numbers to a mapping from name to number of tickets"""
+        store = as_ticket_store(name2tickets, self.game)
+        names = store.names
         groups = {
-            2: [],
-            3: [],
-            4: [],
-            5: [],
+            group_number: TierWinners(names, array('I'), array('Q'))
+            for group_number in sorted(self.reward_percentages)
         }
-        for name, tickets in name2tickets.items():
-            for ticket in tickets:
-                num_winning_numbers = len(winning_ticket.intersection(ticket))
-                if num_winning_numbers in groups:
-                    groups[num_winning_numbers].append((name, ticket))
+        counts = self.count_winners(store, encode_ticket(winning_ticket), min(groups))
+        for num_winning_numbers, owner2count in counts.items():
+            if num_winning_numbers in groups:
+                groups[num_winning_numbers] = TierWinners(
+                    names, array('I', owner2count.keys()), array('Q', owner2count.values()),
+                )
+        if self._metrics is not None:
+            self._metrics.inc('tickets_settled', len(store))
+            for group_number, winners in groups.items():
+                self._metrics.inc('winners', len(winners.ids), tier=group_number)
+                self._metrics.inc('winning_tickets', sum(winners.counts), tier=group_number)
         return groups
 
-    def aggregate_winners(self, name_ticket_tuples: List[Tuple[str, Set]]) -> Dict[str, int]:
-        """Aggregate counts"""
-        ticket_counts = dict()
-        for name, _ in name_ticket_tuples:
-            if name not in ticket_counts:
-                ticket_counts[name] = 0
-            ticket_counts[name] += 1
-        return ticket_counts
+    def count_winners(self, store: TicketStore, winning_mask: int, min_matches: int) -> Dict[int, Dict[int, int]]:
+        """Count tickets per owner id for each number of winning numbers of at least min_matches
+
+        Indexed stores with more tickets than there are combinations, and at
+        least INDEX_MIN_TICKETS_PER_OWNER tickets per owner, go through the
+        index. Other stores are counted per tier over the arrays of masks and
+        owner ids with count_tiers().
+        """
+        game = self.game
+        if self.match_table is not None:
+            counts = count_matches_distinct(store.masks, store.owners, self.match_table.row(winning_mask))
+            return {n: owner2count for n, owner2count in counts.items() if n >= min_matches}
+        num_tickets = len(store)
+        if (store.indexed and num_tickets > game.num_tickets
+                and num_tickets >= INDEX_MIN_TICKETS_PER_OWNER * len(store.names)):
+            return store.count_winners(winning_mask, min_matches, game.num_numbers)
+        return count_tiers(store.masks, store.owners, winning_mask, min_matches, game.pick)
+
+    def aggregate_winners(self, name2count: Mapping[str, int]) -> Dict[str, int]:
+        """Aggregate counts, leaving out names without winning tickets"""
+        return {name: count for name, count in name2count.items() if count > 0}
+
+    def split_reward(self, counts: Sequence[int], reward: float) -> List[float]:
+        """Split reward in proportion to counts
+
+        With exact_payouts, reward is split in whole cents with split_cents,
+        so the payouts add up to exactly the reward.
+        """
+        if self.exact_payouts:
+            return list(map((100).__rtruediv__, split_cents(to_cents(reward), counts)))
+        total_count = sum(counts)
+        return [reward * count/total_count for count in counts]
 
     def calc_payout_per_user(self, user2count: Dict[str, int], reward: float) -> Dict[str, float]:
         """Calculate payout per user"""
-        total_count = sum(user2count.values())
-        
-        return {
-            name: reward * count/total_count
-            for name, count
-            in user2count.items()
-        }
+        return dict(zip(user2count, self.split_reward(list(user2count.values()), reward)))
 
     def decr_reward_from_pot(self):
         """Remove awarded money from pot and zero reward"""
@@ -175,12 +1082,15 @@ class Raffle:
         self.reward = 0
 
     def get_winning_ticket(self) -> Set:
-        return generate_numbers()
+        return self.game.winning_ticket(self.rng)
 
-    def get_group_results(self, groups: Dict[int, List[Tuple[str, Set]]]) -> Tuple[Dict[int, List[Dict]], float]:
+    def get_group_results(self, groups: Mapping[int, Mapping[str, int]]) -> Tuple[DrawResults, float]:
         """Get a tuple of (results, total_reward)
 
-        Results are grouped by number in list of dicts: 
+        The tiers of get_groups() are paid out straight from their arrays of
+        owner ids and counts, other mappings from name to count go through
+        aggregate_winners() and calc_payout_per_user(). Results are grouped
+        by number in list of dicts:
         {
             2: [
                 {
@@ -193,64 +1103,69 @@ class Raffle:
             ...
         }
         """
-        reward_percentages = {
-            2: .1,
-            3: .15,
-            4: .25,
-            5: .5,
-        }
+        reward_percentages = self.reward_percentages
+        pot_cents = to_cents(self.pot_size) if self.exact_payouts else None
         total_reward = 0
-        results = dict()
-        for group_number, name_ticket_tuples in groups.items():
-            results[group_number] = []
-            group_reward = reward_percentages[group_number] * self.pot_size
-            if len(name_ticket_tuples) == 0:
-                continue
-            name2ticket_count = self.aggregate_winners(name_ticket_tuples)
-            name2payout = self.calc_payout_per_user(name2ticket_count, group_reward)
-            for name, payout in name2payout.items():
-                count = name2ticket_count[name]
-                total_reward += payout
-                results[group_number].append({
-                    'name': name,
-                    'count': count,
-                    'payout': payout,
-                })
-        return results, total_reward
+        columns = dict()
+        for group_number, name2count in groups.items():
+            if self.exact_payouts:
+                group_reward = from_cents(get_tier_cents(pot_cents, reward_percentages[group_number]))
+            else:
+                group_reward = reward_percentages[group_number] * self.pot_size
+            if isinstance(name2count, TierWinners):
+                names, ids, counts = name2count.names, name2count.ids, name2count.counts
+                payouts = array('d', self.split_reward(counts, group_reward))
+            elif len(name2count) == 0:
+                names, ids, counts, payouts = [], array('I'), array('Q'), array('d')
+            else:
+                name2ticket_count = self.aggregate_winners(name2count)
+                name2payout = self.calc_payout_per_user(name2ticket_count, group_reward)
+                names = list(name2payout)
+                ids = array('I', range(len(names)))
+                counts = array('Q', map(name2ticket_count.__getitem__, names))
+                payouts = array('d', name2payout.values())
+            # Added one by one, in order, like the payouts of a single owner at a time
+            total_reward = functools.reduce(operator.add, payouts, total_reward)
+            columns[group_number] = TierColumns(names, ids, counts, payouts)
+        if self.exact_payouts:
+            # The payouts are whole cents, this only drops the error of summing them as floats
+            total_reward = from_cents(to_cents(total_reward))
+        return DrawResults(columns), total_reward
 
     def print_results(self, results: Dict[int, List[Dict]]):
-        for group_number in sorted(results.keys()):
-            group_results = results[group_number]
-            print(f"Group {group_number} Winners:")
-            if len(group_results) == 0:
-                print("Nil\n")
-                continue
-            for res in group_results:
-                print(f"{res['name']} with {res['count']} winning ticket(s)- ${res['payout']}")
-            print()
+        self.sink.emit('draw_results', {'results': results})
 
 
     def handle_run_raffle(self):
         winning_ticket = self.get_winning_ticket()
-        print(
-            "Running Raffle...\n"
-            f"Winning ticket is {fmt_ticket(winning_ticket)}\n"
-        )
-        groups = self.get_groups(self.name2tickets, winning_ticket)
+        self.sink.emit('raffle_run', {'winning_ticket': encode_ticket(winning_ticket)})
+        results = self.settle(winning_ticket)
+        self.print_results(results)
+
+    def settle(self, winning_ticket: Set) -> Dict[int, List[Dict]]:
+        """Pay out the winners of winning_ticket from the pot and return the results"""
+        groups = self.get_groups(self.tickets, winning_ticket)
         results, reward = self.get_group_results(groups)
+        if self._metrics is not None:
+            self._metrics.inc('draws_settled')
+            self._metrics.inc('payouts', reward)
         self.reward += reward
         self.draw_results = results  # for testing purposes
-        self.print_results(results)
         self.decr_reward_from_pot()
+        return results
 
     def reset_user_tickets(self):
         """Reset tickets bought by users"""
-        self.name2tickets = dict()
+        self.tickets = self.game.new_ticket_store()
 
-    def handle_new_draw(self):
+    def start_draw(self):
+        """Make all tickets available again and drop the tickets of the last draw"""
         self.reset_available_tickets()
         self.reset_user_tickets()
-        print(f"New Raffle draw has been started. Initial pot size: ${self.pot_size}")
+
+    def handle_new_draw(self):
+        self.start_draw()
+        self.sink.emit('new_draw', {'pot_size': self.pot_size})
 
     def handle_option(self, option: int):
         if option == 1:
@@ -265,9 +1180,146 @@ class Raffle:
             self.handle_run_raffle()
             self.state = new_state
 
+    def get_status(self) -> Dict:
+        return {
+            'state': self.state.name,
+            'pot_size': self.pot_size,
+            'num_tickets_sold': len(self.tickets),
+            'num_tickets_available': len(self.available_tickets),
+        }
+
+    def handle_command(self, command: Dict) -> Dict:
+        """Handle a batch command without prompting or printing and return its result
+
+        A command is a dict with an 'op' of 'new_draw', 'buy' (with 'name' and
+        'num_tickets') or 'run'. Commands go through the same state
+        transitions as the corresponding menu options. The read-only 'status'
+        op returns get_status().
+        """
+        op = command.get('op') if isinstance(command, dict) else None
+        if op == 'status':
+            return dict(self.get_status(), op='status')
+        if not isinstance(op, str) or op not in COMMAND_OPTIONS:
+            raise ValueError(f"Invalid command: {command}")
+        option = COMMAND_OPTIONS[op]
+        new_state = self.get_new_state(option)
+        if option == 1:
+            self.start_draw()
+            result = {'op': op}
+        elif option == 2:
+            name, num_tickets = parse_buy_command(command)
+            tickets = self.purchase(name, num_tickets)
+            result = {
+                'op': op,
+                'name': name,
+                'tickets': [sorted(decode_ticket(ticket)) for ticket in tickets],
+            }
+        else:
+            winning_ticket = self.get_winning_ticket()
+            results = self.settle(winning_ticket)
+            result = {
+                'op': op,
+                'winning_ticket': sorted(winning_ticket),
+                'results': dict(results),
+            }
+        self.state = new_state
+        result['pot_size'] = self.pot_size
+        return result
+
+
+def parse_buy_command(command: Dict) -> Tuple[str, int]:
+    """Get a tuple of (name, num_tickets) from a buy command"""
+    name, num_tickets = command.get('name'), command.get('num_tickets')
+    if (not isinstance(name, str) or len(name) == 0
+            or isinstance(num_tickets, bool) or not isinstance(num_tickets, int) or num_tickets <= 0):
+        raise ValueError(f"Invalid input: {command}")
+    return name, num_tickets
+
+
+def run_batch(raffle: Raffle, infile: TextIO, outfile: TextIO) -> Tuple[int, float]:
+    """Stream JSON-lines commands from infile through raffle, writing JSON-lines results to outfile
+
+    Returns a tuple of (number of commands, elapsed seconds). A command that
+    fails gets a result with its error instead of stopping the batch.
+    """
+    num_commands = 0
+    start = time.perf_counter()
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            result = raffle.handle_command(json.loads(line))
+        except (ValueError, RuntimeError) as err:
+            result = {'error': str(err), 'command': line.strip()}
+        outfile.write(json.dumps(result) + '\n')
+        num_commands += 1
+    return num_commands, time.perf_counter() - start
+
 
 def main():
-    raffle = Raffle()
+    import argparse
+    parser = argparse.ArgumentParser(description="My Raffle App")
+    parser.add_argument(
+        '--journal', metavar='DIR',
+        help="persist the draw state in DIR and recover it from there on startup",
+    )
+    parser.add_argument(
+        '--seed', help="seed the ticket allocation and draws, so runs can be reproduced",
+    )
+    parser.add_argument(
+        '--exact-payouts', action='store_true',
+        help="keep the pot in whole cents and split every prize tier exactly",
+    )
+    parser.add_argument(
+        '--status', action='store_true',
+        help="print the status of the draw as JSON and exit, without building the ticket tables",
+    )
+    parser.add_argument(
+        '--batch', metavar='FILE',
+        help="run the JSON-lines commands in FILE ('-' for stdin) instead of the interactive menu",
+    )
+    parser.add_argument(
+        '--output', metavar='FILE', default='-',
+        help="write the JSON-lines results of --batch to FILE (default: stdout)",
+    )
+    parser.add_argument(
+        '--metrics', metavar='FILE',
+        help="record metrics during --batch and write them to FILE, as Prometheus text for a .prom FILE and JSON otherwise",
+    )
+    args = parser.parse_args()
+
+    if args.journal is not None:
+        from journal import JournaledRaffle
+        raffle = JournaledRaffle(args.journal, rng=args.seed, exact_payouts=args.exact_payouts)
+    else:
+        raffle = Raffle(rng=args.seed, exact_payouts=args.exact_payouts)
+    if args.metrics is not None:
+        # Set after construction so replaying the journal is not counted
+        raffle.metrics = Metrics()
+
+    if args.status:
+        print(json.dumps(raffle.get_status()))
+        if args.journal is not None:
+            raffle.close()
+        return
+
+    if args.batch is not None:
+        infile = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+        outfile = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+        try:
+            num_commands, seconds = run_batch(raffle, infile, outfile)
+        finally:
+            for f in (infile, outfile):
+                if f not in (sys.stdin, sys.stdout):
+                    f.close()
+            if args.journal is not None:
+                raffle.close()
+        rate = num_commands / seconds if seconds > 0 else 0
+        print(f"Processed {num_commands} commands in {seconds:.3f}s ({rate:.0f} commands/sec)", file=sys.stderr)
+        if args.metrics is not None:
+            with open(args.metrics, 'w', encoding='utf-8') as f:
+                f.write(raffle.metrics.to_prometheus() if args.metrics.endswith('.prom') else raffle.metrics.to_json() + '\n')
+        return
 
     while True:
         print(get_welcome(raffle.state, raffle.pot_size))
@@ -0,0 +1,216 @@
+"""Asyncio ticket-sales server fronting the Raffle engine
+
+Clients connect over TCP and send JSON-lines commands, in the same format as
+`raffle.py --batch` plus read-only 'status' and 'metrics' ops. Every command that changes
+the raffle goes through a single writer task, which serializes the draw
+transitions and turns the buy commands waiting in the queue into one bulk
+ticket allocation.
+
+    $ python3 server.py --port 8765
+"""
+from typing import Optional, Dict, List, Tuple
+import argparse
+import asyncio
+import json
+
+from raffle import Raffle, COMMAND_OPTIONS, parse_buy_command, decode_ticket
+from metrics import Metrics
+
+
+Request = Tuple[Dict, asyncio.Future]
+
+
+class RaffleServer:
+    def __init__(self, raffle: Raffle, max_batch_size: int = 1024) -> None:
+        self.raffle = raffle
+        self.max_batch_size = max_batch_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.writer_task: Optional[asyncio.Task] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> int:
+        """Start serving on host:port and return the port"""
+        self.queue = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self.write_loop())
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+        self.writer_task.cancel()
+        try:
+            await self.writer_task
+        except asyncio.CancelledError:
+            pass
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError as err:
+                    # The line is over the reader's limit and the rest of the
+                    # stream cannot be split into commands reliably
+                    writer.write(json.dumps({'error': f"Line too long: {err}"}).encode() + b'\n')
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                result = await self.handle_line(line)
+                writer.write(json.dumps(result).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_line(self, line: bytes) -> Dict:
+        try:
+            command = json.loads(line)
+        except ValueError as err:
+            return {'error': str(err)}
+        if isinstance(command, dict) and command.get('op') == 'status':
+            return dict(self.raffle.get_status(), op='status')
+        if isinstance(command, dict) and command.get('op') == 'metrics':
+            if self.raffle.metrics is None:
+                return {'error': "Metrics are not enabled"}
+            return self.raffle.metrics.snapshot()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((command, future))
+        return await future
+
+    async def write_loop(self) -> None:
+        """Apply queued commands to the raffle, one micro-batch at a time"""
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                self.apply_batch(batch)
+            except Exception as err:
+                # Keep the only writer running, whatever went wrong with this batch
+                for _, future in batch:
+                    set_result(future, {'error': str(err)})
+
+    def apply_batch(self, batch: List[Request]) -> None:
+        """Apply commands in order, with every run of consecutive buys allocated in bulk"""
+        i = 0
+        while i < len(batch):
+            j = i
+            while j < len(batch) and is_buy(batch[j][0]):
+                j += 1
+            if j > i:
+                self.buy_many(batch[i:j])
+                i = j
+                continue
+            command, future = batch[i]
+            try:
+                result = self.raffle.handle_command(command)
+            except Exception as err:
+                result = {'error': str(err)}
+            set_result(future, result)
+            i += 1
+
+    def buy_many(self, requests: List[Request]) -> None:
+        """Handle buy commands with a single allocation of all their tickets
+
+        Tickets are handed out in the order of the requests, so if the draw
+        sells out the earlier buyers get their full amount like they would
+        with one buy_tickets call each.
+        """
+        raffle = self.raffle
+        try:
+            new_state = raffle.get_new_state(COMMAND_OPTIONS['buy'])
+        except ValueError as err:
+            for _, future in requests:
+                set_result(future, {'error': str(err)})
+            return
+        buyers = []
+        names = set()
+        for command, future in requests:
+            try:
+                name, num_tickets = parse_buy_command(command)
+                if name in raffle.tickets or name in names:
+                    raise ValueError(f"Invalid input: {name} has purchased tickets already")
+            except Exception as err:
+                set_result(future, {'error': str(err)})
+                continue
+            names.add(name)
+            buyers.append((name, num_tickets, future))
+
+        tickets = raffle.available_tickets.allocate(sum(num_tickets for _, num_tickets, _ in buyers))
+        if raffle.metrics is not None:
+            raffle.metrics.inc('tickets_allocated', len(tickets))
+        offset = 0
+        for name, num_tickets, future in buyers:
+            own_tickets = tickets[offset:offset + num_tickets]
+            offset += len(own_tickets)
+            try:
+                raffle.assign_tickets(name, own_tickets)
+            except Exception as err:
+                # E.g. a journal write failing: these tickets stay out of the pool unsold
+                set_result(future, {'error': str(err)})
+                continue
+            set_result(future, {
+                'op': 'buy',
+                'name': name,
+                'tickets': [sorted(decode_ticket(ticket)) for ticket in own_tickets],
+                'pot_size': raffle.pot_size,
+            })
+        raffle.state = new_state
+
+
+def is_buy(command: Dict) -> bool:
+    return isinstance(command, dict) and command.get('op') == 'buy'
+
+
+def set_result(future: asyncio.Future, result: Dict) -> None:
+    """Resolve future unless its client has gone away"""
+    if not future.done():
+        future.set_result(result)
+
+
+async def serve(raffle: Raffle, host: str, port: int) -> None:
+    server = RaffleServer(raffle)
+    port = await server.start(host, port)
+    print(f"Listening on {host}:{port}", flush=True)
+    await server.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raffle ticket-sales server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', help="seed the ticket allocation and draws, so runs can be reproduced")
+    parser.add_argument(
+        '--exact-payouts', action='store_true',
+        help="keep the pot in whole cents and split every prize tier exactly",
+    )
+    parser.add_argument('--metrics', action='store_true', help="record metrics and serve them with the 'metrics' op")
+    parser.add_argument(
+        '--journal', metavar='DIR',
+        help="persist the draw state in DIR and recover it from there on startup",
+    )
+    args = parser.parse_args()
+
+    if args.journal is not None:
+        from journal import JournaledRaffle
+        raffle = JournaledRaffle(args.journal, rng=args.seed, exact_payouts=args.exact_payouts)
+    else:
+        raffle = Raffle(rng=args.seed, exact_payouts=args.exact_payouts)
+    if args.metrics:
+        raffle.metrics = Metrics()
+    try:
+        asyncio.run(serve(raffle, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.journal is not None:
+            raffle.close()
+
+
+if __name__ == '__main__':
+    main()
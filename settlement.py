@@ -0,0 +1,96 @@
+"""Sharded multi-process settlement for very large draws
+
+The sold tickets are copied once into shared memory and split into
+contiguous shards, cut at owner boundaries. Worker processes count matches
+per prize group and owner for their shard, and the parent merges the counts
+in shard order. That gives the same counts in the same order as the serial
+pass, so get_group_results computes bit-for-bit identical payouts.
+"""
+from typing import Optional, Dict, List, Tuple
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from array import array
+import os
+
+from raffle import Raffle, TicketStore, count_matches, group_matches
+
+
+def get_shards(owners, num_shards: int) -> List[Tuple[int, int]]:
+    """Split ticket indices into about equal (start, end) ranges that do not split an owner's run of tickets"""
+    num_tickets = len(owners)
+    shards = []
+    start = 0
+    for i in range(1, num_shards + 1):
+        end = num_tickets * i // num_shards
+        while 0 < end < num_tickets and owners[end] == owners[end - 1]:
+            end += 1
+        if end > start:
+            shards.append((start, end))
+            start = end
+    return shards
+
+
+def count_shard(shm_name: str, num_tickets: int, typecode: str, start: int, end: int, winning_mask: int) -> Counter:
+    """Count matches of the tickets in [start, end) of the store in shared memory
+
+    The owner ids come first in the shared memory, followed by the masks as
+    an array of typecode.
+    """
+    shm = SharedMemory(name=shm_name)
+    try:
+        mask_end = num_tickets * (4 + array(typecode).itemsize)
+        with shm.buf[:num_tickets * 4].cast('I') as owners, shm.buf[num_tickets * 4:mask_end].cast(typecode) as masks:
+            with owners[start:end] as owner_shard, masks[start:end] as mask_shard:
+                return count_matches(mask_shard, owner_shard, winning_mask)
+    finally:
+        shm.close()
+
+
+def count_matches_sharded(store: TicketStore, winning_mask: int, executor: Executor, num_shards: int) -> Counter:
+    """Count tickets per (number of winning numbers, owner id) across worker processes"""
+    num_tickets = len(store)
+    mask_end = num_tickets * (4 + store.masks.itemsize)
+    shm = SharedMemory(create=True, size=max(1, mask_end))
+    try:
+        shm.buf[:num_tickets * 4] = store.owners.tobytes()
+        shm.buf[num_tickets * 4:mask_end] = store.masks.tobytes()
+        futures = [
+            executor.submit(count_shard, shm.name, num_tickets, store.masks.typecode, start, end, winning_mask)
+            for start, end in get_shards(store.owners, num_shards)
+        ]
+        counts = Counter()
+        for future in futures:
+            for key, count in future.result().items():
+                counts[key] += count
+        return counts
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+class ShardedRaffle(Raffle):
+    """Raffle that settles large draws across a pool of worker processes
+
+    Draws with fewer than min_shard_size tickets per worker use fewer
+    workers, down to the serial pass for small draws. Games of more than 64
+    numbers keep their masks as Python ints and are always settled serially.
+    """
+    def __init__(self, num_workers: Optional[int] = None, min_shard_size: int = 100_000, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.num_workers = os.cpu_count() if num_workers is None else num_workers
+        self.min_shard_size = min_shard_size
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def count_winners(self, store: TicketStore, winning_mask: int, min_matches: int) -> Dict[int, Dict[int, int]]:
+        num_shards = min(self.num_workers, len(store) // self.min_shard_size)
+        if num_shards <= 1 or not isinstance(store.masks, array):
+            return super().count_winners(store, winning_mask, min_matches)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.num_workers)
+        return group_matches(count_matches_sharded(store, winning_mask, self.executor, num_shards), min_matches)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
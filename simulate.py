@@ -0,0 +1,201 @@
+"""Monte Carlo simulation of pot size and payouts over many draws
+
+Runs independent raffle sessions of a number of draws each. Every draw
+sells tickets to a random number of buyers and is settled with the real
+Raffle payout logic, so the numbers match production. Sessions can run in
+parallel across processes; each session has its own RaffleRNG stream,
+spawned from the base seed, so results do not depend on the number of
+processes.
+
+    $ python3 simulate.py --sessions 1000 --draws 52 --processes 4
+"""
+from typing import Optional, Dict, List
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import random
+import statistics
+import sys
+
+from raffle import Raffle, RaffleRNG, NullSink, INITIAL_POT_SIZE, TICKET_PRICE, REWARD_PERCENTAGES
+
+
+class BuyerDistribution:
+    """Distribution of the number of buyers per draw and of tickets per buyer
+
+    The number of buyers is uniform between min_buyers and max_buyers. The
+    number of tickets per buyer is either 'uniform' between 1 and
+    2 * mean_tickets - 1, or 'geometric' with mean mean_tickets.
+    """
+    def __init__(self, min_buyers: int = 1, max_buyers: int = 20, tickets: str = 'geometric', mean_tickets: float = 3) -> None:
+        if tickets not in ('uniform', 'geometric'):
+            raise ValueError(f"Invalid ticket distribution: {tickets}")
+        if not 0 < min_buyers <= max_buyers or mean_tickets < 1:
+            raise ValueError(f"Invalid buyer distribution: {min_buyers}-{max_buyers} buyers, {mean_tickets} tickets")
+        self.min_buyers = min_buyers
+        self.max_buyers = max_buyers
+        self.tickets = tickets
+        self.mean_tickets = mean_tickets
+
+    def sample(self, rng: random.Random) -> List[int]:
+        """Get the number of tickets of every buyer in a draw"""
+        num_buyers = rng.randint(self.min_buyers, self.max_buyers)
+        if self.tickets == 'uniform':
+            high = max(1, round(2 * self.mean_tickets - 1))
+            return [rng.randint(1, high) for _ in range(num_buyers)]
+        p = 1 / self.mean_tickets
+        # Geometric on {1, 2, ...} by counting Bernoulli trials until the first success
+        counts = []
+        for _ in range(num_buyers):
+            count = 1
+            while rng.random() >= p:
+                count += 1
+            counts.append(count)
+        return counts
+
+
+def simulate_session(
+    rng: RaffleRNG,
+    num_draws: int,
+    buyers: BuyerDistribution,
+    initial_pot_size: float = INITIAL_POT_SIZE,
+    ticket_price: float = TICKET_PRICE,
+    reward_percentages: Optional[Dict[int, float]] = None,
+) -> Dict:
+    """Run num_draws draws of a single raffle and return its totals"""
+    raffle = Raffle(
+        pot_size=initial_pot_size,
+        sink=NullSink(),
+        ticket_price=ticket_price,
+        reward_percentages=reward_percentages,
+        rng=rng,
+    )
+    revenue = 0
+    tier_payouts = {group_number: 0 for group_number in raffle.reward_percentages}
+    for _ in range(num_draws):
+        raffle.start_draw()
+        for i, num_tickets in enumerate(buyers.sample(rng.random)):
+            name = f'buyer{i}'
+            pot_before = raffle.pot_size
+            raffle.assign_tickets(name, raffle.allocate_tickets(name, num_tickets))
+            revenue += raffle.pot_size - pot_before
+        results = raffle.settle(raffle.get_winning_ticket())
+        for group_number, columns in results.columns.items():
+            tier_payouts[group_number] += sum(columns.payouts)
+    total_payouts = sum(tier_payouts.values())
+    return {
+        'pot_size': raffle.pot_size,
+        'revenue': revenue,
+        'tier_payouts': tier_payouts,
+        'house_balance': revenue - total_payouts,
+    }
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Get the mean, standard deviation, min, max and 5th/50th/95th percentiles of values"""
+    percentiles = statistics.quantiles(values, n=20, method='inclusive') if len(values) > 1 else list(values) * 19
+    return {
+        'mean': statistics.fmean(values),
+        'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+        'min': min(values),
+        'p5': percentiles[0],
+        'p50': statistics.median(values),
+        'p95': percentiles[-1],
+        'max': max(values),
+    }
+
+
+def simulate(
+    num_sessions: int,
+    num_draws: int,
+    buyers: BuyerDistribution,
+    seed: int = 0,
+    processes: int = 1,
+    initial_pot_size: float = INITIAL_POT_SIZE,
+    ticket_price: float = TICKET_PRICE,
+    reward_percentages: Optional[Dict[int, float]] = None,
+) -> Dict:
+    """Run num_sessions independent sessions and return the distributions of their totals"""
+    rngs = RaffleRNG(seed).spawn(num_sessions)
+    args = (num_draws, buyers, initial_pot_size, ticket_price, reward_percentages)
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as executor:
+            sessions = list(executor.map(simulate_session, rngs, *([arg] * num_sessions for arg in args)))
+    else:
+        sessions = [simulate_session(rng, *args) for rng in rngs]
+
+    group_numbers = sessions[0]['tier_payouts'].keys() if sessions else []
+    return {
+        'sessions': num_sessions,
+        'draws': num_draws,
+        'pot_size': summarize([session['pot_size'] for session in sessions]),
+        'revenue': summarize([session['revenue'] for session in sessions]),
+        'house_balance': summarize([session['house_balance'] for session in sessions]),
+        'tier_payouts': {
+            group_number: summarize([session['tier_payouts'][group_number] for session in sessions])
+            for group_number in group_numbers
+        },
+    }
+
+
+def parse_reward_percentages(values: List[str]) -> Dict[int, float]:
+    """Parse ['2=0.1', '3=0.15', ...] into {2: 0.1, 3: 0.15, ...}"""
+    try:
+        return {int(key): float(value) for key, value in (item.split('=') for item in values)}
+    except ValueError:
+        raise ValueError(f"Invalid reward percentages: {values}")
+
+
+def print_report(report: Dict) -> None:
+    print(f"{report['sessions']} sessions of {report['draws']} draws")
+    print(f"{'':>16} {'mean':>10} {'stdev':>10} {'p5':>10} {'p50':>10} {'p95':>10}")
+    rows = [('pot size', report['pot_size']), ('revenue', report['revenue']), ('house balance', report['house_balance'])]
+    rows.extend((f'group {group_number} payouts', stats) for group_number, stats in report['tier_payouts'].items())
+    for label, stats in rows:
+        print(
+            f"{label:>16} {stats['mean']:10.2f} {stats['stdev']:10.2f} "
+            f"{stats['p5']:10.2f} {stats['p50']:10.2f} {stats['p95']:10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of raffle sessions")
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--draws', type=int, default=52, help="draws per session")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--initial-pot', type=float, default=INITIAL_POT_SIZE)
+    parser.add_argument('--ticket-price', type=float, default=TICKET_PRICE)
+    parser.add_argument(
+        '--reward-percentages', nargs='+', metavar='MATCHES=SHARE',
+        default=[f'{key}={value}' for key, value in REWARD_PERCENTAGES.items()],
+    )
+    parser.add_argument('--min-buyers', type=int, default=1)
+    parser.add_argument('--max-buyers', type=int, default=20)
+    parser.add_argument('--tickets', choices=['uniform', 'geometric'], default='geometric')
+    parser.add_argument('--mean-tickets', type=float, default=3)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    try:
+        buyers = BuyerDistribution(args.min_buyers, args.max_buyers, args.tickets, args.mean_tickets)
+        reward_percentages = parse_reward_percentages(args.reward_percentages)
+    except ValueError as err:
+        parser.error(str(err))
+    report = simulate(
+        args.sessions, args.draws, buyers,
+        seed=args.seed,
+        processes=args.processes,
+        initial_pot_size=args.initial_pot,
+        ticket_price=args.ticket_price,
+        reward_percentages=reward_percentages,
+    )
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+-- Indexes for queries.sql on large tables, see benchmarks/bench_sql.py
+
+-- Borrow counts per book and the anti-join of books never borrowed
+create index if not exists idx_borrowed_books_book_id on borrowed_books(book_id);
+
+-- Distinct books per user, read from the index alone
+create index if not exists idx_borrowed_books_user_book on borrowed_books(user_id, book_id);
+
+-- Books of an author
+create index if not exists idx_books_author on books(author);
@@ -0,0 +1,57 @@
+-- Rewrites of the queries of queries.sql, named after the query they replace
+-- They return the same rows, except that ties at a limit may be broken
+-- differently, and for borrows whose book_id is NULL or not in books:
+-- - counting before the join ranks those ids too, and the join then drops
+--   them, so it returns fewer than 10 rows if they are among the top 10;
+-- - once a borrow has a NULL book_id, the not in of the original returns no
+--   rows at all, while not exists and left join return the books nobody
+--   borrowed.
+-- benchmarks/bench_sql.py checks that the rewrites only differ in these cases.
+-- They are written for the indexes of indexes.sql: without an index on
+-- borrowed_books(book_id), the not exists and left join anti-joins scan
+-- borrowed_books once per book.
+
+-- Query to select top 10 most borrowed books, counting before the join
+select b.book_id, b.title, b.author, b.publication_year, b.isbn, top.nr_times_borrowed
+from (
+	select book_id, count(*) as nr_times_borrowed
+	from borrowed_books
+	group by book_id
+	order by nr_times_borrowed desc
+	limit 10
+) as top
+join books as b
+on b.book_id = top.book_id
+order by top.nr_times_borrowed desc;
+
+-- Query to find user with most borrowed books, with count(distinct)
+select user_id, count(distinct book_id) as book_count
+from borrowed_books
+group by user_id
+order by book_count desc
+limit 1;
+
+-- Query to select all books not borrowed by users published in 2020, with not exists
+select *
+from books
+where not exists (select 1 from borrowed_books as bb where bb.book_id = books.book_id)
+and publication_year = 2020;
+
+-- Query to select all books not borrowed by users published in 2020, with left join
+select b.*
+from books as b
+left join borrowed_books as bb
+on bb.book_id = b.book_id
+where bb.book_id is null
+and b.publication_year = 2020;
+
+-- Query to select users who borrowed from specific author (e.g.: J.K. Rowling), with in
+select u.user_id, u.first_name, u.last_name, u.email, u.registration_date
+from users as u
+where u.user_id in (
+	select bb.user_id
+	from books as b
+	join borrowed_books as bb
+	on bb.book_id = b.book_id
+	where b.author = 'J.K. Rowling'
+);
@@ -0,0 +1,49 @@
+-- Ledger of the raffle draws, see ledger.py
+-- Owner ids are the ids of the draw's TicketStore, so settling in SQL lists
+-- the winners in the same order as settling in Python.
+
+create table if not exists draws (
+	draw_id integer primary key,
+	started_at text not null,
+	winning_mask integer,
+	pot_size real
+);
+
+create table if not exists owners (
+	draw_id integer not null,
+	owner_id integer not null,
+	name text not null,
+	primary key (draw_id, owner_id),
+	FOREIGN KEY(draw_id) REFERENCES draws(draw_id)
+) without rowid;
+
+-- A ticket is sold at most once per draw
+create table if not exists tickets (
+	draw_id integer not null,
+	mask integer not null,
+	owner_id integer not null,
+	primary key (draw_id, mask),
+	FOREIGN KEY(draw_id, owner_id) REFERENCES owners(draw_id, owner_id)
+) without rowid;
+
+-- Covering index for settlement and per-owner lookups: a draw's tickets in
+-- owner order, without reading the table
+create index if not exists idx_tickets_owner on tickets(draw_id, owner_id, mask);
+
+create table if not exists draw_results (
+	draw_id integer not null,
+	tier integer not null,
+	owner_id integer not null,
+	count integer not null,
+	payout real not null,
+	primary key (draw_id, tier, owner_id),
+	FOREIGN KEY(draw_id, owner_id) REFERENCES owners(draw_id, owner_id)
+) without rowid;
+
+-- Winners of a draw per match count and owner, with :winning_numbers
+-- replaced by one ((mask >> (n - 1)) & 1) term per winning number n
+-- select matches, owner_id, count(*) as count
+-- from (select owner_id, :winning_numbers as matches from tickets where draw_id = :draw_id)
+-- where matches >= :min_matches
+-- group by matches, owner_id
+-- order by matches, owner_id;
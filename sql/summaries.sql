@@ -0,0 +1,146 @@
+-- Summary tables of borrowed_books, kept up to date by triggers, so the top
+-- books and users are read from an index instead of grouping every borrow.
+-- Run after books.sql; the summaries start from the borrows already there.
+-- Borrows with a NULL book_id are not counted, nor per user those with a NULL
+-- user_id. Only the inserts need to check: in the delete and update triggers,
+-- a NULL old.user_id or old.book_id never matches a row of the summaries.
+
+create table book_borrow_counts (
+	book_id integer primary key,
+	nr_times_borrowed integer not null,
+	FOREIGN KEY(book_id) REFERENCES books(book_id)
+);
+
+-- Borrows per user and book, to know when a user borrows a book for the first time or no longer has it
+create table user_book_counts (
+	user_id integer not null,
+	book_id integer not null,
+	nr_times_borrowed integer not null,
+	primary key (user_id, book_id)
+) without rowid;
+
+create table user_distinct_books (
+	user_id integer primary key,
+	book_count integer not null,
+	FOREIGN KEY(user_id) REFERENCES users(user_id)
+);
+
+create index idx_book_borrow_counts_top on book_borrow_counts(nr_times_borrowed);
+create index idx_user_distinct_books_top on user_distinct_books(book_count);
+
+insert into book_borrow_counts (book_id, nr_times_borrowed)
+select book_id, count(*) from borrowed_books where book_id is not null group by book_id;
+
+insert into user_book_counts (user_id, book_id, nr_times_borrowed)
+select user_id, book_id, count(*) from borrowed_books
+where user_id is not null and book_id is not null
+group by user_id, book_id;
+
+insert into user_distinct_books (user_id, book_count)
+select user_id, count(*) from user_book_counts group by user_id;
+
+-- Create trigger to count a new borrow
+create trigger count_borrow
+	after insert on borrowed_books
+begin
+	insert into book_borrow_counts (book_id, nr_times_borrowed)
+	select new.book_id, 1
+	where new.book_id is not null
+	on conflict (book_id) do update set nr_times_borrowed = nr_times_borrowed + 1;
+
+	insert into user_book_counts (user_id, book_id, nr_times_borrowed)
+	select new.user_id, new.book_id, 1
+	where new.user_id is not null and new.book_id is not null
+	on conflict (user_id, book_id) do update set nr_times_borrowed = nr_times_borrowed + 1;
+
+	insert into user_distinct_books (user_id, book_count)
+	select new.user_id, 1
+	from user_book_counts
+	where user_id = new.user_id and book_id = new.book_id and nr_times_borrowed = 1
+	on conflict (user_id) do update set book_count = book_count + 1;
+end;
+
+-- Create trigger to uncount a deleted borrow
+create trigger uncount_borrow
+	after delete on borrowed_books
+begin
+	update book_borrow_counts
+	set nr_times_borrowed = nr_times_borrowed - 1
+	where book_id = old.book_id;
+
+	delete from book_borrow_counts
+	where book_id = old.book_id and nr_times_borrowed = 0;
+
+	update user_book_counts
+	set nr_times_borrowed = nr_times_borrowed - 1
+	where user_id = old.user_id and book_id = old.book_id;
+
+	update user_distinct_books
+	set book_count = book_count - 1
+	where user_id = old.user_id
+	and exists (select 1 from user_book_counts where user_id = old.user_id and book_id = old.book_id and nr_times_borrowed = 0);
+
+	delete from user_distinct_books
+	where user_id = old.user_id and book_count = 0;
+
+	delete from user_book_counts
+	where user_id = old.user_id and book_id = old.book_id and nr_times_borrowed = 0;
+end;
+
+-- Create trigger to move a borrow to another user or book, as a delete and an insert
+create trigger recount_borrow
+	after update of user_id, book_id on borrowed_books
+	when new.user_id is not old.user_id or new.book_id is not old.book_id
+begin
+	update book_borrow_counts
+	set nr_times_borrowed = nr_times_borrowed - 1
+	where book_id = old.book_id;
+
+	delete from book_borrow_counts
+	where book_id = old.book_id and nr_times_borrowed = 0;
+
+	update user_book_counts
+	set nr_times_borrowed = nr_times_borrowed - 1
+	where user_id = old.user_id and book_id = old.book_id;
+
+	update user_distinct_books
+	set book_count = book_count - 1
+	where user_id = old.user_id
+	and exists (select 1 from user_book_counts where user_id = old.user_id and book_id = old.book_id and nr_times_borrowed = 0);
+
+	delete from user_distinct_books
+	where user_id = old.user_id and book_count = 0;
+
+	delete from user_book_counts
+	where user_id = old.user_id and book_id = old.book_id and nr_times_borrowed = 0;
+
+	insert into book_borrow_counts (book_id, nr_times_borrowed)
+	select new.book_id, 1
+	where new.book_id is not null
+	on conflict (book_id) do update set nr_times_borrowed = nr_times_borrowed + 1;
+
+	insert into user_book_counts (user_id, book_id, nr_times_borrowed)
+	select new.user_id, new.book_id, 1
+	where new.user_id is not null and new.book_id is not null
+	on conflict (user_id, book_id) do update set nr_times_borrowed = nr_times_borrowed + 1;
+
+	insert into user_distinct_books (user_id, book_count)
+	select new.user_id, 1
+	from user_book_counts
+	where user_id = new.user_id and book_id = new.book_id and nr_times_borrowed = 1
+	on conflict (user_id) do update set book_count = book_count + 1;
+end;
+
+-- Query to select top 10 most borrowed books, from the summary
+select b.book_id, b.title, b.author, b.publication_year, b.isbn, c.nr_times_borrowed
+from book_borrow_counts as c
+join books as b
+on b.book_id = c.book_id
+order by c.nr_times_borrowed desc
+limit 10;
+
+-- Query to find user with most borrowed books, from the summary
+select user_id, book_count
+from user_distinct_books
+order by book_count desc
+limit 1;
@@ -0,0 +1,110 @@
+import unittest
+import os
+import tempfile
+
+from raffle import Game, NullSink, State, TICKET_PRICE, INITIAL_POT_SIZE
+from draws import DrawManager
+
+
+class TestDrawManager(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def new_manager(self, max_live, directory=None, **kwargs):
+        return DrawManager(self.directory if directory is None else directory, max_live=max_live, rng=0,
+                           sink=NullSink(), **kwargs)
+
+    def play(self, manager, num_draws):
+        """Start num_draws draws, sell tickets in each and settle them in one batch"""
+        for i in range(num_draws):
+            manager.handle_command({'draw': f'draw{i}', 'op': 'new_draw'})
+            for j in range(3):
+                manager.handle_command({'draw': f'draw{i}', 'op': 'buy', 'name': f'user{j}', 'num_tickets': 4})
+        for i in range(num_draws):
+            manager.schedule_run(f'draw{i}')
+        return manager.run_scheduled()
+
+    def test_eviction(self):
+        """Test an evicted draw comes back with the same state"""
+        manager = self.new_manager(max_live=2)
+        for i in range(3):
+            manager.handle_command({'draw': f'draw{i}', 'op': 'new_draw'})
+            manager.handle_command({'draw': f'draw{i}', 'op': 'buy', 'name': 'foo', 'num_tickets': i + 1})
+        self.assertEqual(2, len(manager))
+        self.assertEqual(1, manager.num_evictions)
+        self.assertTrue(os.path.exists(manager.get_path('draw0')))
+
+        raffle = manager.get('draw0')
+        self.assertEqual(1, manager.num_loads)
+        self.assertFalse(os.path.exists(manager.get_path('draw0')))
+        self.assertEqual(State.ONGOING, raffle.state)
+        self.assertEqual(INITIAL_POT_SIZE + TICKET_PRICE, raffle.pot_size)
+        ticket, = raffle.tickets.get_masks('foo')
+        self.assertNotIn(ticket, raffle.available_tickets)
+        self.assertEqual(raffle.game.num_tickets - 1, len(raffle.available_tickets))
+        self.assertFalse(raffle.tickets.indexed)
+
+    def test_same_results_with_eviction(self):
+        """Test a seeded manager settles like one that never evicts"""
+        with tempfile.TemporaryDirectory() as directory:
+            expected = self.play(self.new_manager(max_live=100, directory=directory), 20)
+        manager = self.new_manager(max_live=3)
+        results = self.play(manager, 20)
+        self.assertGreater(manager.num_loads, 0)
+        self.assertEqual(sorted(expected), sorted(results))
+        for draw_id, draw_results in results.items():
+            self.assertEqual(dict(expected[draw_id]), dict(draw_results))
+        self.assertEqual(State.NOT_STARTED, manager.get('draw0').state)
+
+    def test_batch_loads_each_draw_once(self):
+        """Test settling scheduled draws loads every evicted draw once and skips draws that are not ongoing"""
+        manager = self.new_manager(max_live=4)
+        for i in range(10):
+            manager.handle_command({'draw': f'draw{i}', 'op': 'new_draw'})
+            manager.handle_command({'draw': f'draw{i}', 'op': 'buy', 'name': 'foo', 'num_tickets': 5})
+            manager.schedule_run(f'draw{i}')
+        manager.handle_command({'draw': 'draw9', 'op': 'run'})
+        num_loads = manager.num_loads
+        results = manager.run_scheduled()
+        self.assertEqual(6, manager.num_loads - num_loads)
+        self.assertEqual([f'draw{i}' for i in range(9)], sorted(results))
+        self.assertEqual({}, manager.run_scheduled())
+        with self.assertRaises(ValueError):
+            manager.schedule_run('nope')
+
+    def test_unknown_draw(self):
+        """Test only new_draw creates a draw, so a status call on an unknown id creates no draw and no file"""
+        manager = self.new_manager(max_live=1)
+        manager.handle_command({'draw': 'draw0', 'op': 'new_draw'})
+        for op in ('status', 'buy', 'run'):
+            with self.assertRaises(ValueError):
+                manager.handle_command({'draw': 'typo', 'op': op, 'name': 'foo', 'num_tickets': 1})
+        with self.assertRaises(ValueError):
+            manager.get('typo')
+        self.assertEqual(['draw0'], list(manager.draws))
+        self.assertEqual(0, manager.num_evictions)
+        manager.close()
+        self.assertEqual(['draw0.json'], os.listdir(self.directory))
+
+    def test_close(self):
+        """Test a new manager picks up the draws of a closed one"""
+        manager = self.new_manager(max_live=10, game=Game(49, 6), reward_percentages={3: .5, 6: .5})
+        manager.handle_command({'draw': 'eu', 'op': 'new_draw'})
+        manager.handle_command({'draw': 'eu', 'op': 'buy', 'name': 'foo', 'num_tickets': 3})
+        manager.close()
+        self.assertEqual(0, len(manager))
+
+        reopened = self.new_manager(max_live=10, game=Game(49, 6), reward_percentages={3: .5, 6: .5})
+        status = reopened.handle_command({'draw': 'eu', 'op': 'status'})
+        self.assertEqual({'op': 'status', 'draw': 'eu', 'state': 'ONGOING', 'pot_size': INITIAL_POT_SIZE + 3 * TICKET_PRICE,
+                          'num_tickets_sold': 3, 'num_tickets_available': Game(49, 6).num_tickets - 3}, status)
+        with self.assertRaises(ValueError):
+            reopened.handle_command({'op': 'status'})
+
+
+if __name__ == '__main__':
+    unittest.main()
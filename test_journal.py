@@ -0,0 +1,81 @@
+import unittest
+import os
+import tempfile
+
+from raffle import State, TICKET_PRICE, INITIAL_POT_SIZE
+from journal import JournaledRaffle, read_events
+
+
+class TestJournaledRaffle(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assertSameState(self, expected, raffle):
+        self.assertEqual(expected.state, raffle.state)
+        self.assertEqual(expected.pot_size, raffle.pot_size)
+        self.assertEqual(dict(expected.name2tickets), dict(raffle.name2tickets))
+        self.assertEqual(sorted(expected.available_tickets), sorted(raffle.available_tickets))
+
+    def test_recover(self):
+        """Test replaying the journal rebuilds pot, sold tickets and available tickets"""
+        raffle = JournaledRaffle(self.directory)
+        raffle.handle_option(1)
+        raffle.buy_tickets('foo', 3)
+        raffle.buy_tickets('bar', 2)
+        raffle.close()
+
+        recovered = JournaledRaffle(self.directory)
+        self.assertSameState(raffle, recovered)
+        self.assertEqual(INITIAL_POT_SIZE + 5 * TICKET_PRICE, recovered.pot_size)
+        self.assertEqual(State.ONGOING, recovered.state)
+
+        recovered.get_winning_ticket = lambda: set([1, 2, 3, 4, 5])
+        recovered.handle_option(3)
+        recovered.close()
+
+        settled = JournaledRaffle(self.directory)
+        self.assertSameState(recovered, settled)
+        self.assertEqual(recovered.draw_results, settled.draw_results)
+        self.assertEqual(State.NOT_STARTED, settled.state)
+        settled.close()
+
+    def test_snapshot(self):
+        """Test snapshots keep the journal short and recover the same state"""
+        raffle = JournaledRaffle(self.directory, snapshot_every=2)
+        raffle.handle_option(1)
+        for i in range(5):
+            raffle.buy_tickets(f'user{i}', 2)
+        raffle.close()
+
+        events, _ = read_events(raffle.journal_path)
+        self.assertTrue(os.path.exists(raffle.snapshot_path))
+        self.assertLessEqual(len(events), 2)
+        recovered = JournaledRaffle(self.directory)
+        self.assertSameState(raffle, recovered)
+        self.assertEqual(raffle.seq, recovered.seq)
+        recovered.close()
+
+    def test_torn_write(self):
+        """Test a partially written last event is dropped on recovery"""
+        raffle = JournaledRaffle(self.directory)
+        raffle.handle_option(1)
+        raffle.buy_tickets('foo', 3)
+        raffle.close()
+        with open(raffle.journal_path, 'a') as f:
+            f.write('{"op":"buy","name":"bar","tick')
+
+        recovered = JournaledRaffle(self.directory)
+        self.assertSameState(raffle, recovered)
+        recovered.buy_tickets('bar', 1)
+        recovered.close()
+        events, size = read_events(raffle.journal_path)
+        self.assertEqual(['new_draw', 'buy', 'buy'], [event['op'] for event in events])
+        self.assertEqual(os.path.getsize(raffle.journal_path), size)
+
+
+if __name__ == '__main__':
+    unittest.main()
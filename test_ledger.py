@@ -0,0 +1,94 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+
+from raffle import Game, NullSink, RaffleRNG, State, encode_ticket
+from ledger import LedgerRaffle
+
+
+class TestLedgerRaffle(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'ledger.db')
+
+    def new_raffle(self, **kwargs):
+        raffle = LedgerRaffle(self.path, state=State.ONGOING, sink=NullSink(), rng=RaffleRNG(0), **kwargs)
+        self.addCleanup(raffle.close)
+        return raffle
+
+    def buy(self, raffle, num_owners, num_tickets):
+        for i in range(num_owners):
+            raffle.purchase(f'user{i}', num_tickets)
+
+    def test_records_tickets(self):
+        """Test the ledger holds every ticket sold, by owner, in WAL mode"""
+        raffle = self.new_raffle(batch_size=7)
+        self.buy(raffle, 20, 3)
+        self.assertEqual('wal', raffle.ledger.conn.execute('pragma journal_mode').fetchone()[0])
+        for name in raffle.tickets.names:
+            self.assertEqual(sorted(raffle.tickets.get_masks(name)), raffle.ledger.get_masks(raffle.draw_id, name))
+
+    def test_buffers_purchases(self):
+        """Test purchases are only visible to other connections once a batch is written"""
+        raffle = self.new_raffle(batch_size=10)
+        conn = sqlite3.connect(self.path)
+        self.addCleanup(conn.close)
+        num_tickets = lambda: conn.execute('select count(*) from tickets').fetchone()[0]
+        raffle.purchase('foo', 5)
+        self.assertEqual(0, num_tickets())
+        raffle.purchase('bar', 5)
+        self.assertEqual(10, num_tickets())
+        raffle.purchase('baz', 1)
+        self.assertEqual(10, num_tickets())
+        raffle.settle({3, 7, 8, 11, 12})
+        self.assertEqual(11, num_tickets())
+
+    def test_sql_settlement(self):
+        """Test settling in SQL pays out like settling in Python and records the results"""
+        for game, winning_ticket in ((None, {3, 7, 8, 11, 12}), (Game(40, 6), {1, 2, 3, 4, 39, 40})):
+            kwargs = {} if game is None else {'game': game, 'reward_percentages': {2: .1, 3: .2, 4: .2, 5: .2, 6: .3}}
+            with self.subTest(game=game):
+                raffle = self.new_raffle(sql_settlement=True, exact_payouts=True, **kwargs)
+                self.buy(raffle, 200, 5)
+                expected = raffle.get_group_results(raffle.get_groups(raffle.tickets, winning_ticket))[0]
+                results = raffle.settle(winning_ticket)
+                self.assertEqual(dict(expected), dict(results))
+                rows = raffle.ledger.conn.execute(
+                    'select tier, owner_id, count, payout from draw_results where draw_id = ? order by tier, owner_id',
+                    (raffle.draw_id,),
+                ).fetchall()
+                self.assertEqual(
+                    sorted(
+                        (tier, owner_id, count, payout)
+                        for tier, column in results.columns.items()
+                        for owner_id, count, payout in zip(column.ids, column.counts, column.payouts)
+                    ),
+                    rows,
+                )
+                winning_mask, = raffle.ledger.conn.execute(
+                    'select winning_mask from draws where draw_id = ?', (raffle.draw_id,),
+                ).fetchone()
+                self.assertEqual(encode_ticket(winning_ticket), winning_mask)
+
+    def test_new_draw(self):
+        """Test a new draw gets its own id and tickets"""
+        raffle = self.new_raffle()
+        raffle.purchase('foo', 3)
+        draw_id = raffle.draw_id
+        raffle.settle({3, 7, 8, 11, 12})
+        raffle.start_draw()
+        self.assertNotEqual(draw_id, raffle.draw_id)
+        self.assertEqual([], raffle.ledger.get_masks(raffle.draw_id, 'foo'))
+        raffle.purchase('foo', 2)
+        self.assertEqual(3, len(raffle.ledger.get_masks(draw_id, 'foo')))
+        self.assertEqual(2, len(raffle.ledger.get_masks(raffle.draw_id, 'foo')))
+
+    def test_too_many_numbers(self):
+        with self.assertRaises(ValueError):
+            LedgerRaffle(self.path, game=Game(64, 2), reward_percentages={2: 1.}, sink=NullSink())
+
+
+if __name__ == '__main__':
+    unittest.main()
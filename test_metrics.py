@@ -0,0 +1,81 @@
+import unittest
+
+from metrics import Histogram, Metrics
+from raffle import Raffle, State, NullSink, RaffleRNG
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram([.1, 1])
+        for value in (.05, .1, .5, 2):
+            histogram.observe(value)
+        self.assertEqual([('0.1', 2), ('1.0', 3), ('+Inf', 4)], histogram.cumulative())
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(2.65, histogram.sum)
+
+    def test_counters(self):
+        metrics = Metrics()
+        metrics.inc('tickets_allocated', 3)
+        metrics.inc('tickets_allocated')
+        metrics.inc('winners', 2, tier=2)
+        self.assertEqual(4, metrics.get('tickets_allocated'))
+        self.assertEqual(2, metrics.get('winners', tier=2))
+        self.assertEqual(0, metrics.get('winners', tier=3))
+        self.assertEqual(
+            {'tickets_allocated': 4, 'winners{tier="2"}': 2},
+            metrics.snapshot()['counters'],
+        )
+
+    def test_to_prometheus(self):
+        metrics = Metrics(buckets=[.1])
+        metrics.inc('winners', 2, tier=2)
+        metrics.observe('settle', .05)
+        self.assertEqual(
+            '# TYPE raffle_winners_total counter\n'
+            'raffle_winners_total{tier="2"} 2\n'
+            '# TYPE raffle_settle_seconds histogram\n'
+            'raffle_settle_seconds_bucket{le="0.1"} 1\n'
+            'raffle_settle_seconds_bucket{le="+Inf"} 1\n'
+            'raffle_settle_seconds_sum 0.05\n'
+            'raffle_settle_seconds_count 1\n',
+            metrics.to_prometheus(),
+        )
+
+    def test_raffle_metrics(self):
+        """Test a draw records its tickets, winners and the latency of every stage"""
+        metrics = Metrics()
+        raffle = Raffle(state=State.ONGOING, sink=NullSink(), rng=RaffleRNG(0), metrics=metrics)
+        raffle.buy_tickets('foo', 10)
+        raffle.buy_tickets('bar', 5)
+        raffle.get_ticket()
+        raffle.handle_run_raffle()
+        self.assertEqual(16, metrics.get('tickets_allocated'))
+        self.assertEqual(15, metrics.get('tickets_settled'))
+        self.assertEqual(1, metrics.get('draws_settled'))
+        winning_tickets = sum(metrics.get('winning_tickets', tier=tier) for tier in raffle.reward_percentages)
+        self.assertEqual(sum(len(results) for results in raffle.draw_results.values()), sum(
+            metrics.get('winners', tier=tier) for tier in raffle.reward_percentages
+        ))
+        self.assertLessEqual(winning_tickets, 15)
+        histograms = metrics.snapshot()['histograms']
+        self.assertEqual(2, histograms['buy_tickets']['count'])
+        for stage in ('get_ticket', 'get_groups', 'get_group_results', 'settle', 'handle_run_raffle'):
+            self.assertEqual(1, histograms[stage]['count'])
+
+    def test_failed_call_is_timed(self):
+        metrics = Metrics()
+        raffle = Raffle(state=State.ONGOING, sink=NullSink(), available_tickets=[], metrics=metrics)
+        with self.assertRaises(RuntimeError):
+            raffle.get_ticket()
+        self.assertEqual(1, metrics.snapshot()['histograms']['get_ticket']['count'])
+        self.assertEqual(0, metrics.get('tickets_allocated'))
+
+    def test_disabled(self):
+        raffle = Raffle(state=State.ONGOING, sink=NullSink())
+        self.assertIsNone(raffle.metrics)
+        raffle.buy_tickets('foo', 10)
+        raffle.handle_run_raffle()
+
+
+if __name__ == '__main__':
+    unittest.main()
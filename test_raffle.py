@@ -1,8 +1,22 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from math import factorial
+import io
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
 
-from raffle import TICKET_PRICE, Raffle, State, INITIAL_POT_SIZE, generate_numbers
+import raffle
+from raffle import (
+    TICKET_PRICE, Raffle, State, INITIAL_POT_SIZE, TicketStore, TicketAllocator, MatchTable,
+    ALL_TICKETS, generate_numbers, encode_ticket, decode_ticket, fmt_ticket, run_batch,
+    ConsoleSink, JSONLinesSink, NullSink, count_matches, count_tiers, group_matches, get_matching_tickets, RaffleRNG,
+    Game, TICKET_RANKS, split_cents, to_cents, from_cents, TierWinners, DrawResults,
+)
 
 
 
@@ -271,6 +285,70 @@ class TestRunRaffle(unittest.TestCase):
         self.assertEqual(0, len(groups[4]))
         self.assertEqual(1, len(groups[5]))
 
+    def test_get_groups_matches_set_intersection(self):
+        """Test get_groups() gives the same per-name counts, in the same order, as intersecting ticket sets"""
+        rng = random.Random(42)
+        name2tickets = {
+            f'user{i}': [set(rng.sample(range(1, 16), 5)) for _ in range(rng.randrange(0, 20))]
+            for i in range(200)
+        }
+        winning_ticket = set([2, 3, 5, 7, 11])
+        expected = {2: dict(), 3: dict(), 4: dict(), 5: dict()}
+        for name, tickets in name2tickets.items():
+            for ticket in tickets:
+                num_winning_numbers = len(winning_ticket.intersection(ticket))
+                if num_winning_numbers in expected:
+                    group = expected[num_winning_numbers]
+                    group[name] = group.get(name, 0) + 1
+
+        raffle = Raffle(state=State.ONGOING, name2tickets=name2tickets)
+        groups = raffle.get_groups(raffle.tickets, winning_ticket)
+        for group_number, name2count in expected.items():
+            self.assertEqual(list(name2count.items()), list(groups[group_number].items()))
+
+    def test_columnar_results(self):
+        """Test settlement keeps owner ids, counts and payouts per tier and only builds rows when asked"""
+        name2tickets = {
+            'James': [set([4,7,8,13,14])],
+            'Ben': [set([3,6,9,11,13]), set([3,7,8,11,14])],
+            'Romeo': [set([3,7,9,14,15]), set([4,5,10,12,15]), set([1,2,7,12,13])],
+        }
+        raffle = Raffle(state=State.ONGOING, name2tickets=name2tickets, pot_size=100+6*TICKET_PRICE)
+        groups = raffle.get_groups(raffle.tickets, set([3,7,8,11,12]))
+        self.assertIsInstance(groups[2], TierWinners)
+        self.assertEqual({'James': 1, 'Ben': 1, 'Romeo': 2}, dict(groups[2]))
+        self.assertEqual(2, groups[2]['Romeo'])
+        with self.assertRaises(KeyError):
+            groups[2]['Nobody']
+
+        results, total_reward = raffle.get_group_results(groups)
+        self.assertIsInstance(results, DrawResults)
+        self.assertEqual({}, results.rows)
+        names, ids, counts, payouts = results.columns[2]
+        self.assertEqual(['James', 'Ben', 'Romeo'], [names[owner_id] for owner_id in ids])
+        self.assertEqual([1, 1, 2], list(counts))
+        self.assertEqual([3.25, 3.25, 6.5], list(payouts))
+        self.assertEqual(3.25*2 + 6.5 + 32.5, total_reward)
+        self.assertEqual([{'name': 'Ben', 'count': 1, 'payout': 32.5}], results[4])
+        self.assertEqual([4], list(results.rows))
+        self.assertEqual({2: results[2], 3: [], 4: results[4], 5: []}, results)
+
+    def test_group_results_from_mappings(self):
+        """Test plain name-to-count mappings give the same results as the columnar tiers"""
+        name2tickets = {
+            f'user{i}': [set(random.Random(i).sample(range(1, 16), 5)) for _ in range(i % 7)]
+            for i in range(300)
+        }
+        for exact_payouts in (False, True):
+            raffle = Raffle(state=State.ONGOING, name2tickets=name2tickets, exact_payouts=exact_payouts)
+            groups = raffle.get_groups(raffle.tickets, set([2, 3, 5, 7, 11]))
+            results, total_reward = raffle.get_group_results(groups)
+            plain_results, plain_total_reward = raffle.get_group_results(
+                {group_number: dict(winners) for group_number, winners in groups.items()}
+            )
+            self.assertEqual(dict(plain_results), dict(results))
+            self.assertEqual(plain_total_reward, total_reward)
+
     def test_calc_payout(self):
         """Test user payout calculation"""
         raffle = Raffle(state=State.ONGOING)
@@ -305,6 +383,544 @@ class TestRunRaffle(unittest.TestCase):
         self.assertEqual(name2payout['baz'], 4)
 
 
+class TestExactPayouts(unittest.TestCase):
+    def test_split_cents_property(self):
+        """Test random splits always add up exactly and every share is within a cent of its exact value"""
+        rng = random.Random(0)
+        for _ in range(2000):
+            counts = [rng.randrange(1, 50) for _ in range(rng.randrange(1, 40))]
+            total_cents = rng.randrange(0, 10**9)
+            shares = split_cents(total_cents, counts)
+            self.assertEqual(total_cents, sum(shares))
+            total_count = sum(counts)
+            for share, count in zip(shares, counts):
+                self.assertIn(share - total_cents * count // total_count, (0, 1))
+            self.assertEqual(shares, split_cents(total_cents, counts))
+
+    def test_split_cents_largest_remainder(self):
+        self.assertEqual([334, 333, 333], split_cents(1000, [1, 1, 1]))
+        self.assertEqual([286, 428, 286], split_cents(1000, [2, 3, 2]))
+        self.assertEqual([0, 0], split_cents(0, [1, 2]))
+        self.assertEqual([], split_cents(100, []))
+
+    def test_cents(self):
+        self.assertEqual(30, to_cents(.1 + .2))
+        self.assertEqual(12345, to_cents(123.45))
+        self.assertEqual(100, from_cents(10000))
+        self.assertEqual(3.33, from_cents(333))
+
+    def test_calc_payout_exact(self):
+        raffle = Raffle(state=State.ONGOING, exact_payouts=True)
+        name2payout = raffle.calc_payout_per_user({'foo': 1, 'bar': 1, 'baz': 1}, 10)
+        self.assertEqual({'foo': 3.34, 'bar': 3.33, 'baz': 3.33}, name2payout)
+
+    def test_pot_stays_in_cents(self):
+        """Test the pot stays whole cents over many draws and goes down by exactly the payouts"""
+        rng = random.Random(1)
+        raffle = Raffle(sink=NullSink(), ticket_price=1.1, exact_payouts=True, rng=RaffleRNG(1))
+        for _ in range(200):
+            raffle.start_draw()
+            for i in range(rng.randrange(1, 30)):
+                raffle.assign_tickets(f'user{i}', raffle.allocate_tickets(f'user{i}', rng.randrange(1, 5)))
+            pot_cents = to_cents(raffle.pot_size)
+            results = raffle.settle(raffle.get_winning_ticket())
+            paid_cents = sum(to_cents(res['payout']) for group_results in results.values() for res in group_results)
+            self.assertEqual(pot_cents - paid_cents, to_cents(raffle.pot_size))
+            self.assertEqual(raffle.pot_size, from_cents(to_cents(raffle.pot_size)))
+
+
+class TestTicketStore(unittest.TestCase):
+    def test_encode_decode_ticket(self):
+        """Test ticket masks round trip to the same set of numbers"""
+        mask = encode_ticket([1, 2, 3, 4, 15])
+        self.assertEqual(0b100000000001111, mask)
+        self.assertEqual(set([1, 2, 3, 4, 15]), decode_ticket(mask))
+        self.assertEqual("1 2 3 4 15", fmt_ticket(mask))
+
+    def test_name2tickets_round_trip(self):
+        """Test converting name2tickets to a store and back gives the same tickets"""
+        name2tickets = {
+            'foo': [set([1, 2, 3, 4, 5]), set([11, 12, 13, 14, 15])],
+            'bar': [],
+            'baz': [set([2, 4, 6, 8, 10])],
+        }
+        store = TicketStore.from_name2tickets(name2tickets)
+        self.assertEqual(3, len(store))
+        self.assertEqual(['foo', 'bar', 'baz'], store.names)
+        self.assertEqual(name2tickets, store.to_name2tickets())
+
+    def test_raffle_name2tickets_view(self):
+        """Test Raffle.name2tickets is a view of the ticket store"""
+        raffle = Raffle(state=State.ONGOING)
+        raffle.buy_tickets('foo', 3)
+        self.assertEqual(3, len(raffle.tickets))
+        self.assertEqual(raffle.tickets.to_name2tickets(), dict(raffle.name2tickets))
+        for ticket in raffle.name2tickets['foo']:
+            self.assertEqual(5, len(ticket))
+            self.assertNotIn(encode_ticket(ticket), raffle.available_tickets)
+
+    def test_index(self):
+        """Test the store keeps sold ticket counts per mask and per owner"""
+        a, b = encode_ticket([1, 2, 3, 4, 5]), encode_ticket([2, 4, 6, 8, 10])
+        store = TicketStore(indexed=True)
+        store.add('foo', [a, a, b])
+        store.add('bar', [a])
+        self.assertEqual({a: 3, b: 1}, store.ticket_counts)
+        self.assertEqual({a: {0: 2, 1: 1}, b: {0: 1}}, store.ticket_owners)
+
+    def test_index_only_for_imported_tickets(self):
+        """Test sold tickets are not indexed, unlike imported ones"""
+        raffle = Raffle(state=State.ONGOING, sink=NullSink())
+        raffle.buy_tickets('foo', 3)
+        self.assertFalse(raffle.tickets.indexed)
+        self.assertEqual({}, raffle.tickets.ticket_counts)
+        raffle = Raffle(state=State.ONGOING, name2tickets={'foo': [{1, 2, 3, 4, 5}]}, sink=NullSink())
+        self.assertTrue(raffle.tickets.indexed)
+        raffle.start_draw()
+        self.assertFalse(raffle.tickets.indexed)
+
+    def test_get_matching_tickets(self):
+        """Test enumerating the tickets that share at least 2 numbers with the winning ticket"""
+        winning_mask = encode_ticket([3, 7, 8, 11, 12])
+        tickets = get_matching_tickets(winning_mask, 2)
+        expected = [
+            (mask, (mask & winning_mask).bit_count())
+            for mask in ALL_TICKETS
+            if (mask & winning_mask).bit_count() >= 2
+        ]
+        self.assertEqual(1701, len(tickets))
+        self.assertEqual(sorted(expected), sorted(tickets))
+
+    def test_count_winners_with_index(self):
+        """Test counting winners through the index gives the same counts as scanning every ticket"""
+        rng = random.Random(7)
+        store = TicketStore(indexed=True)
+        for i in range(500):
+            store.add(f'user{i}', [rng.choice(ALL_TICKETS[:50]) for _ in range(rng.randrange(0, 30))])
+        for winning_mask in rng.sample(list(ALL_TICKETS), 10):
+            expected = group_matches(count_matches(store.masks, store.owners, winning_mask), 2)
+            counts = store.count_winners(winning_mask, 2)
+            self.assertEqual(
+                {n: list(owner2count.items()) for n, owner2count in expected.items()},
+                {n: list(owner2count.items()) for n, owner2count in counts.items()},
+            )
+
+    def test_count_tiers(self):
+        """Test the per-tier counting pass gives the same counts, in the same order, as count_matches()"""
+        rng = random.Random(8)
+        store = TicketStore()
+        for i in range(2000):
+            store.add(f'user{i}', [rng.choice(ALL_TICKETS) for _ in range(rng.randrange(0, 3))])
+        store.add('user5', [ALL_TICKETS[0]])
+        for winning_mask in rng.sample(list(ALL_TICKETS), 10):
+            expected = group_matches(count_matches(store.masks, store.owners, winning_mask), 2)
+            counts = count_tiers(store.masks, store.owners, winning_mask, 2)
+            self.assertEqual(
+                {n: list(owner2count.items()) for n, owner2count in expected.items()},
+                {n: list(owner2count.items()) for n, owner2count in counts.items()},
+            )
+
+
+class TestTicketAllocator(unittest.TestCase):
+    def test_draw_all_tickets(self):
+        """Test drawing every ticket one by one gives each combination exactly once"""
+        allocator = TicketAllocator()
+        num_combinations = len(allocator)
+        drawn = [allocator.draw() for _ in range(num_combinations)]
+        self.assertEqual(num_combinations, len(set(drawn)))
+        self.assertEqual(0, len(allocator))
+        with self.assertRaises(RuntimeError):
+            allocator.draw()
+
+    def test_allocate(self):
+        """Test allocate() hands out unique tickets and removes them from the pool"""
+        allocator = TicketAllocator()
+        len_before = len(allocator)
+        tickets = allocator.allocate(100)
+        self.assertEqual(100, len(set(tickets)))
+        self.assertEqual(len_before - 100, len(allocator))
+        for ticket in tickets:
+            self.assertNotIn(ticket, allocator)
+        rest = allocator.allocate(len_before)
+        self.assertEqual(len_before - 100, len(rest))
+        self.assertEqual(len_before, len(set(tickets) | set(rest)))
+        self.assertEqual(0, len(allocator.allocate(1)))
+
+    def test_new_pool_is_lazy(self):
+        """Test a new pool stores nothing until tickets are taken out, and then only the moved ranks"""
+        allocator = TicketAllocator()
+        self.assertEqual(0, len(allocator.pos2rank) + len(allocator.rank2pos))
+        self.assertEqual(list(ALL_TICKETS), list(allocator))
+        allocator.allocate(10)
+        self.assertLessEqual(len(allocator.pos2rank), 10)
+        self.assertLessEqual(len(allocator.rank2pos), 20)
+
+    def test_remove(self):
+        """Test remove() takes out exactly the given tickets, ignoring ones that are not in the pool"""
+        allocator = TicketAllocator(rng=RaffleRNG(0))
+        sold = list(allocator.allocate(50))
+        removed = [ALL_TICKETS[0], ALL_TICKETS[-1], sold[0]]
+        allocator.remove(removed)
+        self.assertEqual(len(ALL_TICKETS) - 52, len(allocator))
+        remaining = set(ALL_TICKETS) - set(sold) - set(removed)
+        self.assertEqual(remaining, set(allocator))
+        for mask in removed:
+            self.assertNotIn(mask, allocator)
+        self.assertEqual(remaining, set(allocator.allocate(len(ALL_TICKETS))))
+
+    def test_custom_pool(self):
+        """Test a pool of given tickets only hands out those tickets"""
+        masks = [encode_ticket(ticket) for ticket in ({1, 2, 3, 4, 5}, {2, 3, 4, 5, 6}, {3, 4, 5, 6, 7})]
+        allocator = TicketAllocator(masks)
+        self.assertEqual(3, len(allocator))
+        self.assertNotIn(encode_ticket({11, 12, 13, 14, 15}), allocator)
+        self.assertEqual(sorted(masks), sorted([allocator.draw()] + list(allocator.allocate(5))))
+
+class TestGame(unittest.TestCase):
+    def test_rank_unrank(self):
+        """Test ranks follow the order of itertools.combinations and unrank() inverts rank()"""
+        for num_numbers, pick in ((7, 3), (6, 6), (9, 1), (12, 4)):
+            game = Game(num_numbers, pick)
+            combinations = list(itertools.combinations(range(1, num_numbers + 1), pick))
+            self.assertEqual(len(combinations), game.num_tickets)
+            for rank, ticket in enumerate(combinations):
+                mask = encode_ticket(ticket)
+                self.assertEqual(rank, game.rank(mask))
+                self.assertEqual(mask, game.unrank(rank))
+
+    def test_rank_without_tables(self):
+        """Test the computed ranks of the default game agree with its tables"""
+        game = Game(15, 5)
+        game.table = game.ranks = None
+        for mask, rank in TICKET_RANKS.items():
+            self.assertEqual(rank, game.rank(mask))
+            self.assertEqual(mask, game.unrank(rank))
+
+    def test_rank_invalid_ticket(self):
+        game = Game(49, 6)
+        self.assertIsNone(game.rank(encode_ticket([1, 2, 3, 4, 5])))
+        self.assertIsNone(game.rank(encode_ticket([1, 2, 3, 4, 5, 50])))
+        self.assertEqual(game.num_tickets - 1, game.rank(encode_ticket(range(44, 50))))
+
+    def test_mask_typecode(self):
+        self.assertEqual('H', Game(15, 5).mask_typecode)
+        self.assertEqual('Q', Game(49, 6).mask_typecode)
+        self.assertIsNone(Game(80, 10).mask_typecode)
+        with self.assertRaises(ValueError):
+            Game(5, 6)
+
+    def test_raffle_large_game(self):
+        """Test a 49-pick-6 draw sells valid unique tickets and only stores what it sold"""
+        raffle = Raffle(
+            state=State.ONGOING, pot_size=0, game=Game(49, 6), sink=NullSink(),
+            reward_percentages={3: .1, 4: .15, 5: .25, 6: .5}, rng=RaffleRNG(0),
+        )
+        self.assertEqual(13983816, len(raffle.available_tickets))
+        for i in range(100):
+            raffle.buy_tickets(f'user{i}', 10)
+        tickets = [ticket for name in raffle.name2tickets for ticket in raffle.name2tickets[name]]
+        self.assertEqual(1000, len({frozenset(ticket) for ticket in tickets}))
+        for ticket in tickets:
+            self.assertEqual(6, len(ticket))
+            self.assertTrue(ticket <= set(range(1, 50)))
+            self.assertNotIn(encode_ticket(ticket), raffle.available_tickets)
+        self.assertEqual(13983816 - 1000, len(raffle.available_tickets))
+        self.assertLessEqual(len(raffle.available_tickets.rank2pos), 2000)
+        self.assertEqual(1000 * TICKET_PRICE, raffle.pot_size)
+
+        results = raffle.settle(tickets[0])
+        self.assertEqual([3, 4, 5, 6], sorted(results))
+        self.assertEqual([{'name': 'user0', 'count': 1, 'payout': .5 * 1000 * TICKET_PRICE}], results[6])
+
+    def test_get_groups_mapping_large_game(self):
+        """Test get_groups() encodes a mapping of tickets for the raffle's game"""
+        raffle = Raffle(game=Game(49, 6), reward_percentages={3: .5, 6: .5}, sink=NullSink())
+        groups = raffle.get_groups({'x': [{40, 41, 42, 43, 44, 45}], 'y': [{1, 2, 3, 43, 44, 45}]}, {40, 41, 42, 43, 44, 45})
+        self.assertEqual({'x': 1}, dict(groups[6]))
+        self.assertEqual({'y': 1}, dict(groups[3]))
+
+    def test_raffle_more_than_64_numbers(self):
+        """Test games with more than 64 numbers keep their tickets as Python ints"""
+        raffle = Raffle(
+            state=State.ONGOING, game=Game(80, 10), sink=NullSink(),
+            reward_percentages={8: .2, 9: .3, 10: .5}, rng=RaffleRNG(0),
+        )
+        raffle.buy_tickets('foo', 5)
+        self.assertIsInstance(raffle.tickets.masks, list)
+        ticket = raffle.name2tickets['foo'][0]
+        self.assertEqual(10, len(ticket))
+        results = raffle.settle(ticket)
+        self.assertEqual('foo', results[10][0]['name'])
+        self.assertEqual(1, results[10][0]['count'])
+
+    def test_invalid_tiers(self):
+        with self.assertRaises(ValueError):
+            Raffle(game=Game(10, 3))
+        with self.assertRaises(ValueError):
+            Raffle(reward_percentages={2: .5, 6: .5})
+        with self.assertRaises(ValueError):
+            Raffle(game=Game(49, 6), reward_percentages={6: 1}, match_table=MatchTable())
+
+
+class TestMatchTable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.match_table = MatchTable(os.path.join(cls.tmpdir.name, 'match_table.u8'))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.match_table.close()
+        cls.tmpdir.cleanup()
+
+    def test_match_counts(self):
+        """Test the table holds the number of matching numbers for ticket pairs"""
+        rng = random.Random(0)
+        for _ in range(100):
+            mask, other = rng.choice(ALL_TICKETS), rng.choice(ALL_TICKETS)
+            self.assertEqual(len(decode_ticket(mask) & decode_ticket(other)), self.match_table.get(mask, other))
+        self.assertTrue(os.path.exists(self.match_table.path))
+
+    def test_rebuilds_invalid_file(self):
+        """Test a cache file of the right size without a matching header is rebuilt, not trusted"""
+        path = os.path.join(self.tmpdir.name, 'planted.u8')
+        for data in (bytes(MatchTable.size * MatchTable.size),
+                     b'raffle-match-table/1\n' + bytes(32 + MatchTable.size * MatchTable.size)):
+            with open(path, 'wb') as f:
+                f.write(data)
+            match_table = MatchTable(path)
+            mask, other = ALL_TICKETS[0], ALL_TICKETS[1]
+            self.assertEqual(len(decode_ticket(mask) & decode_ticket(other)), match_table.get(mask, other))
+            match_table.close()
+
+    def test_default_path_per_user(self):
+        """Test the default cache file is in the per-user cache directory"""
+        with patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmpdir.name}):
+            self.assertEqual(os.path.join(self.tmpdir.name, 'raffle', 'match_table.u8'), MatchTable().path)
+
+    def test_get_groups_with_match_table(self):
+        """Test get_groups() gives the same groups with and without a match table"""
+        rng = random.Random(1)
+        name2tickets = {
+            f'user{i}': [set(rng.sample(range(1, 16), 5)) for _ in range(rng.randrange(0, 20))]
+            for i in range(200)
+        }
+        winning_ticket = set([1, 4, 6, 9, 15])
+        raffle = Raffle(state=State.ONGOING, name2tickets=name2tickets)
+        expected = raffle.get_groups(raffle.tickets, winning_ticket)
+        raffle.match_table = self.match_table
+        groups = raffle.get_groups(raffle.tickets, winning_ticket)
+        for group_number, name2count in expected.items():
+            self.assertEqual(list(name2count.items()), list(groups[group_number].items()))
+
+class TestRaffleRNG(unittest.TestCase):
+    def play(self, rng):
+        raffle = Raffle(state=State.ONGOING, sink=NullSink(), rng=rng)
+        raffle.buy_tickets('foo', 10)
+        raffle.buy_tickets('bar', 1)
+        raffle.handle_run_raffle()
+        return raffle.tickets.to_name2tickets(), raffle.draw_results, sorted(raffle.available_tickets)
+
+    def test_same_seed_same_draw(self):
+        """Test raffles with the same seed sell the same tickets and draw the same winners"""
+        self.assertEqual(self.play(1), self.play(1))
+        self.assertEqual(self.play(RaffleRNG('foo')), self.play('foo'))
+        self.assertNotEqual(self.play(1), self.play(2))
+
+    def test_spawn(self):
+        """Test spawned streams are reproducible and independent of each other"""
+        streams = RaffleRNG(5).spawn(3)
+        again = RaffleRNG(5).spawn(3)
+        self.assertEqual(
+            [stream.winning_tickets(5) for stream in streams],
+            [stream.winning_tickets(5) for stream in again],
+        )
+        rng = RaffleRNG(5)
+        first, second = rng.spawn(1)[0], rng.spawn(1)[0]
+        self.assertNotEqual(first.seed, second.seed)
+        self.assertNotEqual(first.winning_tickets(5), second.winning_tickets(5))
+
+    def test_batch_generation(self):
+        """Test batch calls generate valid winning tickets and swap positions"""
+        rng = RaffleRNG(0)
+        for ticket in rng.winning_tickets(100):
+            self.assertEqual(5, len(ticket))
+            self.assertTrue(ticket <= set(range(1, 16)))
+        indices = rng.shuffle_indices(10, 10)
+        self.assertEqual(10, len(indices))
+        for i, index in enumerate(indices):
+            self.assertTrue(0 <= index < 10 - i)
+
+
+class TestBatch(unittest.TestCase):
+    def test_handle_command(self):
+        """Test batch commands go through the same state transitions as the menu options"""
+        raffle = Raffle(pot_size=0)
+        with self.assertRaises(ValueError):
+            raffle.handle_command({'op': 'buy', 'name': 'foo', 'num_tickets': 1})
+        self.assertEqual({'op': 'new_draw', 'pot_size': 0}, raffle.handle_command({'op': 'new_draw'}))
+        self.assertEqual(State.ONGOING, raffle.state)
+
+        result = raffle.handle_command({'op': 'buy', 'name': 'foo', 'num_tickets': 3})
+        self.assertEqual(3, len(result['tickets']))
+        self.assertEqual(3 * TICKET_PRICE, result['pot_size'])
+        self.assertEqual([sorted(ticket) for ticket in raffle.name2tickets['foo']], result['tickets'])
+
+        raffle.get_winning_ticket = MagicMock()
+        raffle.get_winning_ticket.return_value = set(result['tickets'][0])
+        result = raffle.handle_command({'op': 'run'})
+        self.assertEqual(sorted(raffle.get_winning_ticket.return_value), result['winning_ticket'])
+        self.assertEqual(raffle.draw_results, result['results'])
+        self.assertEqual(State.NOT_STARTED, raffle.state)
+
+    def test_handle_command_invalid(self):
+        """Test invalid commands raise ValueError"""
+        raffle = Raffle(state=State.ONGOING)
+        for command in ({'op': 'foo'}, {'op': 'buy', 'name': '', 'num_tickets': 1},
+                        {'op': 'buy', 'name': 'foo', 'num_tickets': 0}, {'op': 'buy', 'name': 'foo', 'num_tickets': True},
+                        ['run'], {'op': ['x']}, {'op': {}}):
+            with self.assertRaises(ValueError):
+                raffle.handle_command(command)
+
+    def test_run_batch(self):
+        """Test run_batch() writes one JSON result per command, including errors"""
+        infile = io.StringIO(
+            '{"op": "new_draw"}\n'
+            '{"op": "buy", "name": "foo", "num_tickets": 2}\n'
+            '\n'
+            '{"op": "buy", "name": "foo", "num_tickets": 2}\n'
+            'not json\n'
+            '{"op": ["x"]}\n'
+            '{"op": "run"}\n'
+        )
+        outfile = io.StringIO()
+        num_commands, _ = run_batch(Raffle(), infile, outfile)
+        results = [json.loads(line) for line in outfile.getvalue().splitlines()]
+        self.assertEqual(6, num_commands)
+        self.assertEqual(6, len(results))
+        self.assertEqual(['new_draw', 'buy'], [result['op'] for result in results[:2]])
+        self.assertIn('error', results[2])
+        self.assertIn('error', results[3])
+        self.assertIn('error', results[4])
+        self.assertEqual('run', results[5]['op'])
+
+    def test_handle_command_status(self):
+        """Test the status command reports the draw without changing it"""
+        raffle = Raffle(state=State.ONGOING, pot_size=0)
+        raffle.handle_command({'op': 'buy', 'name': 'foo', 'num_tickets': 3})
+        self.assertEqual(
+            {'op': 'status', 'state': 'ONGOING', 'pot_size': 3 * TICKET_PRICE,
+             'num_tickets_sold': 3, 'num_tickets_available': len(ALL_TICKETS) - 3},
+            raffle.handle_command({'op': 'status'}),
+        )
+        self.assertEqual(State.ONGOING, raffle.state)
+
+
+class TestStartup(unittest.TestCase):
+    def run_python(self, code):
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+        return json.loads(proc.stdout)
+
+    def test_status_is_lazy(self):
+        """Test a status run builds no ticket tables and imports no CLI-only modules"""
+        result = self.run_python(
+            'import json, sys, raffle\n'
+            'status = raffle.Raffle().get_status()\n'
+            'print(json.dumps({\n'
+            '    "status": status,\n'
+            '    "tables": raffle.get_all_tickets.cache_info().currsize,\n'
+            '    "modules": sorted({"argparse", "tempfile"} & set(sys.modules)),\n'
+            '}))\n'
+        )
+        self.assertEqual('NOT_STARTED', result['status']['state'])
+        self.assertEqual(0, result['tables'])
+        self.assertEqual([], result['modules'])
+
+    def test_lazy_tables(self):
+        """Test the module-level ticket tables are built on first access"""
+        result = self.run_python(
+            'import json, raffle\n'
+            'before = raffle.get_all_tickets.cache_info().currsize\n'
+            'print(json.dumps([before, len(raffle.ALL_TICKETS), len(raffle.TICKET_STRINGS)]))\n'
+        )
+        self.assertEqual([0, 3003, 3003], result)
+        with self.assertRaises(AttributeError):
+            raffle.NOT_A_TABLE
+
+
+class TestSinks(unittest.TestCase):
+    def run_readme_example(self, sink):
+        name2tickets = {
+            'James': [set([4,7,8,13,14])],
+            'Ben': [set([3,6,9,11,13]), set([3,7,8,11,14])],
+        }
+        raffle = Raffle(state=State.ONGOING, name2tickets=name2tickets, pot_size=130, sink=sink)
+        raffle.get_winning_ticket = MagicMock()
+        raffle.get_winning_ticket.return_value = set([3,7,8,11,12])
+        raffle.handle_run_raffle()
+
+    def test_console_sink(self):
+        """Test the console sink renders the run and its results as text"""
+        out = io.StringIO()
+        self.run_readme_example(ConsoleSink(out))
+        self.assertEqual(
+            "Running Raffle...\n"
+            "Winning ticket is 3 7 8 11 12\n"
+            "\n"
+            "Group 2 Winners:\n"
+            "James with 1 winning ticket(s)- $6.5\n"
+            "Ben with 1 winning ticket(s)- $6.5\n"
+            "\n"
+            "Group 3 Winners:\n"
+            "Nil\n"
+            "\n"
+            "Group 4 Winners:\n"
+            "Ben with 1 winning ticket(s)- $32.5\n"
+            "\n"
+            "Group 5 Winners:\n"
+            "Nil\n"
+            "\n",
+            out.getvalue(),
+        )
+
+    def test_console_sink_buy_tickets(self):
+        """Test the console sink writes a purchase in a single chunk"""
+        out = MagicMock()
+        raffle = Raffle(state=State.ONGOING, sink=ConsoleSink(out))
+        raffle.buy_tickets('foo', 2)
+        out.write.assert_called_once()
+        lines = out.write.call_args[0][0].splitlines()
+        self.assertEqual("Hi foo, you have purchased 2 ticket(s)", lines[0])
+        tickets = raffle.tickets.get_masks('foo')
+        self.assertEqual([f"Ticket {i}: {fmt_ticket(t)}" for i, t in enumerate(tickets, 1)], lines[1:])
+
+    def test_jsonlines_sink(self):
+        """Test the JSON-lines sink writes one JSON object per event"""
+        out = io.StringIO()
+        self.run_readme_example(JSONLinesSink(out))
+        events = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(['raffle_run', 'draw_results'], [event['event'] for event in events])
+        self.assertEqual([3, 7, 8, 11, 12], events[0]['winning_ticket'])
+        self.assertEqual({'name': 'Ben', 'count': 1, 'payout': 32.5}, events[1]['results']['4'][0])
+
+    def test_null_sink(self):
+        """Test the null sink drops all events"""
+        raffle = Raffle(sink=NullSink())
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            raffle.handle_option(1)
+            raffle.buy_tickets('foo', 3)
+            raffle.handle_run_raffle()
+        self.assertEqual('', stdout.getvalue())
+
+    def test_sink_without_emit(self):
+        """Test a sink that does not implement emit fails when it is created"""
+        class NoEmitSink(raffle.Sink):
+            pass
+
+        with self.assertRaises(TypeError):
+            NoEmitSink()
+
 
 if __name__ == '__main__':
     unittest.main()
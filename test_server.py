@@ -0,0 +1,129 @@
+import unittest
+import asyncio
+import json
+
+from raffle import Raffle, State, TICKET_PRICE, encode_ticket
+from server import RaffleServer
+from metrics import Metrics
+
+
+class TestRaffleServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.raffle = Raffle(pot_size=0)
+        self.server = RaffleServer(self.raffle)
+        self.port = await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def send(self, *commands):
+        """Send commands on one connection and return their results"""
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        results = []
+        for command in commands:
+            writer.write(json.dumps(command).encode() + b'\n')
+            await writer.drain()
+            results.append(json.loads(await reader.readline()))
+        writer.close()
+        await writer.wait_closed()
+        return results
+
+    async def test_concurrent_buys(self):
+        """Test concurrent buyers get unique tickets and the pot adds up"""
+        await self.send({'op': 'new_draw'})
+        results = await asyncio.gather(*(
+            self.send({'op': 'buy', 'name': f'user{i}', 'num_tickets': 3})
+            for i in range(50)
+        ))
+        tickets = [encode_ticket(ticket) for (result,) in results for ticket in result['tickets']]
+        self.assertEqual(150, len(tickets))
+        self.assertEqual(150, len(set(tickets)))
+        status, = await self.send({'op': 'status'})
+        self.assertEqual('status', status['op'])
+        self.assertEqual(150 * TICKET_PRICE, status['pot_size'])
+        self.assertEqual(150, status['num_tickets_sold'])
+        self.assertEqual(State.ONGOING.name, status['state'])
+
+    async def test_metrics(self):
+        """Test the metrics op serves a snapshot once metrics are enabled"""
+        error, = await self.send({'op': 'metrics'})
+        self.assertIn('error', error)
+        self.raffle.metrics = Metrics()
+        _, _, snapshot = await self.send(
+            {'op': 'new_draw'},
+            {'op': 'buy', 'name': 'foo', 'num_tickets': 4},
+            {'op': 'metrics'},
+        )
+        self.assertEqual(4, snapshot['counters']['tickets_allocated'])
+
+    async def test_errors(self):
+        """Test invalid commands and state transitions get error results"""
+        results = await self.send(
+            {'op': 'buy', 'name': 'foo', 'num_tickets': 1},
+            {'op': 'new_draw'},
+            {'op': 'buy', 'name': 'foo', 'num_tickets': 1},
+            {'op': 'buy', 'name': 'foo', 'num_tickets': 1},
+            {'op': 'buy', 'name': 'bar', 'num_tickets': -1},
+            {'op': 'foo'},
+        )
+        self.assertEqual([True, False, False, True, True, True], ['error' in result for result in results])
+
+    async def test_line_too_long(self):
+        """Test a line over the reader's limit gets an error result before the connection closes"""
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(json.dumps({'op': 'buy', 'name': 'x' * 100_000, 'num_tickets': 1}).encode() + b'\n')
+        await writer.drain()
+        result = json.loads(await asyncio.wait_for(reader.readline(), timeout=5))
+        self.assertIn('error', result)
+        self.assertEqual(b'', await asyncio.wait_for(reader.read(), timeout=5))
+        writer.close()
+        await writer.wait_closed()
+        status, = await self.send({'op': 'status'})
+        self.assertEqual(0, status['num_tickets_sold'])
+
+    async def test_writer_survives_errors(self):
+        """Test unexpected errors in a command get error results and later commands still go through"""
+        assign_tickets = self.raffle.assign_tickets
+        handle_command = self.raffle.handle_command
+
+        def fail_for_bad(name, tickets):
+            if name == 'bad':
+                raise OSError("disk full")
+            assign_tickets(name, tickets)
+
+        def fail_when_asked(command):
+            if command.get('op') == 'new_draw' and command.get('fail'):
+                raise OSError("disk full")
+            return handle_command(command)
+
+        self.raffle.assign_tickets = fail_for_bad
+        self.raffle.handle_command = fail_when_asked
+        # A dead writer never answers, time out instead of hanging
+        results = await asyncio.wait_for(self.send(
+            {'op': ['x']},
+            {'op': 'new_draw', 'fail': True},
+            {'op': 'new_draw'},
+            {'op': 'buy', 'name': 'bad', 'num_tickets': 1},
+            {'op': 'buy', 'name': 'foo', 'num_tickets': 2},
+        ), timeout=5)
+        self.assertEqual([True, True, False, True, False], ['error' in result for result in results])
+        self.assertEqual(2, len(results[4]['tickets']))
+        later, = await asyncio.wait_for(self.send({'op': 'buy', 'name': 'bar', 'num_tickets': 1}), timeout=5)
+        self.assertEqual(1, len(later['tickets']))
+        self.assertFalse(self.server.writer_task.done())
+
+    async def test_run(self):
+        """Test running the raffle settles the draw"""
+        self.raffle.get_winning_ticket = lambda: set([1, 2, 3, 4, 5])
+        results = await self.send(
+            {'op': 'new_draw'},
+            {'op': 'buy', 'name': 'foo', 'num_tickets': 10},
+            {'op': 'run'},
+            {'op': 'status'},
+        )
+        self.assertEqual([1, 2, 3, 4, 5], results[2]['winning_ticket'])
+        self.assertEqual(State.NOT_STARTED.name, results[3]['state'])
+
+
+if __name__ == '__main__':
+    unittest.main()
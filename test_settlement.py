@@ -0,0 +1,60 @@
+import unittest
+from array import array
+import random
+
+from raffle import Raffle, State, ALL_TICKETS, TicketStore, Game, RaffleRNG
+from settlement import ShardedRaffle, get_shards
+
+
+class TestShardedSettlement(unittest.TestCase):
+    def test_get_shards(self):
+        """Test shards cover all tickets without splitting an owner's run of tickets"""
+        owners = array('I', [0, 0, 0, 1, 2, 2, 2, 2, 3, 4])
+        shards = get_shards(owners, 3)
+        self.assertEqual([(0, 3), (3, 8), (8, 10)], shards)
+        self.assertEqual([(0, 10)], get_shards(array('I', [7] * 10), 4))
+        self.assertEqual([], get_shards(array('I'), 4))
+
+    def test_sharded_results_identical(self):
+        """Test sharded settlement gives exactly the same draw results as the serial path"""
+        rng = random.Random(3)
+        store = TicketStore()
+        for i in range(300):
+            store.add(f'user{i}', [rng.choice(ALL_TICKETS) for _ in range(rng.randrange(0, 40))])
+        winning_ticket = set([3, 7, 8, 11, 12])
+
+        serial = Raffle(state=State.ONGOING, name2tickets=store)
+        serial.settle(winning_ticket)
+        sharded = ShardedRaffle(num_workers=3, min_shard_size=100, state=State.ONGOING, name2tickets=store)
+        try:
+            sharded.settle(winning_ticket)
+        finally:
+            sharded.close()
+        self.assertEqual(serial.draw_results, sharded.draw_results)
+        for group_number, results in serial.draw_results.items():
+            self.assertEqual(results, sharded.draw_results[group_number])
+        self.assertEqual(serial.pot_size, sharded.pot_size)
+
+    def test_sharded_results_identical_other_game(self):
+        """Test sharding a 40-pick-6 draw, whose masks are not 16 bits, gives the serial results"""
+        game = Game(40, 6)
+        reward_percentages = {3: .1, 4: .2, 5: .3, 6: .4}
+        serial = Raffle(state=State.ONGOING, game=game, reward_percentages=reward_percentages, rng=RaffleRNG(0))
+        for i in range(100):
+            serial.assign_tickets(f'user{i}', serial.allocate_tickets(f'user{i}', 20))
+        winning_ticket = {1, 5, 9, 17, 23, 38}
+        sharded = ShardedRaffle(
+            num_workers=3, min_shard_size=100, state=State.ONGOING, name2tickets=serial.tickets,
+            pot_size=serial.pot_size, game=game, reward_percentages=reward_percentages,
+        )
+        try:
+            sharded.settle(winning_ticket)
+        finally:
+            sharded.close()
+        serial.settle(winning_ticket)
+        self.assertEqual(serial.draw_results, sharded.draw_results)
+        self.assertEqual(serial.pot_size, sharded.pot_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import random
+
+from raffle import RaffleRNG
+from simulate import BuyerDistribution, simulate, simulate_session, parse_reward_percentages
+
+
+class TestSimulate(unittest.TestCase):
+    def test_session_totals(self):
+        """Test the pot of a session equals the initial pot plus revenue minus payouts"""
+        session = simulate_session(RaffleRNG(0), 20, BuyerDistribution(1, 10))
+        total_payouts = sum(session['tier_payouts'].values())
+        self.assertGreater(session['revenue'], 0)
+        self.assertAlmostEqual(session['revenue'] - total_payouts, session['house_balance'])
+        self.assertAlmostEqual(100 + session['house_balance'], session['pot_size'])
+
+    def test_reproducible(self):
+        """Test the same seed gives the same report, with or without worker processes"""
+        buyers = BuyerDistribution(1, 10, 'uniform', 2)
+        report = simulate(6, 5, buyers, seed=1)
+        self.assertEqual(report, simulate(6, 5, buyers, seed=1))
+        self.assertEqual(report, simulate(6, 5, buyers, seed=1, processes=2))
+        self.assertNotEqual(report, simulate(6, 5, buyers, seed=2))
+
+    def test_configurable_payouts(self):
+        """Test ticket price and reward percentages are passed to the raffle"""
+        buyers = BuyerDistribution(5, 5, 'uniform', 1)
+        report = simulate(3, 1, buyers, ticket_price=10, reward_percentages={2: 0, 3: 0, 4: 0, 5: 0})
+        self.assertEqual(50, report['revenue']['mean'])
+        self.assertEqual(150, report['pot_size']['mean'])
+        self.assertEqual(0, report['tier_payouts'][2]['max'])
+
+    def test_buyer_distribution(self):
+        """Test sampled buyers and ticket counts stay within the configured ranges"""
+        rng = random.Random(0)
+        buyers = BuyerDistribution(2, 4, 'geometric', 3)
+        for _ in range(100):
+            counts = buyers.sample(rng)
+            self.assertTrue(2 <= len(counts) <= 4)
+            self.assertTrue(all(count >= 1 for count in counts))
+        with self.assertRaises(ValueError):
+            BuyerDistribution(tickets='poisson')
+        with self.assertRaises(ValueError):
+            BuyerDistribution(5, 4)
+
+    def test_parse_reward_percentages(self):
+        self.assertEqual({2: 0.1, 5: 0.9}, parse_reward_percentages(['2=0.1', '5=0.9']))
+        with self.assertRaises(ValueError):
+            parse_reward_percentages(['2:0.1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
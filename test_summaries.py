@@ -0,0 +1,68 @@
+import unittest
+import os
+import sqlite3
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sql')
+
+
+def read_sql(filename):
+    with open(os.path.join(SQL_DIR, filename), encoding='utf-8') as f:
+        return f.read()
+
+
+class TestSummaries(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        self.conn.executescript(read_sql('books.sql'))
+        # Borrows without a user or a book before the summaries are filled
+        self.insert([(None, 1), (2, None), (None, None)])
+        self.conn.executescript(read_sql('summaries.sql'))
+
+    def insert(self, borrows):
+        self.conn.executemany(
+            "insert into borrowed_books (user_id, book_id, borrow_date) values (?, ?, datetime('now'))", borrows,
+        )
+
+    def assert_summaries(self):
+        """Assert the summaries match counting borrowed_books with GROUP BY"""
+        for summary, query in (
+            ('select book_id, nr_times_borrowed from book_borrow_counts',
+             'select book_id, count(*) from borrowed_books where book_id is not null group by book_id'),
+            ('select user_id, book_id, nr_times_borrowed from user_book_counts',
+             'select user_id, book_id, count(*) from borrowed_books '
+             'where user_id is not null and book_id is not null group by user_id, book_id'),
+            ('select user_id, book_count from user_distinct_books',
+             'select user_id, count(distinct book_id) from borrowed_books '
+             'where user_id is not null and book_id is not null group by user_id'),
+        ):
+            self.assertEqual(sorted(self.conn.execute(query)), sorted(self.conn.execute(summary)), summary)
+
+    def test_backfill(self):
+        """Test the summaries count the borrows already there, leaving out NULL ids"""
+        self.assert_summaries()
+        self.assertEqual(0, self.conn.execute('select count(*) from book_borrow_counts where book_id is null').fetchone()[0])
+
+    def test_insert_delete_update(self):
+        """Test the triggers keep the summaries up to date, including borrows with NULL ids"""
+        self.insert([(1, 2), (1, 2), (None, 3), (4, None), (None, None), (5, 99)])
+        self.assert_summaries()
+        self.conn.execute('delete from borrowed_books where user_id is null or book_id is null or book_id = 2')
+        self.assert_summaries()
+        self.insert([(1, 3), (2, None), (None, 4)])
+        for query in (
+            'update borrowed_books set user_id = null where user_id = 1',
+            'update borrowed_books set book_id = 5 where book_id is null',
+            'update borrowed_books set user_id = 3 where user_id is null',
+            'update borrowed_books set book_id = null where book_id = 1',
+            'update borrowed_books set user_id = 2, book_id = 7 where user_id = 3',
+        ):
+            self.conn.execute(query)
+            self.assert_summaries()
+        self.conn.execute('delete from borrowed_books')
+        self.assert_summaries()
+        self.assertEqual(0, self.conn.execute('select count(*) from user_distinct_books').fetchone()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import unittest
+import sys
+import threading
+
+from raffle import (
+    Raffle, RaffleRNG, State, NullSink, TicketAllocator, ALL_TICKETS, INITIAL_POT_SIZE, TICKET_PRICE, encode_ticket,
+)
+from threaded import ThreadSafeRaffle, StripedPool, merge_stores
+
+
+def run_threads(target, num_threads):
+    """Run target(i) in num_threads threads that start at the same time, switching as often as possible"""
+    barrier = threading.Barrier(num_threads)
+    errors = []
+
+    def run(i):
+        barrier.wait()
+        try:
+            target(i)
+        except Exception as err:
+            errors.append(err)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    return errors
+
+
+class TestThreadSafeRaffle(unittest.TestCase):
+    def new_raffle(self, **kwargs):
+        return ThreadSafeRaffle(state=State.ONGOING, sink=NullSink(), exact_payouts=True, **kwargs)
+
+    def test_no_oversell(self):
+        """Test racing purchases sell every ticket exactly once and the pot matches the tickets sold"""
+        raffle = self.new_raffle(num_stripes=4)
+
+        def buy(i):
+            for j in range(10_000):
+                if len(raffle.purchase(f'user{i}-{j}', 7)) < 7:
+                    return
+
+        self.assertEqual([], run_threads(buy, 8))
+        store = raffle.tickets
+        self.assertEqual(sorted(ALL_TICKETS), sorted(store.masks))
+        self.assertEqual(0, len(raffle.available_tickets))
+        self.assertEqual(INITIAL_POT_SIZE + len(ALL_TICKETS) * TICKET_PRICE, raffle.pot_size)
+        self.assertEqual(len(store.names), len(set(store.names)))
+
+    def test_same_name(self):
+        """Test only one of many racing purchases for the same name goes through"""
+        raffle = self.new_raffle(num_stripes=4)
+        errors = run_threads(lambda i: raffle.buy_tickets('foo', 3), 8)
+        self.assertEqual(7, len(errors))
+        self.assertTrue(all(isinstance(err, ValueError) for err in errors))
+        self.assertEqual(3, len(raffle.name2tickets['foo']))
+        self.assertEqual(INITIAL_POT_SIZE + 3 * TICKET_PRICE, raffle.pot_size)
+
+    def test_snapshot_is_atomic(self):
+        """Test every snapshot taken during purchases has a pot matching its tickets"""
+        raffle = self.new_raffle(num_stripes=8)
+        done = threading.Event()
+        snapshots = []
+
+        def run(i):
+            if i == 0:
+                while not snapshots or not done.is_set():
+                    snapshots.append(raffle.snapshot())
+                return
+            for j in range(200):
+                raffle.purchase(f'user{i}-{j}', 2)
+            if i == 1:
+                done.set()
+
+        self.assertEqual([], run_threads(run, 5))
+        self.assertTrue(snapshots)
+        for store, pot_size in snapshots:
+            self.assertEqual(INITIAL_POT_SIZE + len(store) * TICKET_PRICE, pot_size)
+
+    def test_settle_matches_raffle(self):
+        """Test settling after concurrent purchases pays out like a Raffle with the same tickets"""
+        raffle = self.new_raffle(num_stripes=4, rng=0)
+        self.assertEqual([], run_threads(lambda i: [raffle.purchase(f'user{i}-{j}', 5) for j in range(50)], 4))
+        store, pot_size = raffle.snapshot()
+        serial = Raffle(state=State.ONGOING, name2tickets=store, pot_size=pot_size, sink=NullSink(), exact_payouts=True)
+        winning_ticket = {3, 7, 8, 11, 12}
+        self.assertEqual(serial.settle(winning_ticket), raffle.settle(winning_ticket))
+        self.assertEqual(serial.pot_size, raffle.pot_size)
+
+    def test_draw_ends_during_purchase(self):
+        """Test a purchase that borrows from other stripes fails if a new draw starts meanwhile"""
+        raffle = self.new_raffle(num_stripes=2)
+        index = raffle.get_stripe('foo')
+        allocate = raffle.pool.allocate
+
+        def start_draw_first(num_tickets, start):
+            raffle.start_draw()
+            return allocate(num_tickets, start)
+
+        raffle.pool.allocate = start_draw_first
+        with self.assertRaises(RuntimeError):
+            raffle.purchase('foo', len(raffle.pool.stripes[index]) + 1)
+        self.assertEqual({'state': 'ONGOING', 'pot_size': INITIAL_POT_SIZE, 'num_tickets_sold': 0,
+                          'num_tickets_available': len(ALL_TICKETS)}, raffle.get_status())
+        self.assertEqual(5, len(raffle.purchase('foo', 5)))
+
+    def test_batch_commands(self):
+        """Test a ThreadSafeRaffle goes through the batch commands like a Raffle"""
+        raffle = ThreadSafeRaffle(sink=NullSink(), pot_size=0)
+        raffle.handle_command({'op': 'new_draw'})
+        result = raffle.handle_command({'op': 'buy', 'name': 'foo', 'num_tickets': 3})
+        self.assertEqual([sorted(ticket) for ticket in raffle.name2tickets['foo']], result['tickets'])
+        self.assertEqual(3 * TICKET_PRICE, result['pot_size'])
+        raffle.get_winning_ticket = lambda: set(result['tickets'][0])
+        result = raffle.handle_command({'op': 'run'})
+        self.assertEqual('foo', result['results'][5][0]['name'])
+        self.assertEqual(State.NOT_STARTED, raffle.state)
+
+    def test_run_during_buy(self):
+        """Test a run settling between a buy's purchase and its result leaves the draw settled"""
+        raffle = self.new_raffle(rng=0)
+        purchase = raffle.purchase
+
+        def purchase_then_run(name, num_tickets):
+            tickets = purchase(name, num_tickets)
+            raffle.handle_command({'op': 'run'})
+            return tickets
+
+        raffle.purchase = purchase_then_run
+        raffle.handle_command({'op': 'buy', 'name': 'foo', 'num_tickets': 3})
+        self.assertEqual(State.NOT_STARTED, raffle.state)
+        with self.assertRaises(ValueError):
+            raffle.handle_command({'op': 'run'})
+
+    def test_buys_racing_run(self):
+        """Test no tickets are sold into a draw once a racing run has settled it"""
+        raffle = self.new_raffle(num_stripes=4, rng=0)
+        settle = raffle.settle
+        num_settled = []
+
+        def count_settled(winning_ticket):
+            num_settled.append(len(raffle.tickets))
+            return settle(winning_ticket)
+
+        raffle.settle = count_settled
+
+        def run(i):
+            if i == 0:
+                raffle.handle_command({'op': 'run'})
+                return
+            for j in range(500):
+                raffle.handle_command({'op': 'buy', 'name': f'user{i}-{j}', 'num_tickets': 2})
+
+        errors = run_threads(run, 5)
+        self.assertTrue(all(isinstance(err, ValueError) for err in errors))
+        self.assertEqual([len(raffle.tickets)], num_settled)
+        self.assertEqual(State.NOT_STARTED, raffle.state)
+        with self.assertRaises(ValueError):
+            raffle.purchase('bar', 1)
+
+
+class TestStripedPool(unittest.TestCase):
+    def test_stripes_partition_pool(self):
+        """Test the stripes of a partly sold pool hold exactly its available tickets"""
+        allocator = TicketAllocator()
+        sold = list(allocator.allocate(1000))
+        pool = StripedPool(allocator, [threading.RLock() for _ in range(3)], RaffleRNG(0).spawn(3))
+        self.assertEqual(len(allocator), len(pool))
+        self.assertEqual(sorted(allocator), sorted(pool))
+        self.assertNotIn(sold[0], pool)
+        ticket = next(iter(allocator))
+        self.assertIn(ticket, pool)
+        pool.remove([ticket, sold[0]])
+        self.assertNotIn(ticket, pool)
+        self.assertEqual(len(allocator) - 1, len(pool))
+        self.assertEqual(len(pool), len(set(pool.allocate(5000))))
+        with self.assertRaises(RuntimeError):
+            pool.draw()
+
+    def test_merge_stores(self):
+        """Test merging stores keeps every owner's tickets and the index"""
+        # Imported tickets, even none, keep an index in every stripe
+        raffle = ThreadSafeRaffle(num_stripes=3, state=State.ONGOING, name2tickets={}, sink=NullSink())
+        for i in range(30):
+            raffle.purchase(f'user{i}', i % 4)
+        merged = merge_stores(raffle.stores, raffle.game)
+        self.assertTrue(merged.indexed)
+        self.assertEqual(
+            {name: sorted(raffle.stores[raffle.get_stripe(name)].get_masks(name)) for name in merged.names},
+            {name: sorted(merged.get_masks(name)) for name in merged.names},
+        )
+        winning_mask = encode_ticket({3, 7, 8, 11, 12})
+        self.assertEqual(
+            Raffle(name2tickets=merged).count_winners(merged, winning_mask, 2),
+            merged.count_winners(winning_mask, 2),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
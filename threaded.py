@@ -0,0 +1,312 @@
+"""Thread-safe Raffle for purchases from many threads
+
+The state of a draw is split into stripes, each with its own lock: a slice
+of the available tickets, the tickets sold to the owners whose names hash
+to the stripe, and the number of tickets it sold. A purchase only takes the
+lock of its owner's stripe, so purchases for different owners mostly run
+without waiting for each other. Settling a draw and starting a new one take
+every lock, in stripe order, and therefore see an atomic snapshot.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from array import array
+import contextlib
+import itertools
+import os
+import threading
+import zlib
+
+from raffle import (
+    COMMAND_OPTIONS, Game, Raffle, RaffleRNG, TicketAllocator, TicketStore, decode_ticket, from_cents,
+    parse_buy_command, to_cents,
+)
+
+
+def get_stripe_allocator(allocator: TicketAllocator, index: int, num_stripes: int, rng: RaffleRNG) -> TicketAllocator:
+    """Get a pool of the tickets at positions index, index + num_stripes, ... of allocator
+
+    The stripe ranks its tickets by their position in allocator, which is
+    only read, so the stripes of an allocator can be used concurrently.
+    """
+    rank2pos = allocator.rank2pos
+    pos2rank = allocator.pos2rank
+    base_rank = allocator.rank
+    base_unrank = allocator.unrank
+    size = allocator.size
+
+    def rank(mask: int) -> Optional[int]:
+        ticket_rank = base_rank(mask)
+        if ticket_rank is None:
+            return None
+        pos = rank2pos.get(ticket_rank, ticket_rank)
+        return pos // num_stripes if pos < size and pos % num_stripes == index else None
+
+    def unrank(stripe_rank: int) -> int:
+        pos = stripe_rank * num_stripes + index
+        return base_unrank(pos2rank.get(pos, pos))
+
+    stripe = TicketAllocator(rng=rng, game=allocator.game)
+    stripe.rank = rank
+    stripe.unrank = unrank
+    stripe.size = len(range(index, size, num_stripes))
+    return stripe
+
+
+class StripedPool:
+    """Available tickets split into stripes that are allocated from under their own lock
+
+    Has the interface of a TicketAllocator. draw() and allocate() start at
+    the stripe of the calling thread and move on to the next stripes once
+    it runs out. The tickets of a stripe are spread evenly over the
+    combinations, and a purchase gets uniformly random tickets of its stripe.
+    """
+    def __init__(self, allocator: TicketAllocator, locks: List[threading.RLock], rngs: List[RaffleRNG]) -> None:
+        self.game = allocator.game
+        self.locks = locks
+        self.stripes = [
+            get_stripe_allocator(allocator, index, len(locks), rng)
+            for index, rng in enumerate(rngs)
+        ]
+        self.thread_stripes = itertools.count()
+        self.local = threading.local()
+
+    def __len__(self) -> int:
+        return sum(stripe.size for stripe in self.stripes)
+
+    def __iter__(self) -> Iterator[int]:
+        return itertools.chain.from_iterable(self.stripes)
+
+    def __contains__(self, mask: object) -> bool:
+        return any(mask in stripe for stripe in self.stripes)
+
+    def get_thread_stripe(self) -> int:
+        """Index of the stripe of the calling thread, given out round-robin"""
+        index = getattr(self.local, 'stripe', None)
+        if index is None:
+            index = self.local.stripe = next(self.thread_stripes) % len(self.stripes)
+        return index
+
+    def remove(self, tickets: Iterable[int]) -> None:
+        tickets = list(tickets)
+        for lock, stripe in zip(self.locks, self.stripes):
+            with lock:
+                stripe.remove(tickets)
+
+    def draw(self) -> int:
+        start = self.get_thread_stripe()
+        for index in itertools.chain(range(start, len(self.stripes)), range(start)):
+            with self.locks[index]:
+                if self.stripes[index].size:
+                    return self.stripes[index].draw()
+        raise RuntimeError("No more available tickets!")
+
+    def allocate(self, num_tickets: int, start: Optional[int] = None) -> Union[array, List[int]]:
+        """Take up to num_tickets tickets, starting at stripe start (default: the calling thread's)"""
+        if start is None:
+            start = self.get_thread_stripe()
+        tickets = self.game.new_masks()
+        for index in itertools.chain(range(start, len(self.stripes)), range(start)):
+            if len(tickets) == num_tickets:
+                break
+            with self.locks[index]:
+                tickets.extend(self.stripes[index].allocate(num_tickets - len(tickets)))
+        return tickets
+
+
+def merge_stores(stores: List[TicketStore], game: Game) -> TicketStore:
+    """Concatenate stores with distinct owners into one, owner ids following the order of the stores"""
+    merged = game.new_ticket_store(bool(stores) and all(store.indexed for store in stores))
+    for store in stores:
+        if not store.names:
+            continue
+        offset = len(merged.names)
+        start = len(merged.masks)
+        merged.masks.extend(store.masks)
+        merged.owners.extend(map(offset.__add__, store.owners))
+        merged.names.extend(store.names)
+        merged.name2id.update((name, owner_id + offset) for name, owner_id in store.name2id.items())
+        merged.spans.extend([(begin + start, end + start) for begin, end in spans] for spans in store.spans)
+        if merged.indexed:
+            merged.ticket_counts.update(store.ticket_counts)
+            for mask, owner2count in store.ticket_owners.items():
+                merged_owner2count = merged.ticket_owners.setdefault(mask, dict())
+                for owner_id, count in owner2count.items():
+                    merged_owner2count[owner_id + offset] = count
+    return merged
+
+
+class ThreadSafeRaffle(Raffle):
+    """Raffle whose purchases can be made from many threads at once
+
+    No ticket is sold twice and no owner buys twice, even when their
+    purchases race, and the pot always equals its value at the start of the
+    draw plus the price of the tickets sold. A purchase takes the lock of
+    the stripe its owner's name hashes to; only when that stripe runs out of
+    tickets does it take the others', one at a time. settle(), start_draw(),
+    snapshot() and get_status() hold every lock and see all purchases either
+    completed or not started. A purchase fails unless the draw is ongoing,
+    and one still borrowing tickets when the draw is settled or a new one
+    starts fails too.
+
+    The tickets property merges the stripes into a single TicketStore, so
+    owners are listed stripe by stripe rather than in the order they bought.
+    The sink must be thread-safe, and metrics counters are not synchronized.
+    """
+    def __init__(self, num_stripes: Optional[int] = None, **kwargs) -> None:
+        num_stripes = 4 * (os.cpu_count() or 1) if num_stripes is None else num_stripes
+        if num_stripes < 1:
+            raise ValueError(f"Invalid number of stripes: {num_stripes}")
+        self.locks = [threading.RLock() for _ in range(num_stripes)]
+        self.pending: List[Set[str]] = [set() for _ in range(num_stripes)]
+        self.num_sold = [0] * num_stripes
+        # Incremented when a draw is settled or a new one starts, see purchase()
+        self.generation = 0
+        super().__init__(**kwargs)
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the locks of all stripes"""
+        with contextlib.ExitStack() as stack:
+            for lock in self.locks:
+                stack.enter_context(lock)
+            yield
+
+    def get_stripe(self, name: str) -> int:
+        return zlib.crc32(name.encode()) % len(self.locks)
+
+    @property
+    def pot_size(self) -> float:
+        num_sold = sum(self.num_sold)
+        if self.exact_payouts:
+            return from_cents(to_cents(self._pot_size) + num_sold * to_cents(self.ticket_price))
+        return self._pot_size + num_sold * self.ticket_price
+
+    @pot_size.setter
+    def pot_size(self, pot_size: float) -> None:
+        with self.locked():
+            self._pot_size = pot_size
+            self.num_sold[:] = [0] * len(self.num_sold)
+
+    @property
+    def tickets(self) -> TicketStore:
+        with self.locked():
+            return merge_stores(self.stores, self.game)
+
+    @tickets.setter
+    def tickets(self, store: TicketStore) -> None:
+        stores = [self.game.new_ticket_store(store.indexed) for _ in self.locks]
+        for name in store.names:
+            stores[self.get_stripe(name)].add(name, store.get_masks(name))
+        with self.locked():
+            self.stores = stores
+
+    @property
+    def available_tickets(self) -> StripedPool:
+        return self.pool
+
+    @available_tickets.setter
+    def available_tickets(self, allocator: Union[TicketAllocator, StripedPool]) -> None:
+        if not isinstance(allocator, StripedPool):
+            allocator = StripedPool(allocator, self.locks, self.rng.spawn(len(self.locks)))
+        with self.locked():
+            self.pool = allocator
+
+    def snapshot(self) -> Tuple[TicketStore, float]:
+        """Get the sold tickets and the pot size at the same point in time"""
+        with self.locked():
+            return self.tickets, self.pot_size
+
+    def record(self, index: int, name: str, tickets: Iterable[int]) -> None:
+        """Record tickets as sold to name in stripe index, whose lock the caller holds"""
+        store = self.stores[index]
+        start = len(store)
+        store.add(name, tickets)
+        self.num_sold[index] += len(store) - start
+
+    def purchase(self, name: str, num_tickets: int) -> array:
+        index = self.get_stripe(name)
+        lock = self.locks[index]
+        with lock:
+            self.get_new_state(COMMAND_OPTIONS['buy'])
+            if name in self.stores[index] or name in self.pending[index]:
+                raise ValueError(f"Invalid input: {name} has purchased tickets already")
+            tickets = self.pool.stripes[index].allocate(num_tickets)
+            if len(tickets) == num_tickets or len(self.locks) == 1:
+                self.record(index, name, tickets)
+                self.count_allocated(len(tickets))
+                return tickets
+            # The stripe ran out: reserve the name and take the rest from the
+            # other stripes without holding this lock, so that stripe locks
+            # are never held two at a time
+            self.pending[index].add(name)
+            generation = self.generation
+        rest = None
+        try:
+            rest = self.pool.allocate(num_tickets - len(tickets), (index + 1) % len(self.locks))
+        finally:
+            with lock:
+                self.pending[index].discard(name)
+                ended = self.generation != generation
+                if rest is not None and not ended:
+                    tickets.extend(rest)
+                    self.record(index, name, tickets)
+        if ended:
+            raise RuntimeError(f"The draw ended during the purchase of {name}")
+        self.count_allocated(len(tickets))
+        return tickets
+
+    def count_allocated(self, num_tickets: int) -> None:
+        if self._metrics is not None:
+            self._metrics.inc('tickets_allocated', num_tickets)
+
+    def allocate_tickets(self, name: str, num_tickets: int) -> array:
+        index = self.get_stripe(name)
+        with self.locks[index]:
+            if name in self.stores[index]:
+                raise ValueError(f"Invalid input: {name} has purchased tickets already")
+        tickets = self.pool.allocate(num_tickets, index)
+        self.count_allocated(len(tickets))
+        return tickets
+
+    def assign_tickets(self, name: str, tickets: Iterable[int]):
+        index = self.get_stripe(name)
+        with self.locks[index]:
+            self.record(index, name, tickets)
+
+    def settle(self, winning_ticket: Set) -> Dict[int, List[Dict]]:
+        with self.locked():
+            self.generation += 1
+            return super().settle(winning_ticket)
+
+    def start_draw(self):
+        with self.locked():
+            self.generation += 1
+            super().start_draw()
+
+    def get_status(self) -> Dict:
+        with self.locked():
+            return {
+                'state': self.state.name,
+                'pot_size': self.pot_size,
+                'num_tickets_sold': sum(map(len, self.stores)),
+                'num_tickets_available': len(self.pool),
+            }
+
+    def handle_command(self, command: Dict) -> Dict:
+        """Handle a batch command like Raffle.handle_command, with its state transition atomic
+
+        Every op but 'buy' holds every lock from the state check to the new
+        state. A buy leaves the state ONGOING and purchase() checks it under
+        the stripe lock, so a buy does not write the state back, which could
+        undo a run settled meanwhile.
+        """
+        if not isinstance(command, dict) or command.get('op') != 'buy':
+            with self.locked():
+                return super().handle_command(command)
+        name, num_tickets = parse_buy_command(command)
+        tickets = self.purchase(name, num_tickets)
+        return {
+            'op': 'buy',
+            'name': name,
+            'tickets': [sorted(decode_ticket(ticket)) for ticket in tickets],
+            'pot_size': self.pot_size,
+        }